@@ -0,0 +1,12 @@
+'''Record ids and result statuses shared by the batch CLI and the runner'''
+import hashlib
+import json
+
+# Results that count as done when resuming. Failed records are retried
+DONE_STATUSES = ("completed", "existing")
+
+# The record's "id", or a hash of its content when it has none
+def record_id(record):
+  if record.get("id") is not None:
+    return str(record["id"])
+  return hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()[:16]
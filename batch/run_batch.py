@@ -0,0 +1,125 @@
+'''Offline batch runner for backfills and catalog imports.
+
+Pushes a JSONL file of recipes through PreProcessingFlow and ComicGenFlow in this process, --concurrency records
+at a time, without going through the orchestrator or the RQ queues. Every record still gets its workloads row, so
+its comic shows up like any other. All flows share the process' OpenAI, Supabase and Reddit clients, and their
+image calls share the fleet-wide Redis rate limiter (see shared/rate_limiter.py) instead of each pacing its own
+batches, so the batch stays within the image API budget at any concurrency.
+
+Input records, one JSON object per line:
+  {"id": "...", "input_text": "free-form recipe text"}                     validated and extracted like POST /workloads
+  {"id": "...", "recipe_data": {"name": ..., "ingredients": [...], "instructions": [...]}}
+  {"id": "...", "name": ..., "ingredients": [...], "instructions": [...]}  structured RecipeData, no extraction
+"id" is optional (the record's content hash is used instead), "quality_tier" may override --quality-tier.
+
+Every finished record is appended to --output as soon as it finishes. A rerun with the same --output skips the
+records that already completed there and retries the failed ones on the workloads rows they already have, so an
+interrupted batch can simply be started again. Failed records are marked FAILED_ERROR (or FAILED_TIMEOUT,
+FAILED_OVERLIMIT) and their result line carries the workload id. At the end it reports items per hour and the
+latency percentiles of every stage.
+
+Usage (from the repo root, with the comicgen worker requirements installed and the workers' environment set):
+  python -m batch.run_batch --input recipes.jsonl --output results.jsonl --concurrency 4
+  python -m batch.run_batch --input recipes.jsonl --output results.jsonl --on-similar new --report report.json
+'''
+import argparse
+import json
+import os
+import time
+
+from devtools.common import FONTS_DIR, add_worker_paths, write_json
+from batch.records import DONE_STATUSES, record_id
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--input", required=True, help="JSONL file of recipes")
+  parser.add_argument("--output", required=True, help="JSONL file results are appended to, also read to resume")
+  parser.add_argument("--concurrency", type=int, default=4, help="Records run at once")
+  parser.add_argument("--quality-tier", default=None, help="Image quality tier for records without their own (default DEFAULT_QUALITY_TIER)")
+  parser.add_argument("--deadline-seconds", type=float, default=0, help="Per-record deadline (0 = WORKLOAD_DEADLINE_SECONDS)")
+  parser.add_argument("--on-similar", default="existing", choices=["existing", "new"],
+                      help="For raw recipes similar to an existing comic: attach that comic (existing) or generate anyway (new)")
+  parser.add_argument("--limit", type=int, default=0, help="Stop after this many records (0 = all)")
+  parser.add_argument("--report", help="Also write the final report to this JSON file")
+  return parser.parse_args(argv)
+
+# Returns the ids of the records an earlier run already finished, and the workloads (public ids) earlier runs
+# created for the records that failed, which a retry reuses
+def previous_results(output_path):
+  done = set()
+  workloads = {}
+  if not os.path.exists(output_path):
+    return done, workloads
+  with open(output_path) as f:
+    for line in f:
+      line = line.strip()
+      if not line:
+        continue
+      try:
+        result = json.loads(line)
+      except json.JSONDecodeError:
+        # A line cut short by an interrupted run
+        continue
+      if result.get("status") in DONE_STATUSES:
+        done.add(result["id"])
+      elif result.get("workload_id"):
+        workloads[result["id"]] = result["workload_id"]
+  return done, workloads
+
+# Yields every record still to run, reading the input lazily so large files are never held in memory
+def pending_records(input_path, done, limit):
+  yielded = 0
+  with open(input_path) as f:
+    for line in f:
+      line = line.strip()
+      if not line:
+        continue
+      record = json.loads(line)
+      if record_id(record) in done:
+        continue
+      yield record
+      yielded += 1
+      if limit and yielded >= limit:
+        return
+
+def _fmt(value):
+  return "-" if value is None else f"{value:.2f}"
+
+def print_report(report):
+  print(f"\n{report['records']} records in {report['wall_seconds']:.1f}s: {report['outcomes']}, "
+        f"{report['skipped_already_done']} already done")
+  print(f"{report['items_per_hour']:.1f} items/hour")
+  print("\nstage                          n      p50(s)  p95(s)  p99(s)  max(s)")
+  for name, stats in [("comic (generated)", report["item_latency"])] + list(report["stages"].items()):
+    print(f"{name:<30} {stats['count']:<6} {_fmt(stats['p50']):>6}  {_fmt(stats['p95']):>6}  {_fmt(stats['p99']):>6}  {_fmt(stats['max']):>6}")
+
+def main(argv=None):
+  args = parse_args(argv)
+  # Outside the worker containers the fonts are in the repo
+  os.environ.setdefault("FONTS_DIR", FONTS_DIR)
+  os.environ.setdefault("METRICS_SERVICE", "batch")
+  os.environ.setdefault("METRICS_SPAN_LOG", "0")
+
+  done, previous_workloads = previous_results(args.output)
+  # Imported only now: the shared modules read their configuration from the environment at import time
+  add_worker_paths()
+  from batch.runner import BatchRunner
+  runner = BatchRunner(args, previous_workloads)
+  skipped = 0
+  if done:
+    with open(args.input) as f:
+      skipped = sum(1 for line in f if line.strip() and record_id(json.loads(line)) in done)
+    print(f"[Batch] Resuming, {skipped} records already done in {args.output}")
+
+  started = time.perf_counter()
+  try:
+    with open(args.output, "a") as output:
+      runner.run(pending_records(args.input, done, args.limit), output)
+  finally:
+    report = runner.report(time.perf_counter() - started, skipped)
+    print_report(report)
+    if args.report:
+      write_json(args.report, report)
+
+if __name__ == "__main__":
+  main()
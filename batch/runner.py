@@ -0,0 +1,170 @@
+'''Runs batch records through PreProcessingFlow and ComicGenFlow (see batch/run_batch.py).
+
+Imported by run_batch once the environment is configured and the worker directories are on sys.path.
+'''
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from ComicGenFlow import ComicGenFlow
+from PreProcessingFlow import PreProcessingFlow
+from shared.supabase_client import supabase
+from shared.helpers import workload_status_update,workload_failed
+from shared.workload_cache import refresh_workload_cache
+from shared.workload_options import save_workload_options
+from shared.pydantic_models import RecipeData
+from shared.panel_planner import plan_panels
+from shared.metrics import add_span_listener, workload_context, external_call
+from shared.deadline import deadline_context, DeadlineExceeded
+from shared.constants import WORKLOAD_STATUSES, DEFAULT_QUALITY_TIER, QUALITY_TIERS, WORKLOAD_DEADLINE_SECONDS
+from devtools.common import summarize
+from batch.records import record_id
+
+class BatchRunner:
+  # previous_workloads maps record ids to the workload (public id) an earlier run created for them and failed
+  def __init__(self, args, previous_workloads=None):
+    self.args = args
+    self.previous_workloads = previous_workloads or {}
+    self.default_quality_tier = args.quality_tier or DEFAULT_QUALITY_TIER
+    self.deadline_seconds = args.deadline_seconds or WORKLOAD_DEADLINE_SECONDS
+
+    self.lock = threading.Lock()
+    self.stage_seconds = defaultdict(list)
+    self.item_seconds = []
+    self.outcomes = defaultdict(int)
+    add_span_listener(self.on_span)
+
+  def on_span(self, kind, name, workload_id, seconds, ok):
+    if kind == "stage" and ok:
+      with self.lock:
+        self.stage_seconds[name].append(seconds)
+
+  # Reuses the workload an earlier run created for the record, so retries do not add a row each
+  def create_workload(self, record_key, row, options):
+    row = {**row, "status": WORKLOAD_STATUSES['starting_workload']}
+    db_response = None
+    public_id = self.previous_workloads.get(record_key)
+    if public_id:
+      with external_call("supabase_status_write"):
+        db_response = supabase.table("workloads").update(row).eq("public_id", public_id).execute()
+    if not db_response or not db_response.data:
+      with external_call("supabase_insert_workload"):
+        db_response = supabase.table("workloads").insert(row).execute()
+    refresh_workload_cache(db_response.data)
+    workload = db_response.data[0]
+    save_workload_options(workload["id"], options)
+    return workload
+
+  # Runs one record. Never raises, every failure becomes a "failed" result line
+  def run_record(self, record):
+    result = {"id": record_id(record)}
+    try:
+      return {**result, **self.run_flows(record)}
+    except Exception as e:
+      return {**result, "status": "failed", "error": str(e)}
+
+  def run_flows(self, record):
+    started = time.perf_counter()
+    record_key = record_id(record)
+    quality_tier = record.get("quality_tier", self.default_quality_tier)
+    if quality_tier not in QUALITY_TIERS:
+      return {"status": "failed", "error": f"Invalid quality_tier {quality_tier}"}
+    options = {"quality_tier": quality_tier, "deadline_at": time.time() + self.deadline_seconds}
+
+    input_text = record.get("input_text")
+    recipe_data = None
+    if input_text is None:
+      recipe_data = RecipeData(**record.get("recipe_data", record))
+      workload = self.create_workload(record_key, {
+        "prompt": json.dumps(recipe_data.model_dump()),
+        "recipe_name": recipe_data.name,
+        "ingredients": [{"name": ing.name, "quantity": ing.quantity} for ing in recipe_data.ingredients],
+        "instructions": recipe_data.instructions,
+      }, options)
+    else:
+      workload = self.create_workload(record_key, {"prompt": input_text}, options)
+    workload_id = workload["id"]
+    result = {"workload_id": workload["public_id"]}
+
+    try:
+      with workload_context(workload_id), deadline_context(workload_id):
+        if recipe_data is None:
+          pre_process_flow = PreProcessingFlow(task_input=input_text, workload_id=workload_id, continue_flow=False)
+          pre_process_flow.kickoff()
+          recipe_data = pre_process_flow.state['recipe_data']
+          similar_comics = pre_process_flow.state['similar_comics']
+          if similar_comics and self.args.on_similar == "existing":
+            # Same as choosing EXISTING in PUT /workloads/<public_id>/user-decision, with the highest-scoring match
+            comic_id = similar_comics[0]["comic_id"]
+            db_response = supabase.table("workloads").update({
+              "status": WORKLOAD_STATUSES['completed_w_existing'],
+              "comic_id": comic_id,
+            }).eq("id", workload_id).execute()
+            refresh_workload_cache(db_response.data)
+            return {**result, "status": "existing", "comic_id": comic_id, "seconds": round(time.perf_counter() - started, 3)}
+        elif plan_panels(recipe_data) is None:
+          workload_status_update(workload_id, WORKLOAD_STATUSES['failed_overlimit'])
+          return {**result, "status": "failed", "error": "The recipe exceeds the image generation limit"}
+
+        comic_gen_flow = ComicGenFlow(recipe_data=recipe_data.model_dump(), workload_id=workload_id, fleet_rate_limited=True)
+        try:
+          comic_gen_flow.kickoff()
+        finally:
+          comic_gen_flow.image_store.close()
+
+    except DeadlineExceeded as e:
+      workload_status_update(workload_id, WORKLOAD_STATUSES['failed_timeout'])
+      return {**result, "status": "failed", "error": f"Ran out of time: {e}"}
+    except Exception as e:
+      workload_failed(workload_id)
+      return {**result, "status": "failed", "error": str(e)}
+
+    seconds = time.perf_counter() - started
+    with self.lock:
+      self.item_seconds.append(seconds)
+    row = supabase.table("workloads").select("comic_id").eq("id", workload_id).execute().data[0]
+    return {
+      **result,
+      "status": "completed",
+      "comic_id": row["comic_id"],
+      "seconds": round(seconds, 3),
+      "generation_report": comic_gen_flow.state.get("generation_report"),
+    }
+
+  # Runs the records with at most --concurrency in flight, appending each result to output as it finishes
+  def run(self, records, output):
+    def finish(future):
+      result = future.result()
+      with self.lock:
+        self.outcomes[result["status"]] += 1
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+      print(f"[Batch] Record {result['id']}: {result['status']}" + (f" ({result['error']})" if result.get("error") else ""))
+
+    with ThreadPoolExecutor(max_workers=self.args.concurrency) as executor:
+      in_flight = set()
+      try:
+        for record in records:
+          if len(in_flight) >= self.args.concurrency:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+              finish(future)
+          in_flight.add(executor.submit(self.run_record, record))
+      finally:
+        # Also on Ctrl-C: records in flight are finished and written, the rest run next time
+        for future in wait(in_flight).done:
+          finish(future)
+
+  def report(self, wall_seconds, skipped):
+    finished = self.outcomes.get("completed", 0) + self.outcomes.get("existing", 0)
+    return {
+      "records": sum(self.outcomes.values()),
+      "outcomes": dict(self.outcomes),
+      "skipped_already_done": skipped,
+      "wall_seconds": round(wall_seconds, 3),
+      "items_per_hour": finished / wall_seconds * 3600 if wall_seconds else 0,
+      "item_latency": summarize(self.item_seconds),
+      "stages": {name: summarize(samples) for name, samples in sorted(self.stage_seconds.items())},
+    }
@@ -0,0 +1,32 @@
+'''Deterministic synthetic recipes of a given size for the benchmarks'''
+import random
+
+WORDS = [
+  "saffron", "basil", "walnut", "ginger", "lentil", "paprika", "shallot", "fennel", "quinoa", "mango",
+  "cumin", "leek", "pecan", "thyme", "barley", "apricot", "tamarind", "chive", "okra", "plum",
+  "sesame", "turnip", "oregano", "date", "millet", "radish", "clove", "pear", "kale", "sorghum",
+]
+UNITS = ["1 cup", "2 tbsp", "1 tsp", "200 g", "3 cloves", "1 pinch", "2 slices", "500 ml"]
+VERBS = ["Chop", "Stir", "Simmer", "Whisk", "Fold", "Roast", "Toast", "Blend", "Season", "Plate"]
+
+# Builds a recipe with `size` images worth of content (ingredients + instructions), split roughly in half
+def make_recipe(size, seed):
+  rng = random.Random(seed)
+  ingredient_count = max(1, size // 2)
+  instruction_count = max(1, size - ingredient_count)
+  name = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {rng.choice(['Stew', 'Salad', 'Curry', 'Bake', 'Soup'])} {seed}"
+  ingredients = [(f"{rng.choice(WORDS)} {rng.choice(WORDS)}", rng.choice(UNITS)) for _ in range(ingredient_count)]
+  instructions = [
+    f"{rng.choice(VERBS)} the {ingredients[idx % ingredient_count][0]} with the {rng.choice(WORDS)} until it is ready."
+    for idx in range(instruction_count)
+  ]
+  return name, ingredients, instructions
+
+# Free-form recipe text in the same shape users paste into POST /workloads
+def recipe_text(size, seed):
+  name, ingredients, instructions = make_recipe(size, seed)
+  lines = [f"Recipe: {name}", "", "Ingredients:"]
+  lines += [f"- {ing_name} – {quantity}" for ing_name, quantity in ingredients]
+  lines += ["", "Instructions:"]
+  lines += [f"{idx + 1}. {step}" for idx, step in enumerate(instructions)]
+  return "\n".join(lines)
@@ -0,0 +1,237 @@
+'''End-to-end offline benchmark for PreProcessingFlow + ComicGenFlow.
+
+Runs both flows in-process against a local OpenAI stub, a fake Supabase table API and a fake Reddit gallery,
+so throughput can be measured without spending money or touching real services. Every
+(recipe size, concurrency) combination runs in its own subprocess so peak RSS is measured per combination.
+
+Usage (from the repo root, with the comicgen worker requirements installed):
+  python -m benchmarks.e2e.run_e2e --recipe-sizes 6,12,19 --concurrency 1,4 --workloads 8 --output e2e.json
+
+With --execution-mode fanout the comicgen part runs as planner, per-image and fan-in jobs. The image jobs of
+all workloads share a pool of --fanout-workers threads standing in for the comicgen worker fleet.
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from devtools.common import REPO_ROOT, FONTS_DIR, add_worker_paths, summarize, peak_rss_mb, write_json
+from benchmarks.e2e.recipes import recipe_text
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--recipe-sizes", default="6,12,19", help="Comma separated image counts (ingredients + instructions)")
+  parser.add_argument("--concurrency", default="1,4", help="Comma separated numbers of workloads run at once")
+  parser.add_argument("--workloads", type=int, default=8, help="Workloads per combination")
+  parser.add_argument("--chat-latency", type=float, default=0.2, help="Seconds per stub chat completion")
+  parser.add_argument("--image-latency", type=float, default=2.0, help="Seconds per stub image generation")
+  parser.add_argument("--download-latency", type=float, default=0.1, help="Seconds per stub image download")
+  parser.add_argument("--chat-rpm", type=int, default=0, help="Stub chat requests per minute before 429s (0 = unlimited)")
+  parser.add_argument("--images-rpm", type=int, default=0, help="Stub image requests per minute before 429s (0 = unlimited)")
+  parser.add_argument("--db-latency", type=float, default=0.02, help="Seconds per fake Supabase call")
+  parser.add_argument("--reddit-latency", type=float, default=0.5, help="Seconds per fake Reddit gallery upload")
+  parser.add_argument("--quality-tier", default="standard", help="Image quality tier for every workload (standard, draft)")
+  parser.add_argument("--dalle-batch-wait", type=float, default=0.0, help="Overrides RL_DALEE_WAIT_TIME (seconds between image batches)")
+  parser.add_argument("--execution-mode", default="single", choices=["single", "fanout"], help="Comicgen execution mode (see COMICGEN_EXECUTION_MODE)")
+  parser.add_argument("--fanout-workers", type=int, default=8, help="Image job workers shared by all workloads in fanout mode")
+  parser.add_argument("--degradation", default="off", choices=["off", "auto", "always"], help="Adaptive degradation under backlog (see DEGRADATION_MODE)")
+  parser.add_argument("--deadline-seconds", type=float, default=0, help="Per-workload deadline (0 = none). Workloads that run out count as timed out")
+  parser.add_argument("--progressive", action="store_true", help="Publish pages as they are composed (PROGRESSIVE_PAGES=1) and report time to first page")
+  parser.add_argument("--output", help="Write the JSON report to this file")
+  # Internal: run one combination in this process and write its result to --result-file
+  parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+  parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+  parser.add_argument("--result-file", help=argparse.SUPPRESS)
+  return parser.parse_args(argv)
+
+def run_single(args):
+  from benchmarks.fakes.openai_stub import StubConfig, start_stub_server
+
+  stub = start_stub_server(StubConfig(
+    chat_latency=args.chat_latency,
+    image_latency=args.image_latency,
+    download_latency=args.download_latency,
+    chat_rpm=args.chat_rpm,
+    images_rpm=args.images_rpm,
+  ))
+
+  # Everything below reads its configuration from the environment at import time
+  os.environ.update({
+    "OPENAI_API_KEY": "sk-benchmark",
+    "OPENAI_BASE_URL": f"{stub.base_url}/v1",
+    "OPENAI_API_BASE": f"{stub.base_url}/v1",
+    "ORCHESTRATOR_URL": stub.base_url,
+    "FONTS_DIR": FONTS_DIR,
+    "METRICS_SERVICE": "benchmark",
+    "CREWAI_DISABLE_TELEMETRY": "true",
+    "OTEL_SDK_DISABLED": "true",
+    "PROGRESSIVE_PAGES": "1" if args.progressive else "0",
+    "DEGRADATION_MODE": args.degradation,
+  })
+
+  from benchmarks.fakes.supabase_fake import install_fake_supabase
+  from benchmarks.fakes.reddit_fake import install_fake_reddit
+  from benchmarks.fakes.redis_fake import install_fake_redis
+  fake_db = install_fake_supabase(latency=args.db_latency)
+  install_fake_redis()
+  gallery = install_fake_reddit(latency=args.reddit_latency)
+
+  add_worker_paths()
+  import ComicGenFlow as comicgen_module
+  import comicgen_worker
+  import shared.helpers as helpers_module
+  from PreProcessingFlow import PreProcessingFlow
+  from shared.metrics import add_span_listener, workload_context
+  from shared.workload_options import save_workload_options
+  from shared.deadline import deadline_context, DeadlineExceeded
+
+  comicgen_module.RL_DALEE_WAIT_TIME = args.dalle_batch_wait
+  helpers_module.RL_DALEE_WAIT_TIME = args.dalle_batch_wait
+  fanout_pool = ThreadPoolExecutor(max_workers=args.fanout_workers) if args.execution_mode == "fanout" else None
+
+  spans = defaultdict(list)
+  spans_lock = threading.Lock()
+  # Seconds from a workload's start until its first page could be shown: the first page store publish in
+  # progressive mode, the gallery upload otherwise
+  workload_started = {}
+  first_page_seconds = {}
+  def on_span(kind, name, workload_id, seconds, ok):
+    if ok and name in ("page_store_publish", "reddit_upload") and workload_id in workload_started:
+      with spans_lock:
+        first_page_seconds.setdefault(workload_id, time.perf_counter() - workload_started[workload_id])
+    if ok:
+      with spans_lock:
+        spans[f"{kind}:{name}"].append(seconds)
+  add_span_listener(on_span)
+
+  # Runs the same task functions RQ would, with the image jobs on the shared pool and the fan-in after all of them
+  def run_fanout(workload_id, recipe_data):
+    comicgen_worker.comicgen_plan_task(workload_id, recipe_data["name"], recipe_data["ingredients"], recipe_data["instructions"])
+    plan_flow = comicgen_module.ComicGenFlow.from_fanout_plan(workload_id, comicgen_worker.get_fanout_plan(workload_id))
+    image_futures = [fanout_pool.submit(comicgen_worker.comicgen_image_task, workload_id, name) for name in plan_flow.image_names()]
+    for future in image_futures:
+      future.result()
+    return comicgen_worker.comicgen_fan_in_task(workload_id)
+
+  def run_workload(index):
+    text = recipe_text(args.size, seed=index)
+    workload = fake_db.table("workloads").insert({"prompt": text, "status": "STARTING_WORKLOAD"}).execute().data[0]
+    options = {"quality_tier": args.quality_tier}
+    if args.deadline_seconds:
+      options["deadline_at"] = time.time() + args.deadline_seconds
+    save_workload_options(workload["id"], options)
+    started = time.perf_counter()
+    workload_started[workload["id"]] = started
+    with workload_context(workload["id"]), deadline_context(workload["id"]):
+      PreProcessingFlow(task_input=text, workload_id=workload["id"]).kickoff()
+      row = fake_db.table("workloads").select("*").eq("id", workload["id"]).execute().data[0]
+      recipe_data = {"name": row["recipe_name"], "ingredients": row["ingredients"], "instructions": row["instructions"]}
+      if fanout_pool is None:
+        comic_gen_flow = comicgen_module.ComicGenFlow(recipe_data=recipe_data, workload_id=workload["id"])
+        comic_gen_flow.kickoff()
+        generation_report = comic_gen_flow.state.get("generation_report") or {}
+      else:
+        generation_report = run_fanout(workload["id"], recipe_data)
+    with spans_lock:
+      generation_reports.append(generation_report)
+    return time.perf_counter() - started
+
+  workload_seconds = []
+  generation_reports = []
+  failures = []
+  timed_out = []
+  started = time.perf_counter()
+  with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+    futures = [executor.submit(run_workload, index) for index in range(args.workloads)]
+    for future in as_completed(futures):
+      try:
+        workload_seconds.append(future.result())
+      except Exception as e:
+        (timed_out if isinstance(e, DeadlineExceeded) else failures).append(str(e))
+  wall_seconds = time.perf_counter() - started
+  stub.shutdown()
+
+  return {
+    "recipe_size": args.size,
+    "concurrency": args.concurrency,
+    "execution_mode": args.execution_mode,
+    "progressive": args.progressive,
+    "degradation": args.degradation,
+    "workloads": args.workloads,
+    "completed": len(workload_seconds),
+    "failed": len(failures),
+    "timed_out": len(timed_out),
+    "timed_out_examples": timed_out[:3],
+    "failures": failures[:5],
+    "wall_seconds": wall_seconds,
+    "workloads_per_hour": len(workload_seconds) / wall_seconds * 3600 if wall_seconds else 0,
+    "workload_latency": summarize(workload_seconds),
+    "time_to_first_page": summarize(list(first_page_seconds.values())),
+    "stages": {name: summarize(samples) for name, samples in sorted(spans.items())},
+    "peak_rss_mb": peak_rss_mb(),
+    "stub_requests": stub.counts,
+    "reddit_uploaded_bytes": gallery.uploaded_bytes,
+    "generation_savings_per_comic": {
+      key: sum(report.get(key, 0) for report in generation_reports) / max(1, len(generation_reports))
+      for key in ("bytes", "bytes_saved", "download_seconds_saved", "cost_usd", "cost_usd_saved")
+    },
+    "degraded_workloads": sum(1 for report in generation_reports if report.get("degradations")),
+    "db_calls": {f"{table}.{operation}": count for (table, operation), count in fake_db.calls.items()},
+  }
+
+def _fmt(value):
+  return "-" if value is None else f"{value:.2f}"
+
+def print_report(results):
+  print("\nsize  conc  done/total  workloads/h  p50(s)  p95(s)  p99(s)  peakRSS(MB)")
+  for result in results:
+    latency = result["workload_latency"]
+    print(f"{result['recipe_size']:>4}  {result['concurrency']:>4}  {result['completed']:>4}/{result['workloads']:<5}  "
+          f"{result['workloads_per_hour']:>11.1f}  {_fmt(latency['p50']):>6}  {_fmt(latency['p95']):>6}  {_fmt(latency['p99']):>6}  "
+          f"{result['peak_rss_mb']:>11.1f}")
+    first_page = result["time_to_first_page"]
+    print(f"        time to first page                       n={first_page['count']:<4} p50={_fmt(first_page['p50'])}  p95={_fmt(first_page['p95'])}  p99={_fmt(first_page['p99'])}")
+    for name, stage in result["stages"].items():
+      print(f"        {name:<40} n={stage['count']:<4} p50={_fmt(stage['p50'])}  p95={_fmt(stage['p95'])}  p99={_fmt(stage['p99'])}")
+
+def main(argv=None):
+  args = parse_args(argv)
+
+  if args.single:
+    args.concurrency = int(args.concurrency)
+    result = run_single(args)
+    with open(args.result_file, "w") as f:
+      json.dump(result, f)
+    return
+
+  results = []
+  passthrough = []
+  for option in ("workloads", "chat_latency", "image_latency", "download_latency", "chat_rpm", "images_rpm",
+                 "db_latency", "reddit_latency", "quality_tier", "dalle_batch_wait", "execution_mode", "fanout_workers", "degradation", "deadline_seconds"):
+    passthrough += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+  if args.progressive:
+    passthrough.append("--progressive")
+  for size in [int(value) for value in args.recipe_sizes.split(",")]:
+    for concurrency in [int(value) for value in args.concurrency.split(",")]:
+      print(f"Running recipe size {size} at concurrency {concurrency}...")
+      with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as result_file:
+        result_path = result_file.name
+      command = [sys.executable, "-m", "benchmarks.e2e.run_e2e", *passthrough,
+                 "--single", "--size", str(size), "--concurrency", str(concurrency), "--result-file", result_path]
+      subprocess.run(command, cwd=REPO_ROOT, check=True, stdout=subprocess.DEVNULL)
+      with open(result_path) as f:
+        results.append(json.load(f))
+      os.remove(result_path)
+
+  print_report(results)
+  if args.output:
+    write_json(args.output, {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args), "results": results})
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,197 @@
+'''In-process OpenAI stand-in serving the chat and images endpoints used by the flows.
+
+The chat endpoint answers each crewAI task with a canned "Final Answer" derived from the prompt text, the images
+endpoint returns URLs to synthetic PNGs served by the same server. Latency and a requests-per-minute limit
+(answered with 429s, like the real API) are configurable per endpoint.
+'''
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from PIL import Image
+
+ING_LINE = re.compile(r"^-\s*(?P<name>.+?)\s+[–-]\s+(?P<quantity>.+)$")
+STEP_LINE = re.compile(r"^\d+\.\s+(?P<step>.+)$")
+
+class RateLimiter:
+  def __init__(self, per_minute):
+    self.per_minute = per_minute
+    self.lock = threading.Lock()
+    self.calls = deque()
+
+  # Returns True if the call is allowed, False if it should be answered with a 429
+  def allow(self):
+    if not self.per_minute:
+      return True
+    with self.lock:
+      now = time.monotonic()
+      while self.calls and now - self.calls[0] > 60:
+        self.calls.popleft()
+      if len(self.calls) >= self.per_minute:
+        return False
+      self.calls.append(now)
+      return True
+
+class StubConfig:
+  def __init__(self, chat_latency=0.0, image_latency=0.0, download_latency=0.0, chat_rpm=0, images_rpm=0):
+    self.chat_latency = chat_latency
+    self.image_latency = image_latency
+    self.download_latency = download_latency
+    self.chat_limiter = RateLimiter(chat_rpm)
+    self.images_limiter = RateLimiter(images_rpm)
+
+def _final_answer(content):
+  return f"Thought: I now can give a great answer\nFinal Answer: {content}"
+
+# Pulls the ingredients and steps back out of the raw recipe text embedded in the extraction task
+def _extract_recipe(prompt):
+  name = "Benchmark Dish"
+  ingredients = []
+  instructions = []
+  for raw_line in prompt.splitlines():
+    line = raw_line.strip()
+    if line.lower().startswith("recipe:"):
+      name = line.split(":", 1)[1].strip()
+      continue
+    ing_match = ING_LINE.match(line)
+    if ing_match:
+      ingredients.append({"name": ing_match.group("name"), "quantity": ing_match.group("quantity")})
+      continue
+    step_match = STEP_LINE.match(line)
+    if step_match:
+      instructions.append(step_match.group("step"))
+  return {"name": name, "ingredients": ingredients, "instructions": instructions}
+
+def chat_answer(prompt):
+  if "Determine if it resembles a cooking recipe" in prompt:
+    return _final_answer("VALID")
+  if "extract structured recipe data" in prompt:
+    return _final_answer(json.dumps(_extract_recipe(prompt)))
+  subject = "the dish"
+  for marker in ("ingredient name:", "recipe instructions:", "recipe name:"):
+    if marker in prompt:
+      subject = prompt.split(marker, 1)[1].split("\n", 1)[0].strip().rstrip(".")
+      break
+  return _final_answer(json.dumps({"prompt": f"Comic art style illustration of {subject} on a simple background"}))
+
+_png_cache = {}
+_png_lock = threading.Lock()
+
+# Synthetic PNG with a noisy gradient so the encoded size is close to a real DALL-E image
+def synthetic_png(width, height):
+  key = (width, height)
+  with _png_lock:
+    if key not in _png_cache:
+      rng = random.Random(width * 31 + height)
+      noise = Image.effect_noise((width, height), 48).convert("RGB")
+      gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+      tint = Image.new("RGB", (width, height), (rng.randint(80, 200), rng.randint(80, 200), rng.randint(80, 200)))
+      img = Image.blend(Image.blend(noise, gradient, 0.5), tint, 0.4)
+      buffer = BytesIO()
+      img.save(buffer, format="PNG")
+      _png_cache[key] = buffer.getvalue()
+    return _png_cache[key]
+
+class StubHandler(BaseHTTPRequestHandler):
+  server_version = "OpenAIStub/0.1"
+
+  def log_message(self, format, *args):
+    pass
+
+  def _send_json(self, status, payload):
+    body = json.dumps(payload).encode()
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(body)))
+    if status == 429:
+      self.send_header("Retry-After", "1")
+    self.end_headers()
+    self.wfile.write(body)
+
+  def _read_json(self):
+    length = int(self.headers.get("Content-Length", 0))
+    return json.loads(self.rfile.read(length) or b"{}")
+
+  def _rate_limited(self):
+    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded", "code": "rate_limit_exceeded"}})
+
+  def do_POST(self):
+    config = self.server.config
+    self.server.count(self.path)
+    payload = self._read_json()
+
+    if self.path.endswith("/chat/completions"):
+      if not config.chat_limiter.allow():
+        return self._rate_limited()
+      time.sleep(config.chat_latency)
+      messages = payload.get("messages", [])
+      prompt = "\n".join(str(message.get("content", "")) for message in messages if message.get("role") == "user")
+      content = chat_answer(prompt)
+      return self._send_json(200, {
+        "id": f"chatcmpl-stub-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get("model", "stub"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4, "total_tokens": (len(prompt) + len(content)) // 4},
+      })
+
+    if self.path.endswith("/images/generations"):
+      if not config.images_limiter.allow():
+        return self._rate_limited()
+      time.sleep(config.image_latency)
+      size = payload.get("size", "1024x1024")
+      return self._send_json(200, {
+        "created": int(time.time()),
+        "data": [{"url": f"{self.server.base_url}/files/{size}.png?n={time.time_ns()}", "revised_prompt": payload.get("prompt", "")}],
+      })
+
+    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+  # Stand-in for the orchestrator's continue-flow endpoint called by PreProcessingFlow
+  def do_PUT(self):
+    self.server.count(self.path)
+    if self.path.startswith("/workloads/") and self.path.endswith("/continue-flow"):
+      self._read_json()
+      return self._send_json(200, {"message": "Continued flow successfully"})
+    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+  def do_GET(self):
+    config = self.server.config
+    self.server.count(self.path.split("?")[0])
+    match = re.match(r"^/files/(\d+)x(\d+)\.png", self.path)
+    if not match:
+      return self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+    time.sleep(config.download_latency)
+    body = synthetic_png(int(match.group(1)), int(match.group(2)))
+    self.send_response(200)
+    self.send_header("Content-Type", "image/png")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+class StubServer(ThreadingHTTPServer):
+  daemon_threads = True
+
+  def __init__(self, config, host="127.0.0.1", port=0):
+    super().__init__((host, port), StubHandler)
+    self.config = config
+    self.base_url = f"http://{host}:{self.server_address[1]}"
+    self.counts = {}
+    self.counts_lock = threading.Lock()
+
+  def count(self, path):
+    key = re.sub(r"/workloads/[^/]+/", "/workloads/<id>/", path)
+    with self.counts_lock:
+      self.counts[key] = self.counts.get(key, 0) + 1
+
+# Starts the stub on a background thread and returns the server (use server.base_url, server.shutdown())
+def start_stub_server(config, host="127.0.0.1", port=0):
+  server = StubServer(config, host=host, port=port)
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  return server
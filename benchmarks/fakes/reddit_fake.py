@@ -0,0 +1,67 @@
+'''In-process stand-in for the praw gallery endpoints used by upload_comic_to_reddit and get_reddit_preview_image'''
+import threading
+import time
+import uuid
+
+class FakeSubmission:
+  def __init__(self, submission_id, images):
+    self.id = submission_id
+    self.url = f"https://www.reddit.com/gallery/{submission_id}"
+    media_ids = [f"media{idx}" for idx in range(len(images))]
+    self.gallery_data = {"items": [{"media_id": media_id} for media_id in media_ids]}
+    self.media_metadata = {
+      media_id: {"s": {"u": f"https://preview.redd.it/{media_id}.jpg?width=1024&amp;format=pjpg"}}
+      for media_id in media_ids
+    }
+
+class FakeSubreddit:
+  def __init__(self, gallery):
+    self.gallery = gallery
+
+  def submit_gallery(self, title, images, **kwargs):
+    # Read every file like praw does, so the benchmark pays for the page encode + bytes on disk
+    uploaded_bytes = 0
+    for image in images:
+      with open(image["image_path"], "rb") as f:
+        uploaded_bytes += len(f.read())
+    if self.gallery.latency:
+      time.sleep(self.gallery.latency + self.gallery.latency_per_mb * uploaded_bytes / (1024 * 1024))
+
+    submission = FakeSubmission(uuid.uuid4().hex[:7], images)
+    with self.gallery.lock:
+      self.gallery.submissions[submission.id] = submission
+      self.gallery.uploaded_bytes += uploaded_bytes
+      self.gallery.uploaded_pages += len(images)
+    return submission
+
+class FakeGallery:
+  def __init__(self, latency=0.0, latency_per_mb=0.0):
+    self.latency = latency
+    self.latency_per_mb = latency_per_mb
+    self.lock = threading.Lock()
+    self.submissions = {}
+    self.uploaded_bytes = 0
+    self.uploaded_pages = 0
+
+  # Drop-in replacement for the praw.Reddit constructor
+  def reddit_factory(self, **kwargs):
+    gallery = self
+
+    class FakeReddit:
+      def subreddit(self, name):
+        return FakeSubreddit(gallery)
+
+      def submission(self, id):
+        with gallery.lock:
+          return gallery.submissions[id]
+
+    return FakeReddit()
+
+# Points praw.Reddit at the fake gallery. praw is imported as a module by shared.helpers, so patching it is enough
+# as long as it happens before the first get_reddit_client() call
+def install_fake_reddit(latency=0.0, latency_per_mb=0.0):
+  import praw
+
+  gallery = FakeGallery(latency=latency, latency_per_mb=latency_per_mb)
+  praw.Reddit = gallery.reddit_factory
+  return gallery
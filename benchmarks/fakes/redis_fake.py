@@ -0,0 +1,21 @@
+'''Points shared.redis_client at an in-memory fakeredis server (optional dependency: pip install fakeredis)'''
+
+# Must run before modules that do `from shared.redis_client import ...` are imported. Returns None when
+# fakeredis is not installed; the Redis-backed caches then fail soft and fall back to Supabase
+def install_fake_redis():
+  try:
+    import fakeredis
+  except ImportError:
+    print("[Benchmark] fakeredis is not installed, Redis-backed features will fall back to their slow paths")
+    return None
+
+  from rq import Queue
+  import shared.redis_client as redis_client
+
+  connection = fakeredis.FakeStrictRedis()
+  redis_client.redis_conn = connection
+  redis_client.preprocess_queue = Queue("preprocess", connection=connection)
+  redis_client.comicgen_queue = Queue("comicgen", connection=connection)
+  redis_client.comicgen_images_queue = Queue("comicgen_images", connection=connection)
+  redis_client.speculative_queue = Queue("speculative", connection=connection)
+  return connection
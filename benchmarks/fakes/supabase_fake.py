@@ -0,0 +1,120 @@
+'''In-memory stand-in for the subset of the Supabase table API used by the orchestrator and the workers'''
+import copy
+import sys
+import threading
+import time
+import types
+import uuid
+from datetime import datetime, timezone
+
+class FakeResponse:
+  def __init__(self, data):
+    self.data = data
+
+class FakeQuery:
+  def __init__(self, client, table_name):
+    self.client = client
+    self.table_name = table_name
+    self.operation = "select"
+    self.payload = None
+    self.filters = []
+    self.order_by = None
+    self.row_limit = None
+
+  def select(self, columns="*"):
+    self.operation = "select"
+    self.columns = columns
+    return self
+
+  def insert(self, payload):
+    self.operation = "insert"
+    self.payload = payload
+    return self
+
+  def update(self, payload):
+    self.operation = "update"
+    self.payload = payload
+    return self
+
+  def eq(self, column, value):
+    self.filters.append((column, value))
+    return self
+
+  def in_(self, column, values):
+    self.filters.append((column, list(values)))
+    return self
+
+  def order(self, column, desc=False):
+    self.order_by = (column, desc)
+    return self
+
+  def limit(self, count):
+    self.row_limit = count
+    return self
+
+  def _matches(self, row):
+    for column, value in self.filters:
+      if isinstance(value, list):
+        if str(row.get(column)) not in [str(item) for item in value]:
+          return False
+      elif str(row.get(column)) != str(value):
+        return False
+    return True
+
+  def execute(self):
+    if self.client.latency:
+      time.sleep(self.client.latency)
+    with self.client.lock:
+      rows = self.client.tables.setdefault(self.table_name, [])
+      self.client.calls[(self.table_name, self.operation)] = self.client.calls.get((self.table_name, self.operation), 0) + 1
+
+      if self.operation == "insert":
+        payloads = self.payload if isinstance(self.payload, list) else [self.payload]
+        inserted = []
+        for payload in payloads:
+          self.client.next_id += 1
+          row = {
+            "id": self.client.next_id,
+            "public_id": str(uuid.uuid4()),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+          }
+          row.update(copy.deepcopy(payload))
+          rows.append(row)
+          inserted.append(copy.deepcopy(row))
+        return FakeResponse(inserted)
+
+      if self.operation == "update":
+        updated = []
+        for row in rows:
+          if self._matches(row):
+            row.update(copy.deepcopy(self.payload))
+            updated.append(copy.deepcopy(row))
+        return FakeResponse(updated)
+
+      selected = [copy.deepcopy(row) for row in rows if self._matches(row)]
+      if self.order_by:
+        column, desc = self.order_by
+        selected.sort(key=lambda row: row.get(column) or "", reverse=desc)
+      if self.row_limit is not None:
+        selected = selected[:self.row_limit]
+      return FakeResponse(selected)
+
+class FakeSupabase:
+  def __init__(self, latency=0.0):
+    self.latency = latency
+    self.lock = threading.Lock()
+    self.tables = {}
+    self.calls = {}
+    self.next_id = 0
+
+  def table(self, table_name):
+    return FakeQuery(self, table_name)
+
+# Registers the fake as shared.supabase_client so every later `from shared.supabase_client import supabase` gets it.
+# Must run before shared.helpers or any flow module is imported
+def install_fake_supabase(latency=0.0):
+  fake = FakeSupabase(latency=latency)
+  module = types.ModuleType("shared.supabase_client")
+  module.supabase = fake
+  sys.modules["shared.supabase_client"] = module
+  return fake
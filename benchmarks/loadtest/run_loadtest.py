@@ -0,0 +1,250 @@
+'''Load test for the Flask orchestrator endpoints.
+
+Starts the orchestrator (benchmarks/loadtest/server.py: the real app on a fake Supabase and fakeredis) in each
+serving mode and drives it with a weighted request mix from N concurrent keep-alive clients for a fixed
+duration. Reports requests/second and p50/p95/p99 latency overall and per request kind.
+
+Serving modes:
+  dev       app.run(threaded=False), one request at a time
+  threaded  app.run() as flask_orchestrator/app.py runs it (Flask defaults to threaded=True)
+  waitress  waitress with --server-threads threads (pip install waitress)
+  gunicorn  gunicorn with --gunicorn-workers processes x --server-threads threads (pip install gunicorn)
+
+Modes whose server is not installed are reported as skipped. The load generator runs in this process, so at
+very high request rates it can become the bottleneck itself; compare modes at the same concurrency.
+
+Usage (from the repo root, with the orchestrator requirements and fakeredis installed):
+  python -m benchmarks.loadtest.run_loadtest --modes dev,threaded,gunicorn --concurrency 1,8,32 --duration 10
+  python -m benchmarks.loadtest.run_loadtest --mix create=1,status=4 --db-latency 0.05 --output loadtest.json
+'''
+import argparse
+import importlib.util
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+from devtools.common import REPO_ROOT, summarize, write_json
+from benchmarks.e2e.recipes import recipe_text
+from benchmarks.loadtest.server import SEED_PUBLIC_ID, SEED_COMIC_ID
+
+DEFAULT_MIX = "create=4,decision_new=2,decision_existing=1,continue=2,status=11"
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--modes", default="dev,threaded,waitress,gunicorn", help="Comma separated serving modes")
+  parser.add_argument("--concurrency", default="1,8,32", help="Comma separated numbers of concurrent clients")
+  parser.add_argument("--duration", type=float, default=10.0, help="Measured seconds per (mode, concurrency)")
+  parser.add_argument("--warmup", type=float, default=1.0, help="Unmeasured seconds before each measurement")
+  parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Request kinds and weights (default {DEFAULT_MIX})")
+  parser.add_argument("--db-latency", type=float, default=0.02, help="Seconds per fake Supabase call")
+  parser.add_argument("--seed-workloads", type=int, default=1000, help="Workload rows seeded in the fake Supabase")
+  parser.add_argument("--server-threads", type=int, default=8, help="Threads per process for waitress and gunicorn")
+  parser.add_argument("--gunicorn-workers", type=int, default=4, help="gunicorn worker processes")
+  parser.add_argument("--real-redis", action="store_true", help="Use the Redis at REDIS_HOST/REDIS_PORT instead of fakeredis")
+  parser.add_argument("--output", help="Write the JSON report to this file")
+  return parser.parse_args(argv)
+
+def parse_mix(mix):
+  weights = {}
+  for part in mix.split(","):
+    kind, weight = part.split("=")
+    if kind not in REQUEST_KINDS:
+      raise ValueError(f"Unknown request kind {kind}, expected one of {list(REQUEST_KINDS)}")
+    weights[kind] = float(weight)
+  return weights
+
+# Each request kind returns (method, path, json body) for a random seeded workload
+def _seeded(rng, seed_workloads):
+  index = rng.randrange(seed_workloads)
+  return index + 1, SEED_PUBLIC_ID.format(index)
+
+# Distinct recipes, so intake dedup (shared/intake_dedup.py) does not turn creates into duplicates
+def create_request(rng, seed_workloads):
+  return "POST", "/workloads", {"input_text": recipe_text(6, seed=rng.randrange(10 ** 9))}
+
+# A client retrying one of a few submissions, answered from the intake dedup claim
+def create_retry_request(rng, seed_workloads):
+  seed = rng.randrange(10)
+  return "POST", "/workloads", {"input_text": recipe_text(6, seed=seed), "idempotency_key": f"loadtest-retry-{seed}"}
+
+def decision_new_request(rng, seed_workloads):
+  _, public_id = _seeded(rng, seed_workloads)
+  return "PUT", f"/workloads/{public_id}/user-decision", {"choice": "NEW"}
+
+def decision_existing_request(rng, seed_workloads):
+  _, public_id = _seeded(rng, seed_workloads)
+  return "PUT", f"/workloads/{public_id}/user-decision", {"choice": "EXISTING", "selected_comic_id": SEED_COMIC_ID}
+
+def continue_request(rng, seed_workloads):
+  internal_id, _ = _seeded(rng, seed_workloads)
+  recipe_data = {"name": "Seeded recipe", "ingredients": [{"name": "Flour", "quantity": "2 cups"}], "instructions": ["Mix."]}
+  return "PUT", f"/workloads/{internal_id}/continue-flow", {"recipe_data": recipe_data}
+
+def status_request(rng, seed_workloads):
+  _, public_id = _seeded(rng, seed_workloads)
+  return "GET", f"/workloads/{public_id}", None
+
+REQUEST_KINDS = {
+  "create": create_request,
+  "create_retry": create_retry_request,
+  "decision_new": decision_new_request,
+  "decision_existing": decision_existing_request,
+  "continue": continue_request,
+  "status": status_request,
+}
+
+def free_port():
+  with socket.socket() as sock:
+    sock.bind(("127.0.0.1", 0))
+    return sock.getsockname()[1]
+
+# Returns the reason a mode cannot run here, or None
+def unavailable(mode):
+  if mode == "waitress" and importlib.util.find_spec("waitress") is None:
+    return "waitress is not installed"
+  if mode == "gunicorn" and shutil.which("gunicorn") is None:
+    return "gunicorn is not installed"
+  return None
+
+def start_server(mode, port, args):
+  env = dict(os.environ)
+  env.update({
+    "LOADTEST_DB_LATENCY": str(args.db_latency),
+    "LOADTEST_SEED_WORKLOADS": str(args.seed_workloads),
+    "LOADTEST_FAKE_REDIS": "0" if args.real_redis else "1",
+    "METRICS_SPAN_LOG": "0",
+    "PYTHONUNBUFFERED": "1",
+  })
+  if mode == "gunicorn":
+    command = ["gunicorn", "-w", str(args.gunicorn_workers), "--threads", str(args.server_threads),
+               "-b", f"127.0.0.1:{port}", "benchmarks.loadtest.server:app"]
+  else:
+    command = [sys.executable, "-m", "benchmarks.loadtest.server", "--mode", mode, "--port", str(port),
+               "--threads", str(args.server_threads)]
+  process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+  deadline = time.monotonic() + 60
+  while time.monotonic() < deadline:
+    if process.poll() is not None:
+      raise RuntimeError(f"{mode} server exited with code {process.returncode}")
+    try:
+      requests.get(f"http://127.0.0.1:{port}/test-connection", timeout=1)
+      return process
+    except requests.RequestException:
+      time.sleep(0.2)
+  process.terminate()
+  raise RuntimeError(f"{mode} server did not come up within 60 seconds")
+
+def stop_server(process):
+  process.terminate()
+  try:
+    process.wait(timeout=10)
+  except subprocess.TimeoutExpired:
+    process.kill()
+
+# Runs `concurrency` closed-loop clients against base_url. Returns {kind: [(seconds, ok)]} for the measured window
+def drive(base_url, concurrency, weights, args):
+  kinds, kind_weights = list(weights), list(weights.values())
+  samples = defaultdict(list)
+  samples_lock = threading.Lock()
+  measure_from = time.monotonic() + args.warmup
+  stop_at = measure_from + args.duration
+
+  def client(client_index):
+    rng = random.Random(client_index)
+    session = requests.Session()
+    local = defaultdict(list)
+    while True:
+      now = time.monotonic()
+      if now >= stop_at:
+        break
+      kind = rng.choices(kinds, kind_weights)[0]
+      method, path, body = REQUEST_KINDS[kind](rng, args.seed_workloads)
+      started = time.perf_counter()
+      try:
+        response = session.request(method, base_url + path, json=body, timeout=30)
+        ok = response.status_code < 400
+      except requests.RequestException:
+        ok = False
+      if now >= measure_from:
+        local[kind].append((time.perf_counter() - started, ok))
+    with samples_lock:
+      for kind, values in local.items():
+        samples[kind].extend(values)
+
+  threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return samples
+
+def summarize_run(mode, concurrency, samples, duration):
+  all_samples = [sample for values in samples.values() for sample in values]
+  def latency(values):
+    return summarize([seconds for seconds, ok in values if ok])
+  return {
+    "mode": mode,
+    "concurrency": concurrency,
+    "requests": len(all_samples),
+    "errors": sum(1 for _, ok in all_samples if not ok),
+    "requests_per_second": sum(1 for _, ok in all_samples if ok) / duration,
+    "latency": latency(all_samples),
+    "by_kind": {
+      kind: {"requests": len(values), "errors": sum(1 for _, ok in values if not ok), "latency": latency(values)}
+      for kind, values in sorted(samples.items())
+    },
+  }
+
+def _ms(value):
+  return "-" if value is None else f"{value * 1000:.1f}"
+
+def print_report(results):
+  print("\nmode        conc   req/s   errors  p50(ms)  p95(ms)  p99(ms)")
+  for result in results:
+    if "skipped" in result:
+      print(f"{result['mode']:<10}  skipped: {result['skipped']}")
+      continue
+    latency = result["latency"]
+    print(f"{result['mode']:<10}  {result['concurrency']:>4}  {result['requests_per_second']:>6.1f}  {result['errors']:>6}  "
+          f"{_ms(latency['p50']):>7}  {_ms(latency['p95']):>7}  {_ms(latency['p99']):>7}")
+    for kind, stats in result["by_kind"].items():
+      kind_latency = stats["latency"]
+      print(f"            {kind:<18} n={stats['requests']:<6} err={stats['errors']:<4} "
+            f"p50={_ms(kind_latency['p50'])}  p95={_ms(kind_latency['p95'])}  p99={_ms(kind_latency['p99'])}")
+
+def main(argv=None):
+  args = parse_args(argv)
+  weights = parse_mix(args.mix)
+
+  results = []
+  for mode in args.modes.split(","):
+    reason = unavailable(mode)
+    if reason:
+      results.append({"mode": mode, "skipped": reason})
+      continue
+    for concurrency in [int(value) for value in args.concurrency.split(",")]:
+      print(f"Running {mode} at concurrency {concurrency}...")
+      # A fresh server per run, so queued jobs and cache entries from the previous run do not carry over
+      port = free_port()
+      server = start_server(mode, port, args)
+      try:
+        samples = drive(f"http://127.0.0.1:{port}", concurrency, weights, args)
+      finally:
+        stop_server(server)
+      results.append(summarize_run(mode, concurrency, samples, args.duration))
+
+  print_report(results)
+  if args.output:
+    write_json(args.output, {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args), "results": results})
+
+if __name__ == "__main__":
+  main()
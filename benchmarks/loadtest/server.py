@@ -0,0 +1,81 @@
+'''The real orchestrator app (flask_orchestrator/app.py) wired to the benchmark fakes, for the load test.
+
+Configured through the environment so every process that imports it (including gunicorn workers) gets the same
+setup: LOADTEST_DB_LATENCY (seconds per fake Supabase call), LOADTEST_SEED_WORKLOADS (rows to pre-seed) and
+LOADTEST_FAKE_REDIS (1 = in-process fakeredis, 0 = the Redis at REDIS_HOST/REDIS_PORT).
+
+Every process seeds the same rows, so user-decision and status requests find their workload in whichever
+worker serves them. Rows inserted by POST /workloads stay local to the process that served the request.
+
+Usage (normally started by run_loadtest):
+  python -m benchmarks.loadtest.server --mode threaded --port 5055
+  gunicorn -w 4 --threads 4 -b 127.0.0.1:5055 benchmarks.loadtest.server:app
+'''
+import argparse
+import os
+import sys
+
+from devtools.common import REPO_ROOT
+
+ORCHESTRATOR_DIR = os.path.join(REPO_ROOT, "flask_orchestrator")
+SEED_PUBLIC_ID = "loadtest-{:06d}"
+SEED_COMIC_ID = 1
+
+def seed_tables(fake_db, count):
+  fake_db.tables["comics"] = [{
+    "id": SEED_COMIC_ID,
+    "name": "Seeded comic",
+    "preview_img_url": "https://example.com/preview.jpg",
+    "reddit_url": "https://example.com/gallery",
+  }]
+  fake_db.tables["workloads"] = [
+    {
+      "id": index + 1,
+      "public_id": SEED_PUBLIC_ID.format(index),
+      "prompt": "Seeded recipe",
+      "status": "AWAITING_USER_CHOICE",
+      "recipe_name": f"Seeded recipe {index}",
+      "ingredients": [{"name": "Flour", "quantity": "2 cups"}, {"name": "Eggs", "quantity": "3"}],
+      "instructions": ["Mix the flour and the eggs.", "Bake for 20 minutes."],
+      "similar_comics": [SEED_COMIC_ID],
+      "comic_id": None,
+    }
+    for index in range(count)
+  ]
+  fake_db.next_id = count
+
+def create_app():
+  from benchmarks.fakes.supabase_fake import install_fake_supabase
+  from benchmarks.fakes.redis_fake import install_fake_redis
+
+  os.environ.setdefault("OPENAI_API_KEY", "sk-loadtest")
+  os.environ.setdefault("METRICS_SPAN_LOG", "0")
+  fake_db = install_fake_supabase(latency=float(os.environ.get("LOADTEST_DB_LATENCY", 0.02)))
+  seed_tables(fake_db, int(os.environ.get("LOADTEST_SEED_WORKLOADS", 1000)))
+  if os.environ.get("LOADTEST_FAKE_REDIS", "1") == "1":
+    install_fake_redis()
+
+  # app.py imports routes by bare name, as it does inside its container
+  if ORCHESTRATOR_DIR not in sys.path:
+    sys.path.insert(0, ORCHESTRATOR_DIR)
+  from app import app as orchestrator_app
+  return orchestrator_app
+
+app = create_app()
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--mode", default="threaded", choices=["dev", "threaded", "waitress"])
+  parser.add_argument("--port", type=int, default=5055)
+  parser.add_argument("--threads", type=int, default=8, help="waitress worker threads")
+  args = parser.parse_args(argv)
+
+  if args.mode == "waitress":
+    from waitress import serve
+    serve(app, host="127.0.0.1", port=args.port, threads=args.threads)
+  else:
+    # "dev" is one request at a time; "threaded" is what app.run() does by default (Flask passes threaded=True)
+    app.run(host="127.0.0.1", port=args.port, threaded=args.mode == "threaded")
+
+if __name__ == "__main__":
+  main()
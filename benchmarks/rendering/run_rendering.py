@@ -0,0 +1,239 @@
+'''Micro-benchmarks for the PIL code paths that run on every comic.
+
+Feeds style_ing_image, style_ins_image, draw_page_title, compose_cover_page, compose_ingredient_page and
+compose_instruction_page synthetic 1024x1024, 1792x1024 and 1024x1792 images plus short, long and Unicode
+text. For every case it records wall and CPU time (timing pass), and Python allocations, Pillow image block
+allocations and the peak RSS delta (memory pass, each case in a fresh subprocess so the high-water marks
+are not shared). Results are stored as JSON; --compare flags regressions against a previous run.
+
+Usage (from the repo root):
+  python -m benchmarks.rendering.run_rendering --output rendering.json
+  python -m benchmarks.rendering.run_rendering --compare rendering.json --fail-on-regression
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from io import BytesIO
+
+from devtools.common import REPO_ROOT, FONTS_DIR, summarize, write_json
+
+SIZES = [(1024, 1024), (1792, 1024), (1024, 1792)]
+TEXTS = {
+  "short": "Chop the onions.",
+  "long": "Slowly fold the whipped egg whites into the chocolate batter in three additions, keeping as much air as possible, then pour it into the buttered tin and level the top with a spatula.",
+  "unicode": "Faites revenir les échalotes dans le beurre noisette – ajoutez 2 c. à s. de crème fraîche, puis assaisonnez 🌶️ selon votre goût.",
+}
+
+class FakeResponse:
+  def __init__(self, content):
+    self.content = content
+
+class FakeImageObject:
+  def __init__(self, url):
+    self.url = url
+
+class FakeIngredient:
+  def __init__(self, name, quantity):
+    self.name = name
+    self.quantity = quantity
+
+def _png(width, height):
+  from PIL import Image
+
+  noise = Image.effect_noise((width, height), 48).convert("RGB")
+  gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+  buffer = BytesIO()
+  Image.blend(noise, gradient, 0.5).save(buffer, format="PNG")
+  return buffer.getvalue()
+
+# Returns {case_name: zero-argument callable}. The style functions download their input, so requests.get is
+# pointed at in-memory PNGs: decode time is part of the measurement, network time is not
+def build_cases():
+  os.environ.setdefault("FONTS_DIR", FONTS_DIR)
+  os.environ.setdefault("METRICS_SPAN_LOG", "0")
+  from benchmarks.fakes.supabase_fake import install_fake_supabase
+  install_fake_supabase()
+  sys.path.insert(0, REPO_ROOT)
+
+  import requests
+  from PIL import Image, ImageDraw
+  from shared import helpers
+
+  pngs = {f"{width}x{height}": _png(width, height) for width, height in SIZES}
+  requests.get = lambda url, **kwargs: FakeResponse(pngs[url])
+
+  def styled_ing():
+    return helpers.style_ing_image(FakeImageObject("1024x1024"), FakeIngredient("Basil", "1 cup"))
+
+  def styled_ins():
+    return helpers.style_ins_image(FakeImageObject("1792x1024"), TEXTS["long"], 1)
+
+  cases = {}
+  for size in pngs:
+    for text_name, text in TEXTS.items():
+      def style_ing(size=size, text=text):
+        helpers.style_ing_image(FakeImageObject(size), FakeIngredient(text[:40], "2 tbsp"))
+      def style_ins(size=size, text=text):
+        helpers.style_ins_image(FakeImageObject(size), text, 12)
+      cases[f"style_ing_image[{size},{text_name}]"] = style_ing
+      cases[f"style_ins_image[{size},{text_name}]"] = style_ins
+
+    raw = Image.open(BytesIO(pngs[size]))
+    raw.load()
+    def cover(raw=raw):
+      helpers.compose_cover_page(raw, "Spiced Lentil Soup")
+    cases[f"compose_cover_page[{size}]"] = cover
+
+  for text_name, text in TEXTS.items():
+    def title(text=text):
+      page = Image.new("RGB", (1024, 1792), color="white")
+      helpers.draw_page_title(ImageDraw.Draw(page), text[:40])
+    cases[f"draw_page_title[{text_name}]"] = title
+
+  ing_images = [styled_ing() for _ in range(12)]
+  ins_images = [styled_ins() for _ in range(3)]
+  cases["compose_ingredient_page[12]"] = lambda: helpers.compose_ingredient_page(ing_images)
+  cases["compose_instruction_page[3]"] = lambda: helpers.compose_instruction_page(ins_images)
+  return cases
+
+def time_case(func, iterations, warmup):
+  for _ in range(warmup):
+    func()
+  wall, cpu = [], []
+  for _ in range(iterations):
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    func()
+    wall.append(time.perf_counter() - wall_start)
+    cpu.append(time.process_time() - cpu_start)
+  return {"wall_seconds": summarize(wall), "cpu_seconds": summarize(cpu)}
+
+# Current RSS in MB from /proc (Linux only, None elsewhere)
+def _current_rss_mb():
+  try:
+    with open("/proc/self/statm") as f:
+      return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+  except (OSError, ValueError):
+    return None
+
+# Pillow allocates image memory outside tracemalloc, so the RSS peak during the call is sampled from a thread
+class RssSampler(threading.Thread):
+  def __init__(self, interval=0.0005):
+    super().__init__(daemon=True)
+    self.interval = interval
+    self.peak = _current_rss_mb()
+    self.stopped = threading.Event()
+
+  def run(self):
+    while not self.stopped.is_set():
+      current = _current_rss_mb()
+      if current is not None and current > self.peak:
+        self.peak = current
+      time.sleep(self.interval)
+
+# Runs one case once with allocation tracking. Meant to run in a fresh process
+def measure_memory(func):
+  from PIL import Image
+
+  func()  # warm fonts and lazy imports so they are not counted
+  rss_before = _current_rss_mb()
+  sampler = RssSampler()
+  sampler.start()
+  Image.core.reset_stats()
+  func()
+  pil_stats = Image.core.get_stats()
+  sampler.stopped.set()
+  sampler.join()
+
+  # Second run under tracemalloc, kept apart so its overhead does not skew the RSS sampling
+  tracemalloc.start()
+  func()
+  _, python_peak = tracemalloc.get_traced_memory()
+  snapshot = tracemalloc.take_snapshot()
+  tracemalloc.stop()
+  return {
+    "python_allocations": sum(stat.count for stat in snapshot.statistics("filename")),
+    "python_peak_bytes": python_peak,
+    "pil_new_blocks": pil_stats.get("new_count"),
+    "pil_allocated_blocks": pil_stats.get("allocated_blocks"),
+    "peak_rss_delta_mb": sampler.peak - rss_before if rss_before is not None else None,
+  }
+
+def _memory_in_subprocess(case_name):
+  command = [sys.executable, "-m", "benchmarks.rendering.run_rendering", "--memory-case", case_name]
+  output = subprocess.run(command, cwd=REPO_ROOT, check=True, capture_output=True, text=True).stdout
+  return json.loads(output.strip().splitlines()[-1])
+
+def compare(results, baseline_path, threshold):
+  with open(baseline_path) as f:
+    baseline = json.load(f)["results"]
+  regressions = []
+  print(f"\n{'case':<48} {'cpu p50 (ms)':>14} {'baseline':>10} {'change':>8}")
+  for case_name, result in results.items():
+    if case_name not in baseline:
+      continue
+    current = result["cpu_seconds"]["p50"]
+    previous = baseline[case_name]["cpu_seconds"]["p50"]
+    change = (current - previous) / previous if previous else 0.0
+    flag = "  REGRESSION" if change > threshold else ""
+    print(f"{case_name:<48} {current * 1000:>14.2f} {previous * 1000:>10.2f} {change:>+8.1%}{flag}")
+    if change > threshold:
+      regressions.append(case_name)
+  return regressions
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--iterations", type=int, default=20)
+  parser.add_argument("--warmup", type=int, default=2)
+  parser.add_argument("--filter", default="", help="Only run cases whose name contains this string")
+  parser.add_argument("--skip-memory", action="store_true", help="Skip the per-case memory subprocesses")
+  parser.add_argument("--output", help="Write the JSON results to this file")
+  parser.add_argument("--compare", help="Previous JSON results to compare CPU p50 against")
+  parser.add_argument("--threshold", type=float, default=0.10, help="Relative CPU slowdown counted as a regression")
+  parser.add_argument("--fail-on-regression", action="store_true")
+  parser.add_argument("--memory-case", help=argparse.SUPPRESS)
+  args = parser.parse_args(argv)
+
+  cases = build_cases()
+  if args.memory_case:
+    print(json.dumps(measure_memory(cases[args.memory_case])))
+    return 0
+
+  import PIL
+
+  results = {}
+  for case_name, func in cases.items():
+    if args.filter not in case_name:
+      continue
+    result = time_case(func, args.iterations, args.warmup)
+    if not args.skip_memory:
+      result["memory"] = _memory_in_subprocess(case_name)
+    results[case_name] = result
+    print(f"{case_name:<48} cpu p50={result['cpu_seconds']['p50'] * 1000:8.2f}ms  wall p95={result['wall_seconds']['p95'] * 1000:8.2f}ms")
+
+  if args.output:
+    write_json(args.output, {
+      "meta": {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "machine": platform.platform(),
+        "iterations": args.iterations,
+      },
+      "results": results,
+    })
+
+  if args.compare:
+    regressions = compare(results, args.compare, args.threshold)
+    if regressions and args.fail_on_regression:
+      print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+      return 1
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,75 @@
+'''Per-job startup time of a cold RQ work-horse versus one forked from a warm, preloaded parent.
+
+A cold work-horse is forked from a parent that only imported rq (what `rq worker` does) and has to import the
+task module, build the OpenAI client and parse the fonts itself. A warm one is forked after
+shared.warm_worker.preload() ran in the parent. Both are timed from fork until the task is ready to run.
+
+Usage (from the repo root):
+  python -m benchmarks.worker_startup --worker comicgen --jobs 5
+'''
+import argparse
+import os
+import time
+
+from devtools.common import FONTS_DIR, add_worker_paths, summarize
+
+TASKS = {
+  "comicgen": ("comicgen_worker", "comicgen_worker.comicgen_task", True),
+  "preprocess": ("preprocess_worker", "preprocess_worker.preprocess_task", False),
+}
+
+# Forks a work-horse that resolves the task like RQ does and builds the per-process clients, then exits
+def time_fork(task_path, warm_fonts):
+  read_fd, write_fd = os.pipe()
+  started = time.perf_counter()
+  pid = os.fork()
+  if pid == 0:
+    os.close(read_fd)
+    from rq.utils import import_attribute
+    from shared.helpers import get_openai_client, load_font
+    from shared.warm_worker import PRELOADED_FONTS
+
+    import_attribute(task_path)
+    get_openai_client()
+    if warm_fonts:
+      for file_name, size in PRELOADED_FONTS:
+        load_font(file_name, size)
+    os.write(write_fd, b"1")
+    os._exit(0)
+
+  os.close(write_fd)
+  os.read(read_fd, 1)
+  elapsed = time.perf_counter() - started
+  os.close(read_fd)
+  os.waitpid(pid, 0)
+  return elapsed
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--worker", choices=sorted(TASKS), default="comicgen")
+  parser.add_argument("--jobs", type=int, default=5, help="Work-horses forked per mode")
+  args = parser.parse_args(argv)
+
+  os.environ.setdefault("FONTS_DIR", FONTS_DIR)
+  os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+  os.environ.setdefault("METRICS_SPAN_LOG", "0")
+  from benchmarks.fakes.supabase_fake import install_fake_supabase
+  install_fake_supabase()
+  add_worker_paths()
+  import rq  # what the stock `rq worker` parent has loaded
+
+  module_name, task_path, warm_fonts = TASKS[args.worker]
+  cold = [time_fork(task_path, warm_fonts) for _ in range(args.jobs)]
+
+  from shared.warm_worker import preload
+  preload([module_name], warm_fonts)
+  warm = [time_fork(task_path, warm_fonts) for _ in range(args.jobs)]
+
+  cold_summary, warm_summary = summarize(cold), summarize(warm)
+  print(f"\n{args.worker} work-horse startup over {args.jobs} jobs")
+  print(f"  cold (stock rq worker):  p50={cold_summary['p50'] * 1000:9.1f}ms  max={cold_summary['max'] * 1000:9.1f}ms")
+  print(f"  warm (preloaded parent): p50={warm_summary['p50'] * 1000:9.1f}ms  max={warm_summary['max'] * 1000:9.1f}ms")
+  print(f"  speedup: {cold_summary['p50'] / warm_summary['p50']:.0f}x")
+
+if __name__ == "__main__":
+  main()
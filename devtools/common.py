@@ -0,0 +1,46 @@
+'''Repo layout and reporting helpers shared by the tools that run from a checkout (benchmarks/, batch/)'''
+import json
+import math
+import os
+import resource
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PREPROCESS_DIR = os.path.join(REPO_ROOT, "workers", "preprocess")
+COMICGEN_DIR = os.path.join(REPO_ROOT, "workers", "comicgen")
+FONTS_DIR = os.path.join(COMICGEN_DIR, "fonts")
+
+# The worker modules import each other by bare name (as they do inside their containers)
+def add_worker_paths():
+  for path in (REPO_ROOT, PREPROCESS_DIR, COMICGEN_DIR):
+    if path not in sys.path:
+      sys.path.insert(0, path)
+
+# Nearest-rank percentile. Returns None for an empty sample
+def percentile(samples, pct):
+  if not samples:
+    return None
+  ordered = sorted(samples)
+  rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+  return ordered[rank]
+
+def summarize(samples):
+  return {
+    "count": len(samples),
+    "p50": percentile(samples, 50),
+    "p95": percentile(samples, 95),
+    "p99": percentile(samples, 99),
+    "max": max(samples) if samples else None,
+  }
+
+def write_json(path, payload):
+  with open(path, "w") as f:
+    json.dump(payload, f, indent=2)
+  print(f"Results written to {path} ✅")
+
+# Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)
+def peak_rss_mb():
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == "darwin":
+    return peak / (1024 * 1024)
+  return peak / 1024
@@ -1,11 +1,21 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
 import sys
 import os
 from openai import OpenAI
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from shared.constants import WORKLOAD_STATUSES
+from shared.constants import WORKLOAD_STATUSES,QUALITY_TIERS,DEFAULT_QUALITY_TIER,WORKLOAD_DEADLINE_SECONDS,MAX_WORKLOAD_DEADLINE_SECONDS,PAGE_DERIVATIVE_WIDTHS
 from shared.supabase_client import supabase
-from shared.redis_client import preprocess_queue,comicgen_queue
+from shared.redis_client import preprocess_queue,comicgen_queue,comicgen_images_queue,speculative_queue
+from shared.metrics import QUEUE_DEPTH,metrics_response,external_call
+from shared.workload_cache import get_workload_body,body_etag,refresh_workload_cache
+from shared.workload_options import save_workload_options,update_workload_options,get_workload_options
+from shared.deadline import job_timeout_for
+from shared.speculation import cancel_speculation
+from shared.profiling import list_profiles,get_profile_stats,get_profile_folded
+from shared.intake_dedup import claim_intake,complete_intake,release_intake,IdempotencyKeyConflict,IntakePending
+import time
+from shared.page_store import page_store,image_mimetype
+from functools import lru_cache
 
 
 routes = Blueprint("routes", __name__)
@@ -14,37 +24,85 @@ routes = Blueprint("routes", __name__)
 def test_connection():
   return jsonify({"message": "Server is up and running!"}), 200
 
+@routes.route('/metrics', methods=['GET'])
+def metrics():
+  # Queue depth is sampled at scrape time instead of on every enqueue
+  for queue in (preprocess_queue, comicgen_queue, comicgen_images_queue, speculative_queue):
+    QUEUE_DEPTH.labels(queue.name).set(len(queue))
+  body, content_type = metrics_response()
+  return Response(body, content_type=content_type)
+
 @routes.route("/workloads", methods=["POST"])
 def create_workload():
   data = request.json
   input_text = data.get("input_text")
   if not input_text:
     return jsonify({"message": "Missing input_text param"}), 400
+  # "draft" generates smaller/cheaper images, meant for previews
+  quality_tier = data.get("quality_tier", DEFAULT_QUALITY_TIER)
+  if quality_tier not in QUALITY_TIERS:
+    return jsonify({"message": f"Invalid quality_tier, expected one of {list(QUALITY_TIERS)}"}), 400
+  # Seconds the workload may take until its comic is published (time spent awaiting the user's choice excluded)
+  deadline_seconds = data.get("deadline_seconds", WORKLOAD_DEADLINE_SECONDS)
+  # bool is an int subclass, true would otherwise be a 1 second deadline
+  if isinstance(deadline_seconds, bool) or not isinstance(deadline_seconds, (int, float)) or not 0 < deadline_seconds <= MAX_WORKLOAD_DEADLINE_SECONDS:
+    return jsonify({"message": f"Invalid deadline_seconds, expected a number of seconds up to {MAX_WORKLOAD_DEADLINE_SECONDS}"}), 400
+  # Profiles every job of the workload (see shared/profiling.py)
+  profile = data.get("profile", False)
+  if not isinstance(profile, bool):
+    return jsonify({"message": "Invalid profile, expected true or false"}), 400
+  # Retries of the same submission carry the same key (see shared/intake_dedup.py)
+  idempotency_key = request.headers.get("Idempotency-Key") or data.get("idempotency_key")
+  if idempotency_key is not None and (not isinstance(idempotency_key, str) or len(idempotency_key) > 255):
+    return jsonify({"message": "Invalid idempotency_key, expected a string of up to 255 characters"}), 400
+
+  # Duplicates of a recent submission get its workload instead of a new one
+  try:
+    claim = claim_intake(idempotency_key, input_text, {"quality_tier": quality_tier, "deadline_seconds": deadline_seconds, "profile": profile})
+  except IdempotencyKeyConflict as e:
+    return jsonify({"message": str(e)}), 422
+  except IntakePending as e:
+    return jsonify({"message": str(e)}), 409
+  if claim.public_id:
+    return jsonify({
+      "workload_id": claim.public_id,
+      "message": "Workload already exists for this submission"
+    }), 200
 
   try:
     # Insert into workloads table
-    db_response = (
-      supabase.table("workloads")
-      .insert({
-        "prompt": input_text,
-        "status": WORKLOAD_STATUSES['starting_workload']
-      })
-      .execute()
-    )
+    with external_call("supabase_insert_workload"):
+      db_response = (
+        supabase.table("workloads")
+        .insert({
+          "prompt": input_text,
+          "status": WORKLOAD_STATUSES['starting_workload']
+        })
+        .execute()
+      )
     print("[FLASK] Inserted new workload into DB ✅")
+    refresh_workload_cache(db_response.data)
     workload_internal_id = db_response.data[0]["id"]
     workload_public_id = db_response.data[0]["public_id"]
+    deadline_at = time.time() + deadline_seconds
+    options = {"quality_tier": quality_tier, "deadline_at": deadline_at}
+    if profile:
+      options["profile"] = True
+    save_workload_options(workload_internal_id, options)
 
     # Enqueue preprocess task
     preprocess_queue.enqueue(
       "preprocess_worker.preprocess_task", 
       workload_internal_id,
       input_text,
-      result_ttl=86400 #24hrs
+      result_ttl=86400, #24hrs
+      job_timeout=job_timeout_for(deadline_at)
     )
     print("[FLASK] Added new task into preprocess queue ✅")
+    complete_intake(claim, workload_public_id)
 
   except Exception as e:
+    release_intake(claim)
     return jsonify({
       "message": "Failed to create new workload",
       "error": str(e),
@@ -55,6 +113,174 @@ def create_workload():
     "message": "Created new workload successfully"
   }), 201
 
+# Polled by the frontend. Served from the Redis read-through cache, with ETag/304 support
+@routes.route("/workloads/<workload_public_id>", methods=["GET"])
+def get_workload(workload_public_id):
+  try:
+    body = get_workload_body(workload_public_id)
+  except Exception as e:
+    return jsonify({
+      "message": "Failed to fetch workload",
+      "error": str(e),
+    }), 500
+
+  if body is None:
+    return jsonify({"message": "Workload not found"}), 404
+
+  response = Response(body, mimetype="application/json")
+  response.set_etag(body_etag(body))
+  response.headers["Cache-Control"] = "no-cache"
+  return response.make_conditional(request)
+
+# Pages are stored under the internal id. The mapping never changes, so found ids are memoized (misses raise and are not)
+@lru_cache(maxsize=4096)
+def resolve_internal_id(workload_public_id):
+  with external_call("supabase_resolve_workload"):
+    db_response = supabase.table("workloads").select("id").eq("public_id", workload_public_id).execute()
+  if not db_response.data:
+    raise KeyError(workload_public_id)
+  return db_response.data[0]["id"]
+
+# Pages published so far by a progressive comicgen run (PROGRESSIVE_PAGES). Page 0 is the cover
+@routes.route("/workloads/<workload_public_id>/pages", methods=["GET"])
+def list_workload_pages(workload_public_id):
+  try:
+    total_pages, ready_pages = page_store.list_pages(resolve_internal_id(workload_public_id))
+  except KeyError:
+    return jsonify({"message": "Workload not found"}), 404
+  except Exception as e:
+    return jsonify({
+      "message": "Failed to list pages",
+      "error": str(e),
+    }), 500
+
+  return jsonify({
+    "workload_id": workload_public_id,
+    "total_pages": total_pages,
+    "ready_pages": ready_pages,
+    "pages": [
+      {
+        "page_number": page_number,
+        "url": f"/workloads/{workload_public_id}/pages/{page_number}",
+        **{f"{variant}_url": f"/workloads/{workload_public_id}/pages/{page_number}?size={variant}" for variant in PAGE_DERIVATIVE_WIDTHS},
+      }
+      for page_number in ready_pages
+    ],
+  }), 200
+
+# ?size=mid or ?size=thumb serves a smaller derivative of the page
+@routes.route("/workloads/<workload_public_id>/pages/<int:page_number>", methods=["GET"])
+def get_workload_page(workload_public_id, page_number):
+  size = request.args.get("size", "full")
+  if size != "full" and size not in PAGE_DERIVATIVE_WIDTHS:
+    return jsonify({"message": f"Invalid size, expected one of {['full', *PAGE_DERIVATIVE_WIDTHS]}"}), 400
+
+  try:
+    page = page_store.get_page(resolve_internal_id(workload_public_id), page_number, size)
+  except KeyError:
+    return jsonify({"message": "Workload not found"}), 404
+  except Exception as e:
+    return jsonify({
+      "message": "Failed to fetch page",
+      "error": str(e),
+    }), 500
+
+  if page is None:
+    return jsonify({"message": "Page not ready"}), 404
+
+  # A published page never changes
+  response = Response(page, mimetype=image_mimetype(page))
+  response.add_etag()
+  response.headers["Cache-Control"] = "public, max-age=86400, immutable"
+  return response.make_conditional(request)
+
+# Preview of a published comic (its cover, ?size=mid by default or thumb), linked from comics.preview_img_url.
+# Comics are keyed by their gallery submission id
+@routes.route("/comics/<comic_key>/preview", methods=["GET"])
+def get_comic_preview(comic_key):
+  size = request.args.get("size", "mid")
+  if size not in PAGE_DERIVATIVE_WIDTHS:
+    return jsonify({"message": f"Invalid size, expected one of {list(PAGE_DERIVATIVE_WIDTHS)}"}), 400
+
+  try:
+    preview = page_store.get_preview(comic_key, size)
+  except Exception as e:
+    return jsonify({
+      "message": "Failed to fetch preview",
+      "error": str(e),
+    }), 500
+
+  if preview is None:
+    return jsonify({"message": "Preview not found"}), 404
+
+  response = Response(preview, mimetype=image_mimetype(preview))
+  response.add_etag()
+  response.headers["Cache-Control"] = "public, max-age=86400, immutable"
+  return response.make_conditional(request)
+
+# Profiles recorded for the workload's jobs, oldest first
+@routes.route("/workloads/<workload_public_id>/profiles", methods=["GET"])
+def list_workload_profiles(workload_public_id):
+  try:
+    profiles = list_profiles(resolve_internal_id(workload_public_id))
+  except KeyError:
+    return jsonify({"message": "Workload not found"}), 404
+  except Exception as e:
+    return jsonify({
+      "message": "Failed to list profiles",
+      "error": str(e),
+    }), 500
+
+  return jsonify({
+    "workload_id": workload_public_id,
+    "profiles": [
+      {
+        "name": stats["name"],
+        "service": stats["service"],
+        "ok": stats["ok"],
+        "started_at": stats["started_at"],
+        "wall_seconds": stats["wall_seconds"],
+        "cpu_seconds": stats["cpu_seconds"],
+        "stats_url": f"/workloads/{workload_public_id}/profiles/{stats['name']}",
+        "folded_url": f"/workloads/{workload_public_id}/profiles/{stats['name']}/folded",
+      }
+      for stats in profiles
+    ],
+  }), 200
+
+@routes.route("/workloads/<workload_public_id>/profiles/<name>", methods=["GET"])
+def get_workload_profile(workload_public_id, name):
+  try:
+    stats = get_profile_stats(resolve_internal_id(workload_public_id), name)
+  except KeyError:
+    return jsonify({"message": "Workload not found"}), 404
+  except Exception as e:
+    return jsonify({
+      "message": "Failed to fetch profile",
+      "error": str(e),
+    }), 500
+
+  if stats is None:
+    return jsonify({"message": "Profile not found"}), 404
+  return jsonify(stats), 200
+
+# Folded stacks, open with speedscope or render with flamegraph.pl
+@routes.route("/workloads/<workload_public_id>/profiles/<name>/folded", methods=["GET"])
+def get_workload_profile_folded(workload_public_id, name):
+  try:
+    folded = get_profile_folded(resolve_internal_id(workload_public_id), name)
+  except KeyError:
+    return jsonify({"message": "Workload not found"}), 404
+  except Exception as e:
+    return jsonify({
+      "message": "Failed to fetch profile",
+      "error": str(e),
+    }), 500
+
+  if folded is None:
+    return jsonify({"message": "Profile not found"}), 404
+  return Response(folded, mimetype="text/plain")
+
 @routes.route("/workloads/<workload_id>/continue-flow", methods=["PUT"])
 def continue_flow(workload_id):
   try:
@@ -68,7 +294,8 @@ def continue_flow(workload_id):
       recipe_data['name'],
       recipe_data['ingredients'],
       recipe_data['instructions'],
-      result_ttl=86400 #24hrs
+      result_ttl=86400, #24hrs
+      job_timeout=job_timeout_for(get_workload_options(workload_id).get("deadline_at"))
     )
     print("[FLASK] Added new task into comicgen queue ✅")
 
@@ -106,10 +333,29 @@ def user_decision(workload_public_id):
         .execute()
       )
       print("[FLASK] DB Workflow record updated to COMPLETED_W_EXISTING ✅")
+      refresh_workload_cache(db_response.data)
+      # Speculatively prepared prompts are not needed anymore
+      if db_response.data:
+        cancel_speculation(db_response.data[0]["id"])
     elif choice == 'NEW':
       db_response = supabase.table("workloads").select("id,recipe_name,ingredients,instructions").eq("public_id", workload_public_id).execute()
       workload = db_response.data[0]  
 
+      # The tier can still be changed when choosing to generate a new comic
+      quality_tier = data.get("quality_tier")
+      if quality_tier in QUALITY_TIERS:
+        update_workload_options(workload["id"], quality_tier=quality_tier)
+
+      # Time spent waiting for this decision does not count against the deadline
+      options = get_workload_options(workload["id"])
+      deadline_at = options.get("deadline_at")
+      if deadline_at and options.get("awaiting_since"):
+        deadline_at += time.time() - options["awaiting_since"]
+        update_workload_options(workload["id"], deadline_at=deadline_at, awaiting_since=None)
+
+      # Prompts prepared so far are picked up by the comicgen job, a speculative job that has not started would only waste a worker
+      cancel_speculation(workload["id"], drop_results=False)
+
       # Enqueue comicgen task
       comicgen_queue.enqueue(
         "comicgen_worker.comicgen_task",
@@ -117,7 +363,8 @@ def user_decision(workload_public_id):
         workload["recipe_name"],
         workload["ingredients"],
         workload["instructions"],
-        result_ttl=86400 #24hrs
+        result_ttl=86400, #24hrs
+        job_timeout=job_timeout_for(deadline_at)
       )
       print("[FLASK] Added new task into comicgen queue ✅")
 
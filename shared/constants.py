@@ -1,4 +1,5 @@
 '''This file contains global constants that are required by any service in the system'''
+import os
 
 # 1] for flask orchestrator
 WORKLOAD_STATUSES = {
@@ -15,16 +16,118 @@ WORKLOAD_STATUSES = {
   "completed_w_new" : "COMPLETED_W_NEW",
   "failed_not_recipe" : "FAILED_NOT_RECIPE",
   "failed_overlimit" : "FAILED_OVERLIMIT",
+  "failed_timeout" : "FAILED_TIMEOUT",
+  "failed_error" : "FAILED_ERROR",
 }
 
+# Seconds per-workload options (quality tier, ...) are kept in Redis (see shared/workload_options.py)
+WORKLOAD_OPTIONS_TTL = 7 * 24 * 3600
+
+# Time budget of a workload from POST /workloads until its comic is published (see shared/deadline.py). Time spent
+# in AWAITING_USER_CHOICE does not count. Clients may ask for less, or for up to MAX_WORKLOAD_DEADLINE_SECONDS
+WORKLOAD_DEADLINE_SECONDS = int(os.environ.get("WORKLOAD_DEADLINE_SECONDS", 1800))
+MAX_WORKLOAD_DEADLINE_SECONDS = 4 * 3600
+JOB_TIMEOUT_GRACE_SECONDS = 60 # RQ job_timeout is the remaining deadline plus this, as a backstop for uncooperative code
+EXTERNAL_CALL_TIMEOUT_SECONDS = 120 # Upper bound for a single HTTP/LLM call, even when the deadline is further away
+
+# Per-job profiling (see shared/profiling.py). A workload is profiled when it was created with "profile": true, or
+# when it falls into the PROFILE_SAMPLE_RATE share of workloads (0 to 1)
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SAMPLE_INTERVAL = 0.01 # Seconds between stack samples
+# Set PROFILE_ALLOCATIONS=1 to also trace allocations with tracemalloc in profiled jobs. Off by default: tracing
+# slows allocation-heavy PIL work down noticeably and inflates the wall and CPU times of the profile
+PROFILE_ALLOCATIONS = os.environ.get("PROFILE_ALLOCATIONS", "0") == "1"
+PROFILE_MAX_STACK_DEPTH = 128
+PROFILE_TOP_N = 25 # Functions and allocation sites kept in a profile's stats
+PROFILE_TTL = 7 * 24 * 3600 # Seconds profiles are kept in Redis
+
+# Idempotent intake (see shared/intake_dedup.py). A POST /workloads repeating the Idempotency-Key or the recipe text of
+# one made within INTAKE_DEDUP_WINDOW seconds gets that workload back instead of a new one
+INTAKE_DEDUP_WINDOW = int(os.environ.get("INTAKE_DEDUP_WINDOW", 600))
+INTAKE_PENDING_WAIT = 10 # Seconds a duplicate waits for the first submission to finish creating its workload
+
+# Seconds a workload status payload stays in the Redis read-through cache (see shared/workload_cache.py)
+WORKLOAD_CACHE_TTL = int(os.environ.get("WORKLOAD_CACHE_TTL", 30))
+
 # 2] For workers
 
+# Service locations (overridable so the workers can run outside docker-compose, e.g. in benchmarks)
+ORCHESTRATOR_URL = os.environ.get("ORCHESTRATOR_URL", "http://flask_orchestrator:5000")
+FONTS_DIR = os.environ.get("FONTS_DIR", "/app/fonts")
+
 # Image generation constants
 IMG_GEN_LIMIT = 20
-ING_IMAGE_SIZE = "1024x1024"
+# Large recipes (see shared/panel_planner.py). A comic gets at most IMAGE_BUDGET images including the poster. Bigger
+# recipes share panels between consecutive steps and between minor ingredients, and only fail (FAILED_OVERLIMIT)
+# when that still does not fit
+IMAGE_BUDGET = int(os.environ.get("IMAGE_BUDGET", IMG_GEN_LIMIT))
+PANEL_MAX_STEPS = 4 # Steps on one multi-step instruction panel
+PANEL_MAX_COMBINED_INGREDIENTS = 4 # Minor ingredients on one combined ingredient image
+ING_IMAGE_SIZE = "1024x1024" # Standard tier sizes, also the baseline the generation planner reports savings against
 INS_IMAGE_SIZE = "1792x1024"
 POSTER_IMAGE_SIZE = "1024x1792"
 
+# Generation options the size planner can choose from (see shared/size_planner.py). cost_usd is the list price per image
+IMAGE_GENERATION_OPTIONS = [
+  {"model": "dall-e-2", "size": "256x256", "cost_usd": 0.016},
+  {"model": "dall-e-2", "size": "512x512", "cost_usd": 0.018},
+  {"model": "dall-e-2", "size": "1024x1024", "cost_usd": 0.020},
+  {"model": "dall-e-3", "size": "1024x1024", "cost_usd": 0.040},
+  {"model": "dall-e-3", "size": "1792x1024", "cost_usd": 0.080},
+  {"model": "dall-e-3", "size": "1024x1792", "cost_usd": 0.080},
+]
+# models: which models a tier may use. min_scale: fraction of the layout resolution the generated image must cover
+# (below 1 the styling upscales). crop: whether a different aspect ratio may be center-cropped to the layout
+QUALITY_TIERS = {
+  "standard": {"models": ["dall-e-3"], "min_scale": 1.0, "crop": False},
+  "draft": {"models": ["dall-e-2", "dall-e-3"], "min_scale": 0.5, "crop": True},
+}
+DEFAULT_QUALITY_TIER = os.environ.get("DEFAULT_QUALITY_TIER", "standard")
+
+# In-flight coalescing of identical LLM/image requests across workloads (see shared/singleflight.py)
+SINGLEFLIGHT_LOCK_TTL = 180 # Seconds a leader may take before another caller takes over
+SINGLEFLIGHT_WAIT_TIMEOUT = 240 # Seconds a waiter waits for the leader before doing the work itself
+SINGLEFLIGHT_PROMPT_TTL = 24 * 3600 # Seconds a generated ingredient prompt is reused
+SINGLEFLIGHT_IMAGE_TTL = 30 * 60 # Seconds a generated image URL is reused (DALL-E URLs expire after an hour)
+
+# Comicgen execution mode. "single" runs the whole ComicGenFlow in one job. "fanout" splits it into a planner job,
+# one generate+style sub-job per image on FANOUT_IMAGE_QUEUE, and a fan-in job that merges and publishes
+COMICGEN_EXECUTION_MODE = os.environ.get("COMICGEN_EXECUTION_MODE", "single")
+FANOUT_IMAGE_QUEUE = "comicgen_images"
+FANOUT_IMAGE_RETRIES = 3 # Attempts after the first one, only the failed sub-job is retried
+FANOUT_RETRY_INTERVALS = [10, 30, 60] # Seconds before each retry
+FANOUT_STATE_TTL = 24 * 3600 # Seconds the plan and styled images of a fanned-out workload are kept in Redis
+
+# Adaptive degradation under comicgen backlog (see shared/degradation.py). "auto" degrades by the thresholds below,
+# "off" never degrades, "always" applies every degradation (benchmarks)
+DEGRADATION_MODE = os.environ.get("DEGRADATION_MODE", "auto")
+# Degradation -> the comicgen backlog (jobs waiting in the comicgen queues) or the fraction of the fleet's image
+# rate-limit window already used at which it kicks in. Either signal is enough. Listed from mildest to harshest
+DEGRADATION_THRESHOLDS = {
+  "reuse_ingredient_art": {"queue_depth": int(os.environ.get("DEGRADE_REUSE_ART_QUEUE_DEPTH", 5)), "rate_budget_used": 0.5},
+  "draft_tier": {"queue_depth": int(os.environ.get("DEGRADE_DRAFT_TIER_QUEUE_DEPTH", 10)), "rate_budget_used": 0.75},
+  "merge_instructions": {"queue_depth": int(os.environ.get("DEGRADE_MERGE_INSTRUCTIONS_QUEUE_DEPTH", 20)), "rate_budget_used": 0.9},
+}
+DEGRADE_SHORT_INSTRUCTION_CHARS = 60 # Instructions up to this long may share a panel with their neighbours
+DEGRADE_MERGED_INSTRUCTION_CHARS = 100 # Longest text of a panel merged this way
+INGREDIENT_ART_TTL = 40 * 60 # Seconds generated ingredient art is offered for reuse (DALL-E URLs expire after an hour)
+
+# Speculative prompt preparation. When on, a workload entering AWAITING_USER_CHOICE gets a low-priority job on
+# SPECULATIVE_QUEUE that writes its image prompts, so choosing NEW starts straight at image generation
+SPECULATIVE_PROMPTS = os.environ.get("SPECULATIVE_PROMPTS", "0") == "1"
+SPECULATIVE_QUEUE = "speculative"
+SPECULATIVE_MAX_PENDING = int(os.environ.get("SPECULATIVE_MAX_PENDING", 4)) # Speculative jobs queued or running at once, more are not enqueued
+SPECULATIVE_JOB_TIMEOUT = 600
+SPECULATIVE_RESULT_TTL = 6 * 3600 # Seconds prepared prompts wait for the user's choice
+
+# Progressive page delivery. When on, every comic page is published to the page store as soon as it is composed,
+# so GET /workloads/<public_id>/pages can serve the cover and early pages before the gallery upload
+PROGRESSIVE_PAGES = os.environ.get("PROGRESSIVE_PAGES", "0") == "1"
+PAGE_STORE_BACKEND = os.environ.get("PAGE_STORE_BACKEND", "redis") # "redis", or "disk" with PAGE_STORE_DIR on a volume shared with the orchestrator
+PAGE_STORE_DIR = os.environ.get("PAGE_STORE_DIR", "/data/pages")
+PAGE_STORE_TTL = 24 * 3600 # Seconds published pages are kept (redis backend)
+COMIC_PREVIEW_TTL = int(os.environ.get("COMIC_PREVIEW_TTL", 30 * 24 * 3600)) # Seconds a comic preview is kept after it was last served (redis backend)
+
 # Rate Limit constants (RL)
 RL_DALLEE_BATCH_SIZE = 5 #How many parallel calls(batch size) to the Image generation api
 RL_DALEE_WAIT_TIME = 60 #How many seconds to wait, before next batch of calls to Image generation api
@@ -34,3 +137,24 @@ FINAL_PAGE_HEIGHT = 1792
 FINAL_PAGE_WIDTH = 1024
 
 PS_TITLE_HEIGHT = 140
+ING_PANEL_SIZE = ((FINAL_PAGE_WIDTH * 22) // 80, (FINAL_PAGE_WIDTH * 22) // 80) # Ingredient art on the page, without its label
+INS_PANEL_SIZE = (int(1792 * 0.45), int(1024 * 0.45)) # Instruction art on the page, without its label
+ING_ROWS = 4 # Ingredients pages are a 3x4 grid = 12 per page
+ING_COLS = 3
+ING_PER_PAGE = ING_ROWS * ING_COLS
+INS_PER_PAGE = 3 # At most, instruction pages take fewer panels when multi-step labels make them taller
+
+# Page encoding (see shared/page_encoding.py). Full pages are JPEG because the gallery upload needs it. Quality 72
+# baseline is about 5% smaller than Pillow's default 75 at the same encode time, optimize trades ~2x encode time
+# for another ~5%
+PAGE_JPEG_QUALITY = int(os.environ.get("PAGE_JPEG_QUALITY", 72))
+PAGE_JPEG_OPTIMIZE = os.environ.get("PAGE_JPEG_OPTIMIZE", "0") == "1"
+PAGE_DERIVATIVE_WIDTHS = {"mid": 512, "thumb": 256} # Smaller copies of every page, made from the decoded page in the same pass
+PAGE_DERIVATIVE_FORMAT = os.environ.get("PAGE_DERIVATIVE_FORMAT", "JPEG") # "JPEG" or "WEBP"
+PAGE_ENCODE_WORKERS = 4 # Pillow releases the GIL while encoding, so pages are encoded on a small thread pool
+# Public address of the orchestrator. When set, a comic's preview_img_url points at its cover preview served by the
+# orchestrator instead of being looked up on Reddit after the upload
+PUBLIC_BASE_URL = os.environ.get("PUBLIC_BASE_URL", "").rstrip("/")
+
+# Intermediate image storage (see shared/image_store.py). Bytes kept in memory per workload before spilling to disk
+IMAGE_STORE_MEMORY_LIMIT_BYTES = int(os.environ.get("IMAGE_STORE_MEMORY_LIMIT_MB", 64)) * 1024 * 1024
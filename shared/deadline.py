@@ -0,0 +1,98 @@
+'''Per-workload deadlines and cooperative cancellation.
+
+POST /workloads stores an absolute deadline ("deadline_at") in the workload options. Every job binds it with
+deadline_context(), and the code inside takes its timeouts from what is left: HTTP and OpenAI calls get a
+per-call timeout, crew kickoffs are abandoned once the deadline passes (their agents use DeadlineLLM from
+shared/helpers.py, so the abandoned crew stops too), and stages check it before starting.
+Running out raises DeadlineExceeded, which the worker tasks turn into the FAILED_TIMEOUT status. The RQ
+job_timeout (remaining deadline plus a grace period) is the backstop for code that never checks.
+'''
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from .workload_options import get_workload_options
+from .constants import EXTERNAL_CALL_TIMEOUT_SECONDS, JOB_TIMEOUT_GRACE_SECONDS, WORKLOAD_DEADLINE_SECONDS
+
+class DeadlineExceeded(Exception):
+  pass
+
+class Deadline:
+  def __init__(self, expires_at):
+    self.expires_at = expires_at
+
+  def remaining(self):
+    return self.expires_at - time.time()
+
+  def check(self, what):
+    if self.remaining() <= 0:
+      raise DeadlineExceeded(f"[Application Exception] Workload deadline passed before {what}")
+
+# The deadline of the workload the current job belongs to. None means no deadline (e.g. workloads created
+# before deadlines existed)
+current_deadline = ContextVar("current_deadline", default=None)
+
+@contextmanager
+def deadline_context(workload_id):
+  deadline_at = get_workload_options(workload_id).get("deadline_at")
+  deadline = Deadline(deadline_at) if deadline_at else None
+  token = current_deadline.set(deadline)
+  try:
+    yield deadline
+  finally:
+    current_deadline.reset(token)
+
+def check_deadline(what):
+  deadline = current_deadline.get()
+  if deadline is not None:
+    deadline.check(what)
+
+# Timeout for one external call: the time left, capped at `cap`. Raises right away when nothing is left
+def call_timeout(what, cap=EXTERNAL_CALL_TIMEOUT_SECONDS):
+  deadline = current_deadline.get()
+  if deadline is None:
+    return cap
+  deadline.check(what)
+  return deadline.remaining() if cap is None else min(cap, deadline.remaining())
+
+# Sleeps unless the sleep would outlast the deadline, in which case there is no point in waiting
+def sleep_within_deadline(seconds, what):
+  deadline = current_deadline.get()
+  if deadline is not None and deadline.remaining() < seconds:
+    raise DeadlineExceeded(f"[Application Exception] Workload deadline would pass while waiting before {what}")
+  time.sleep(seconds)
+
+# Runs a call that has no timeout of its own (crew kickoffs) in a helper thread and stops waiting for it when
+# the deadline passes. This only stops waiting: the call itself must stop on the deadline too, which crews do
+# when their agents use DeadlineLLM (the in-flight request times out, and no request starts after the deadline
+# apart from the OpenAI client's own retries of that request). The thread is a daemon, so an abandoned call never
+# keeps the process from exiting
+def call_with_deadline(what, fn, *args, **kwargs):
+  deadline = current_deadline.get()
+  if deadline is None:
+    return fn(*args, **kwargs)
+  deadline.check(what)
+
+  outcome = {}
+  done = threading.Event()
+  context = contextvars.copy_context()
+  def run():
+    try:
+      outcome["result"] = context.run(fn, *args, **kwargs)
+    except BaseException as e:
+      outcome["error"] = e
+    finally:
+      done.set()
+  threading.Thread(target=run, name=f"deadline-{what}", daemon=True).start()
+
+  if not done.wait(timeout=max(0.0, deadline.remaining())):
+    raise DeadlineExceeded(f"[Application Exception] {what} did not finish before the workload deadline")
+  if "error" in outcome:
+    raise outcome["error"]
+  return outcome["result"]
+
+# RQ job_timeout for a job of a workload with this deadline
+def job_timeout_for(deadline_at):
+  remaining = deadline_at - time.time() if deadline_at else WORKLOAD_DEADLINE_SECONDS
+  return int(max(0, remaining)) + JOB_TIMEOUT_GRACE_SECONDS
@@ -0,0 +1,97 @@
+'''Adaptive degradation under comicgen backlog.
+
+When the comicgen queues back up, or the fleet has nearly used up its image rate-limit window, a workload trades
+fidelity for throughput. The decision is taken when ComicGenFlow starts writing prompts: the number of images is
+known by then, but none has been paid for. Each degradation kicks in at its own threshold (DEGRADATION_THRESHOLDS):
+  reuse_ingredient_art  ingredients whose art another workload generated recently reuse it instead of a new image
+  draft_tier            the draft quality tier, i.e. the smallest sizes the generation planner allows
+  merge_instructions    short consecutive steps share one panel, so there are fewer instruction images
+The degradations a workload received are kept in its workload options and counted in metrics.
+'''
+import json
+from .redis_client import redis_conn,comicgen_queue,comicgen_images_queue
+from .rate_limiter import rate_limit_usage
+from .panel_planner import panel_chars
+from .workload_options import update_workload_options
+from .metrics import DEGRADATIONS
+from .constants import (
+  DEGRADATION_MODE,
+  DEGRADATION_THRESHOLDS,
+  DEGRADE_SHORT_INSTRUCTION_CHARS,
+  DEGRADE_MERGED_INSTRUCTION_CHARS,
+  INGREDIENT_ART_TTL,
+  PANEL_MAX_STEPS,
+  RL_DALLEE_BATCH_SIZE,
+  RL_DALEE_WAIT_TIME,
+)
+
+# Fields of an ingredient image object that are enough to reuse its art
+INGREDIENT_ART_FIELDS = ("prompt", "url", "generation_model", "generation_size")
+
+# Current load: jobs waiting in the comicgen queues and the share of the image rate-limit window already used
+def backlog_pressure():
+  try:
+    queue_depth = comicgen_queue.count + comicgen_images_queue.count
+  except Exception as e:
+    print(f"[Warning] Failed to read the comicgen backlog, assuming none: {e}")
+    queue_depth = 0
+  return {
+    "queue_depth": queue_depth,
+    "rate_budget_used": rate_limit_usage("dalle_images", RL_DALLEE_BATCH_SIZE, RL_DALEE_WAIT_TIME),
+  }
+
+# Degradations to apply under `pressure`, mildest first
+def choose_degradations(pressure):
+  if DEGRADATION_MODE == "off":
+    return []
+  if DEGRADATION_MODE == "always":
+    return list(DEGRADATION_THRESHOLDS)
+  return [
+    degradation for degradation, threshold in DEGRADATION_THRESHOLDS.items()
+    if pressure["queue_depth"] >= threshold["queue_depth"] or pressure["rate_budget_used"] >= threshold["rate_budget_used"]
+  ]
+
+def record_degradations(workload_id, degradations, pressure):
+  for degradation in degradations:
+    DEGRADATIONS.labels(degradation).inc()
+  try:
+    update_workload_options(workload_id, degradations=degradations, degradation_pressure=pressure)
+  except Exception as e:
+    print(f"[Warning] Failed to record degradations for workload {workload_id}: {e}")
+
+# Joins runs of short consecutive single-step panels into one multi-step panel each, as long as the joined text
+# stays short. Returns the new instruction panels (see shared/panel_planner.py)
+def merge_short_instructions(instructions, panels):
+  merged = []
+  # Whether the last merged panel is made of short steps only
+  mergeable = False
+  for panel in panels:
+    chars = panel_chars(instructions, panel)
+    short = len(panel) == 1 and chars <= DEGRADE_SHORT_INSTRUCTION_CHARS
+    if (short and mergeable and len(merged[-1]) < PANEL_MAX_STEPS
+        and panel_chars(instructions, merged[-1]) + 1 + chars <= DEGRADE_MERGED_INSTRUCTION_CHARS):
+      merged[-1] = merged[-1] + panel
+    else:
+      merged.append(list(panel))
+    mergeable = short
+  return merged
+
+def _ingredient_art_key(name):
+  return f"ingredient_art:{' '.join(name.lower().split())}"
+
+# Offers freshly generated ingredient art to later workloads. Art that was itself reused must not be remembered
+# again, or its URL would be offered past its expiry
+def remember_ingredient_art(name, img_obj):
+  try:
+    redis_conn.set(_ingredient_art_key(name), json.dumps({field: getattr(img_obj, field) for field in INGREDIENT_ART_FIELDS}), ex=INGREDIENT_ART_TTL)
+  except Exception as e:
+    print(f"[Warning] Failed to remember ingredient art for {name}: {e}")
+
+# Returns the image object fields of recently generated art for this ingredient, or None
+def cached_ingredient_art(name):
+  try:
+    raw = redis_conn.get(_ingredient_art_key(name))
+  except Exception as e:
+    print(f"[Warning] Failed to read ingredient art for {name}: {e}")
+    return None
+  return json.loads(raw) if raw else None
@@ -0,0 +1,43 @@
+'''Redis state shared by the jobs of a fanned-out comic (see COMICGEN_EXECUTION_MODE).
+
+The planner job saves the prompts, each image sub-job saves its styled image bytes and generation metadata
+under the same names the ImageStore uses (ing-<n>, ins-<n>, page-0 for the composed cover), and the fan-in
+job reads everything back to merge and publish the comic.
+'''
+import json
+from .redis_client import redis_conn
+from .constants import FANOUT_STATE_TTL
+
+def _key(workload_id, part):
+  return f"workload:{workload_id}:fanout:{part}"
+
+def save_fanout_plan(workload_id, plan):
+  redis_conn.set(_key(workload_id, "plan"), json.dumps(plan), ex=FANOUT_STATE_TTL)
+
+def get_fanout_plan(workload_id):
+  raw = redis_conn.get(_key(workload_id, "plan"))
+  if raw is None:
+    raise KeyError(f"[Application Exception] No fan-out plan found for workload {workload_id}")
+  return json.loads(raw)
+
+# Safe to call again for the same image when a retried sub-job succeeds, the later write wins
+def save_image_result(workload_id, name, data, meta):
+  pipe = redis_conn.pipeline()
+  pipe.hset(_key(workload_id, "images"), name, data)
+  pipe.hset(_key(workload_id, "meta"), name, json.dumps(meta))
+  pipe.expire(_key(workload_id, "images"), FANOUT_STATE_TTL)
+  pipe.expire(_key(workload_id, "meta"), FANOUT_STATE_TTL)
+  pipe.execute()
+
+def has_image_result(workload_id, name):
+  return bool(redis_conn.hexists(_key(workload_id, "meta"), name))
+
+def get_image_meta(workload_id):
+  raw = redis_conn.hgetall(_key(workload_id, "meta"))
+  return {name.decode(): json.loads(value) for name, value in raw.items()}
+
+def get_image_bytes(workload_id, name):
+  return redis_conn.hget(_key(workload_id, "images"), name)
+
+def clear_fanout_state(workload_id):
+  redis_conn.delete(_key(workload_id, "plan"), _key(workload_id, "images"), _key(workload_id, "meta"))
@@ -1,17 +1,27 @@
 from pydantic import BaseModel
 import json
-from openai import RateLimitError, APIError
+from openai import OpenAI, RateLimitError, APIError
+from crewai import LLM
+from crewai.utilities.llm_utils import create_llm
+from functools import lru_cache
 from PIL import Image,ImageFont,ImageDraw,ImageOps
 import requests
 from io import BytesIO
-from pathlib import Path
 import textwrap
 import praw
 import tempfile
 import os
 import html
+import time
+import threading
 from .supabase_client import supabase
-from .constants import ING_IMAGE_SIZE,INS_IMAGE_SIZE,POSTER_IMAGE_SIZE,FINAL_PAGE_WIDTH,PS_TITLE_HEIGHT
+from .metrics import external_call
+from .workload_cache import refresh_workload_cache
+from .constants import FINAL_PAGE_WIDTH,FINAL_PAGE_HEIGHT,PS_TITLE_HEIGHT,FONTS_DIR,ING_ROWS,ING_COLS,ING_PANEL_SIZE,INS_PANEL_SIZE,DEFAULT_QUALITY_TIER,SINGLEFLIGHT_IMAGE_TTL,RL_DALLEE_BATCH_SIZE,RL_DALEE_WAIT_TIME,WORKLOAD_STATUSES
+from .size_planner import plan_generation
+from .singleflight import singleflight
+from .rate_limiter import acquire_rate_limit,record_rate_limit_usage
+from .deadline import call_timeout,check_deadline
 
 
 # Function will print Flow state in prettified format
@@ -21,53 +31,162 @@ def print_state(state):
       for k, v in state.items()
   }
   print("\n\nState Updated -")
-  print(json.dumps(state_dict, indent=2))
+  print(json.dumps(state_dict, indent=2, default=str))
+
+# One OpenAI client per process. Warm workers create it before forking so jobs do not rebuild it
+_openai_client = None
+
+def get_openai_client():
+  global _openai_client
+  if _openai_client is None:
+    _openai_client = OpenAI()
+  return _openai_client
+
+# crewAI LLM whose every request times out at the workload deadline and which starts no request after it (see
+# shared/deadline.py). A crew that call_with_deadline stopped waiting for thus fails its next LLM call instead of
+# spending tokens on the rest of its tasks in the background
+class DeadlineLLM(LLM):
+  def call(self, *args, **kwargs):
+    self.timeout = call_timeout("llm_call", cap=None)
+    return super().call(*args, **kwargs)
+
+# LLM for the flow agents: crewAI's default model and settings from the environment, bounded by the deadline
+def deadline_llm():
+  default_llm = create_llm()
+  return DeadlineLLM(model=default_llm.model, api_key=default_llm.api_key, base_url=default_llm.base_url, api_base=default_llm.api_base)
+
+# Fonts from FONTS_DIR are parsed once per process and reused by every page
+@lru_cache(maxsize=None)
+def load_font(file_name, size):
+  font_path = os.path.join(FONTS_DIR, file_name)
+  if not os.path.exists(font_path):
+    raise FileNotFoundError(f"Font file not found at {font_path}.")
+  try:
+    return ImageFont.truetype(font_path, size)
+  except:
+    return ImageFont.load_default()
+
+# Marks a workload FAILED_ERROR after an unexpected error in one of its jobs. Workloads that already ended are left
+# alone, e.g. a flow that set FAILED_NOT_RECIPE before raising. Never raises, it runs in the jobs' error handlers
+def workload_failed(workload_id):
+  running = [status for status in WORKLOAD_STATUSES.values() if not status.startswith(("FAILED", "COMPLETED"))]
+  try:
+    with external_call("supabase_status_write"):
+      db_response = supabase.table("workloads").update({"status": WORKLOAD_STATUSES['failed_error']}).eq("id", workload_id).in_("status", running).execute()
+    refresh_workload_cache(db_response.data)
+  except Exception as e:
+    print(f"[Warning] Failed to mark workload {workload_id} as failed: {e}")
 
 # Workload status update
 def workload_status_update(workload_id,new_status):
   try:
-    supabase.table("workloads").update({"status": new_status}).eq("id", workload_id).execute()
+    with external_call("supabase_status_write"):
+      db_response = supabase.table("workloads").update({"status": new_status}).eq("id", workload_id).execute()
   except Exception as e:
     raise Exception(f"\n[System Error] Failed to update status on DB: {e}")
+  refresh_workload_cache(db_response.data)
   
 # Function will recieve an image object with a prompt and a type. It will dynamically call dalle api and add the generated url to the input image object
-def dalle_api_call(imageObj,client):
-
-  if imageObj.type == "ING":
-    size = ING_IMAGE_SIZE
-  elif imageObj.type == "INS":
-    size = INS_IMAGE_SIZE
-  elif imageObj.type == "POSTER":
-    size = POSTER_IMAGE_SIZE
+# The model and size come from the generation planner for the workload's quality tier
+# fleet_rate_limited is set by fan-out image sub-jobs, which share the image API budget through Redis instead
+# of pacing their own batches
+def dalle_api_call(imageObj,client,quality_tier=DEFAULT_QUALITY_TIER,fleet_rate_limited=False):
+  plan = plan_generation(imageObj.type, quality_tier)
+  imageObj.generation_model = plan["model"]
+  imageObj.generation_size = plan["size"]
   
-  try:
-    response = client.images.generate(model="dall-e-3",
-      prompt=imageObj.prompt,
-      n=1,
-      size=size)
-    
+  def generate():
+    if fleet_rate_limited:
+      acquire_rate_limit("dalle_images", RL_DALLEE_BATCH_SIZE, RL_DALEE_WAIT_TIME)
+    else:
+      record_rate_limit_usage("dalle_images", RL_DALEE_WAIT_TIME)
+    try:
+      with external_call("dalle_images_generate"):
+        response = client.images.generate(model=plan["model"],
+          prompt=imageObj.prompt,
+          n=1,
+          size=plan["size"],
+          timeout=call_timeout("dalle_images_generate"))
+    except (RateLimitError,APIError) as e:
+      raise Exception(f"[Application Exception] msg {e}")
+
     if not response.data:
       raise ValueError(f"[Application Exception] No data in dalle API response: ",response)
+    return response.data[0].url
 
-    # Assign the generated url to its respective image object
-    imageObj.url = response.data[0].url 
+  # Identical prompts at the same model and size (e.g. a shared ingredient prompt) are generated once across workloads
+  url = singleflight("dalle_image", [plan["model"], plan["size"], imageObj.prompt], generate, result_ttl=SINGLEFLIGHT_IMAGE_TTL)
 
-    return response.data[0].url 
-  except (RateLimitError,APIError) as e:
-    raise Exception(f"[Application Exception] msg {e}")
+  # Assign the generated url to its respective image object
+  imageObj.url = url
+  return url
   
 
-# This function will download the generated ING images and save them as PIL. And resize + add labels to them
+# Downloads a generated image and records its size and download time on the image object for the savings report
+def download_image(img_obj):
+  started = time.perf_counter()
+  with external_call("image_download"):
+    response = requests.get(img_obj.url, stream=True, timeout=call_timeout("image_download"))
+    content = response.content
+  img_obj.download_bytes = len(content)
+  img_obj.download_seconds = time.perf_counter() - started
+  return Image.open(BytesIO(content))
+
+# Resizes generated art to the size it takes on the page. Draft tier images can have another aspect ratio
+# (center-cropped) or be smaller than the target (upscaled)
+def fit_to_panel(raw_img, size):
+  if abs(raw_img.width / raw_img.height - size[0] / size[1]) < 0.02:
+    return raw_img.resize(size)
+  return ImageOps.fit(raw_img, size)
+
+ING_LABEL_PADDING_X = 6
+MIN_LABEL_FONT_SIZE = 16
+
+def _text_width(font, text):
+  bbox = font.getbbox(text)
+  return bbox[2] - bbox[0]
+
+# Largest font up to `size` in which every text fits max_width, no smaller than MIN_LABEL_FONT_SIZE
+def fit_label_font(file_name, size, texts, max_width):
+  font = load_font(file_name, size)
+  while size > MIN_LABEL_FONT_SIZE and any(_text_width(font, text) > max_width for text in texts):
+    size -= 1
+    font = load_font(file_name, size)
+  return font
+
+# Cuts text short with an ellipsis when it does not fit max_width
+def truncate_to_width(text, font, max_width):
+  if _text_width(font, text) <= max_width:
+    return text
+  while text and _text_width(font, text + "…") > max_width:
+    text = text[:-1]
+  return text.rstrip() + "…"
+
+# Word-wraps text into at most max_lines lines of max_width, the last line cut short if the text does not fit
+def wrap_to_width(text, font, max_width, max_lines):
+  lines = []
+  words = text.split()
+  while words and len(lines) < max_lines:
+    line = words.pop(0)
+    while words and _text_width(font, f"{line} {words[0]}") <= max_width:
+      line = f"{line} {words.pop(0)}"
+    lines.append(line)
+  if words:
+    lines[-1] = truncate_to_width(f"{lines[-1]} {' '.join(words)}", font, max_width)
+  return [truncate_to_width(line, font, max_width) for line in lines]
+
+# This function will download the generated ING images as PIL, resize + add labels to them and return the styled image
 def style_ing_image(img_obj,ing_obj):
-  response = requests.get(img_obj.url, stream=True)
-  raw_img = Image.open(BytesIO(response.content))
+  raw_img = download_image(img_obj)
   LABEL_HEIGHT = 80
   LABEL_COLOR = (135, 206, 250)  # Sky blue
   BORDER_SIZE = 2
 
   # Scale down image
-  new_width = (FINAL_PAGE_WIDTH * 22) // 80
-  resized_img = raw_img.resize((new_width, new_width))
+  new_width = ING_PANEL_SIZE[0]
+  resized_img = fit_to_panel(raw_img, ING_PANEL_SIZE)
+  # The full size decode is not needed past this point
+  raw_img.close()
 
   # Add label text
   labled_img = Image.new("RGB", (new_width, new_width + LABEL_HEIGHT), color=(255, 255, 255))
@@ -76,17 +195,13 @@ def style_ing_image(img_obj,ing_obj):
   draw.rectangle([0, 0, new_width, LABEL_HEIGHT], fill=LABEL_COLOR)
   draw.rectangle([0, LABEL_HEIGHT - BORDER_SIZE, new_width, LABEL_HEIGHT],fill="black")
 
-  patrick_font_path = "/app/fonts/PatrickHand.ttf"
-  if not os.path.exists(patrick_font_path):
-    raise FileNotFoundError(f"Font file not found at {patrick_font_path}.")
-  patrick_font = Path(patrick_font_path)
-  try:
-    font = ImageFont.truetype(str(patrick_font), 25)
-  except:
-    font = ImageFont.load_default()
-  # Split text into two lines
+  # Split text into two lines. Combined panels of minor ingredients list several names and quantities, which
+  # get a smaller font
   name_text = f'{ing_obj.name}'
   quantity_text = f'({ing_obj.quantity})'
+  font = fit_label_font("PatrickHand.ttf", 25, [name_text, quantity_text], new_width - 2 * ING_LABEL_PADDING_X)
+  name_text = truncate_to_width(name_text, font, new_width - 2 * ING_LABEL_PADDING_X)
+  quantity_text = truncate_to_width(quantity_text, font, new_width - 2 * ING_LABEL_PADDING_X)
 
   # Measure each line
   name_bbox = font.getbbox(name_text)
@@ -108,32 +223,25 @@ def style_ing_image(img_obj,ing_obj):
 
   bordered_image = ImageOps.expand(labled_img, border=BORDER_SIZE, fill="black")
 
-  img_obj.styled_image = bordered_image  
+  return bordered_image
 
-# This function will download the generated INS images and save them as PIL. And resize + add text to them
+# This function will download the generated INS images as PIL, resize + add text to them and return the styled image
 def style_ins_image(img_obj,ins_text,step_num):
-  response = requests.get(img_obj.url, stream=True)
-  raw_img = Image.open(BytesIO(response.content))
+  raw_img = download_image(img_obj)
 
   BASE_LABEL_HEIGHT = 50
   LABEL_COLOR = (135, 206, 250)  # Sky blue
   BORDER_SIZE = 2
-  SCALE_DOWN_FACTOR = 0.45
   MAX_LABEL_HEIGHT = 80
   LINE_SPACING = 6
   TEXT_PADDING_X = 10
 
-  # Scale down image
-  new_width = int(raw_img.width * SCALE_DOWN_FACTOR)
-  new_height = int(raw_img.height * SCALE_DOWN_FACTOR)
-  resized_img = raw_img.resize((new_width, new_height))
+  # Scale down image (to 45% of a standard 1792x1024 image)
+  new_width, new_height = INS_PANEL_SIZE
+  resized_img = fit_to_panel(raw_img, INS_PANEL_SIZE)
+  raw_img.close()
 
-  # Load font
-  patrick_font = Path(__file__).resolve().parent / "assets" / "PatrickHand.ttf"
-  try:
-    font = ImageFont.truetype(str(patrick_font), 25)
-  except:
-    font = ImageFont.load_default()
+  font = load_font("PatrickHand.ttf", 25)
 
   full_text = f"Step {step_num}: {ins_text}"
 
@@ -193,7 +301,54 @@ def style_ins_image(img_obj,ins_text,step_num):
   labled_img.paste(resized_img, (0, 0))
   bordered_image = ImageOps.expand(labled_img, border=BORDER_SIZE, fill="black")
 
-  img_obj.styled_image = bordered_image
+  return bordered_image
+
+# Label of a multi-step panel: every step on its own lines, so the label height only depends on the number of steps
+MULTI_STEP_LINES_PER_STEP = 2
+MULTI_STEP_LINE_HEIGHT = 30
+MULTI_STEP_LABEL_PADDING = 10
+
+# Height of a styled instruction panel with `step_count` steps, the most style_ins_image/style_multi_step_image can
+# return. Instruction pages are planned with it before any image exists
+def ins_panel_height(step_count):
+  BORDER_SIZE = 2
+  if step_count == 1:
+    label_height = 80 # MAX_LABEL_HEIGHT of style_ins_image
+  else:
+    label_height = 2 * MULTI_STEP_LABEL_PADDING + step_count * MULTI_STEP_LINES_PER_STEP * MULTI_STEP_LINE_HEIGHT
+  return INS_PANEL_SIZE[1] + label_height + 2 * BORDER_SIZE
+
+# Styles a panel that shows several consecutive steps: the art with a taller label listing each step by number
+def style_multi_step_image(img_obj, steps, first_step_num):
+  raw_img = download_image(img_obj)
+  LABEL_COLOR = (135, 206, 250)  # Sky blue
+  BORDER_SIZE = 2
+  TEXT_PADDING_X = 10
+
+  new_width, new_height = INS_PANEL_SIZE
+  resized_img = fit_to_panel(raw_img, INS_PANEL_SIZE)
+  raw_img.close()
+
+  font = load_font("PatrickHand.ttf", 25)
+  available_width = new_width - 2 * TEXT_PADDING_X
+  lines = []
+  for offset, step in enumerate(steps):
+    lines += wrap_to_width(f"{first_step_num + offset}. {step.strip()}", font, available_width, MULTI_STEP_LINES_PER_STEP)
+
+  label_height = ins_panel_height(len(steps)) - new_height - 2 * BORDER_SIZE
+  labled_img = Image.new("RGB", (new_width, new_height + label_height), color=(255, 255, 255))
+  draw = ImageDraw.Draw(labled_img)
+  draw.rectangle([0, new_height, new_width, new_height + label_height], fill=LABEL_COLOR)
+  draw.rectangle([0, new_height, new_width, new_height + BORDER_SIZE], fill="black")
+
+  # Lines are centered as a block, steps that wrapped to one line leave the spare room below
+  text_y = new_height + (label_height - len(lines) * MULTI_STEP_LINE_HEIGHT) // 2
+  for line in lines:
+    draw.text((TEXT_PADDING_X, text_y), line, fill=(0, 0, 0), font=font)
+    text_y += MULTI_STEP_LINE_HEIGHT
+
+  labled_img.paste(resized_img, (0, 0))
+  return ImageOps.expand(labled_img, border=BORDER_SIZE, fill="black")
 
 def draw_page_title(draw, title):
   TITLE_HEIGHT = PS_TITLE_HEIGHT
@@ -202,11 +357,6 @@ def draw_page_title(draw, title):
   TITLE_BORDER_COLOR = (0, 0, 0)     # Black
   TITLE_BORDER_THICKNESS = 4
 
-  pattaya_font_path = "/app/fonts/Pattaya.ttf"
-  if not os.path.exists(pattaya_font_path):
-    raise FileNotFoundError(f"Font file not found at {pattaya_font_path}.")
-  pattaya_font = Path(pattaya_font_path)
-
   # Full-width rectangle (title background)
   rect_x0 = 0
   rect_y0 = 0
@@ -220,10 +370,7 @@ def draw_page_title(draw, title):
   draw.rectangle([rect_x0, border_y0, rect_x1, border_y1], fill=TITLE_BORDER_COLOR)
 
   # Load custom font
-  try:
-    font = ImageFont.truetype(str(pattaya_font), 46)
-  except:
-    font = ImageFont.load_default()
+  font = load_font("Pattaya.ttf", 46)
 
   # Center the title
   bbox = font.getbbox(title)
@@ -233,37 +380,160 @@ def draw_page_title(draw, title):
 
   draw.text((text_x, text_y), title, fill=TITLE_TEXT_COLOR, font=font)
 
+# Draws the recipe title overlay on top of the generated poster image and returns the cover page
+def compose_cover_page(raw_img, title):
+  # Create a copy to draw on. Draft tier posters are generated smaller and are fitted to the page first
+  if raw_img.size == (FINAL_PAGE_WIDTH, FINAL_PAGE_HEIGHT):
+    poster_with_overlay = raw_img.copy()
+  else:
+    poster_with_overlay = fit_to_panel(raw_img.convert("RGB"), (FINAL_PAGE_WIDTH, FINAL_PAGE_HEIGHT))
+  draw = ImageDraw.Draw(poster_with_overlay)
+
+  # Overlay rectangle settings
+  OVERLAY_WIDTH = int(FINAL_PAGE_WIDTH * 0.7)
+  OVERLAY_HEIGHT = 240
+  OVERLAY_MARGIN_BOTTOM = 300
+  OVERLAY_COLOR = (135, 206, 250)
+  BORDER_THICKNESS = 4
+  BORDER_COLOR = (0, 0, 0)
+
+  # Calculate position
+  rect_x0 = (FINAL_PAGE_WIDTH - OVERLAY_WIDTH) // 2
+  rect_y1 = FINAL_PAGE_HEIGHT - OVERLAY_MARGIN_BOTTOM
+  rect_y0 = rect_y1 - OVERLAY_HEIGHT
+  rect_x1 = rect_x0 + OVERLAY_WIDTH
+
+  # Draw overlay background
+  draw.rectangle([rect_x0, rect_y0, rect_x1, rect_y1], fill=OVERLAY_COLOR)
+
+  # Draw solid black border (4 sides manually to match "solid border")
+  for i in range(BORDER_THICKNESS):
+    draw.rectangle(
+      [rect_x0 - i, rect_y0 - i, rect_x1 + i, rect_y1 + i],
+      outline=BORDER_COLOR
+    )
+
+  # Load and draw text
+  font = load_font("Pattaya.ttf", 68)
+
+  # First line: main title
+  bbox1 = font.getbbox(title)
+  text1_w, text1_h = bbox1[2] - bbox1[0], bbox1[3] - bbox1[1]
+  text1_x = rect_x0 + (OVERLAY_WIDTH - text1_w) // 2
+  text1_y = rect_y0 + 20  # Top margin from inside the rectangle
+
+  draw.text((text1_x, text1_y), title, fill=(0, 0, 0), font=font)
+
+  subtitle_font = load_font("Pattaya.ttf", 48)
+  bbox2 = subtitle_font.getbbox("(Recipe Book)")
+  text2_w, text2_h = bbox2[2] - bbox2[0], bbox2[3] - bbox2[1]
+  text2_x = rect_x0 + (OVERLAY_WIDTH - text2_w) // 2
+  text2_y = text1_y + text1_h + 10
+
+  draw.text((text2_x, text2_y), "(Recipe Book)", fill=(0, 0, 0), font=subtitle_font)
+
+  return poster_with_overlay
+
+# Lays out up to ING_ROWS x ING_COLS styled ingredient images on one page
+def compose_ingredient_page(styled_images):
+  # All styled ingredient images are the same size, use any random one to get the dimensions
+  ing_width, ing_height = styled_images[0].width, styled_images[0].height
+
+  # Calculate how much empty space will be left and divide it evenly (space-evenly logic)
+  total_img_width = ING_COLS * ing_width
+  total_img_height = ING_ROWS * ing_height
+  total_h_space = FINAL_PAGE_WIDTH - total_img_width
+  h_gap = total_h_space / (ING_COLS + 1)
+  total_v_space = (FINAL_PAGE_HEIGHT - PS_TITLE_HEIGHT) - total_img_height
+  v_gap = total_v_space / (ING_ROWS + 1)
+
+  # Create a new blank white page
+  page = Image.new("RGB", (FINAL_PAGE_WIDTH, FINAL_PAGE_HEIGHT), color="white")
+  draw = ImageDraw.Draw(page)
+  draw_page_title(draw, "Ingredients")
+
+  for idx, img in enumerate(styled_images):
+    row = idx // ING_COLS
+    col = idx % ING_COLS
+
+    x = int(h_gap + col * (ing_width + h_gap))
+    y = int(PS_TITLE_HEIGHT + v_gap + row * (ing_height + v_gap))
+
+    page.paste(img, (x, y))
+
+  return page
+
+# Stacks the styled instruction images of one page (see ComicGenFlow.page_layout), spaced evenly
+def compose_instruction_page(styled_images):
+  # Create blank page
+  page = Image.new("RGB", (FINAL_PAGE_WIDTH, FINAL_PAGE_HEIGHT), color=(255, 255, 255))
+  draw = ImageDraw.Draw(page)
+  draw_page_title(draw, "Instructions")
+
+  # Calculate layout
+  available_height = FINAL_PAGE_HEIGHT - PS_TITLE_HEIGHT
+  total_imgs_height = sum(img.height for img in styled_images)
+  num_gaps = len(styled_images) + 1  # space above, between, and below
+  gap_height = (available_height - total_imgs_height) // num_gaps
+
+  # Start placing images
+  current_y = PS_TITLE_HEIGHT + gap_height
+  for img in styled_images:
+    x = (FINAL_PAGE_WIDTH - img.width) // 2  # center horizontally
+    page.paste(img, (x, current_y))
+    current_y += img.height + gap_height
+
+  return page
+
+# One Reddit client per process, created on first use and shared by the uploads and preview fetches of every
+# flow (the batch runner runs many at once). Creating it makes no request, praw authenticates lazily
+_reddit_client = None
+_reddit_client_lock = threading.Lock()
+
+def get_reddit_client():
+  global _reddit_client
+  with _reddit_client_lock:
+    if _reddit_client is None:
+      _reddit_client = praw.Reddit(
+        client_id=os.environ.get("REDDIT_CLIENT_ID"),
+        client_secret=os.environ.get("REDDIT_SECRET"),
+        username="No-Advisor9169",
+        password=os.environ.get("REDDIT_ACCOUNT_PASSWORD"),
+        user_agent="RecipeComicGenGallery/0.1 by u/No-Advisor9169"
+      )
+  return _reddit_client
+
 def upload_comic_to_reddit(pil_images,recipe_name):
 
-  reddit = praw.Reddit(
-    client_id=os.environ.get("REDDIT_CLIENT_ID"),             
-    client_secret=os.environ.get("REDDIT_SECRET"),     
-    username="No-Advisor9169",              
-    password=os.environ.get("REDDIT_ACCOUNT_PASSWORD"),        
-    user_agent="RecipeComicGenGallery/0.1 by u/No-Advisor9169"
-  )
+  reddit = get_reddit_client()
 
   # Subreddit to post to
   subreddit = reddit.subreddit("RecipeComicGenGallery")
 
-  # Save PIL images to temporary files
+  # Save PIL images (or already encoded JPEG bytes) to temporary files
   temp_files = []
   for idx, img in enumerate(pil_images):
     temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
-    img.save(temp_file, format="JPEG")
+    if isinstance(img, bytes):
+      temp_file.write(img)
+    else:
+      img.save(temp_file, format="JPEG")
     temp_file.close()  
     temp_files.append({"image_path": temp_file.name, "caption": f"Page {idx + 1}"})
 
   post_title = recipe_name + " - Recipe book"
+  # praw has its own request timeouts, so only make sure the upload does not start after the deadline
+  check_deadline("reddit_upload")
   # Submit gallery post 
-  submission = subreddit.submit_gallery(
-    title=post_title,
-    images=temp_files,
-    nsfw=False,       # Optional: mark NSFW
-    spoiler=False,    # Optional: mark Spoiler
-    flair_id=None,    # Optional: add a flair ID
-    flair_text=None   # Optional: set flair text
-  )
+  with external_call("reddit_upload"):
+    submission = subreddit.submit_gallery(
+      title=post_title,
+      images=temp_files,
+      nsfw=False,       # Optional: mark NSFW
+      spoiler=False,    # Optional: mark Spoiler
+      flair_id=None,    # Optional: add a flair ID
+      flair_text=None   # Optional: set flair text
+    )
 
   print("Comic uploaded to reddit ✅")
 
@@ -274,17 +544,13 @@ def upload_comic_to_reddit(pil_images,recipe_name):
   return submission.url
 
 def get_reddit_preview_image(submission_id: str) -> str | None:
-  reddit = praw.Reddit(
-    client_id=os.environ.get("REDDIT_CLIENT_ID"),             
-    client_secret=os.environ.get("REDDIT_SECRET"),     
-    username="No-Advisor9169",              
-    password=os.environ.get("REDDIT_ACCOUNT_PASSWORD"),        
-    user_agent="RecipeComicGenGallery/0.1 by u/No-Advisor9169"
-  )
+  reddit = get_reddit_client()
 
   try:
-    submission = reddit.submission(id=submission_id)
-    if hasattr(submission, "media_metadata"):
+    with external_call("reddit_preview_fetch"):
+      submission = reddit.submission(id=submission_id)
+      has_media = hasattr(submission, "media_metadata")
+    if has_media:
       media = submission.media_metadata
       first_media_id = list(submission.gallery_data['items'])[0]['media_id']
       url = media[first_media_id]['s']['u']
@@ -0,0 +1,111 @@
+'''Per-workload store for intermediate images (styled images and composed pages).
+
+Images are kept as encoded bytes instead of live PIL objects. Once a workload's in-memory bytes reach its
+budget, further images are spilled to temp files and read back through mmap, so a large recipe cannot grow
+a worker's footprint past the budget. Flow state only holds the returned reference strings.
+'''
+import mmap
+import os
+import tempfile
+import threading
+from io import BytesIO
+from PIL import Image
+from .constants import IMAGE_STORE_MEMORY_LIMIT_BYTES
+
+MEMORY_PREFIX = "mem:"
+FILE_PREFIX = "file:"
+
+class ImageStore:
+  def __init__(self, workload_id, memory_limit_bytes=IMAGE_STORE_MEMORY_LIMIT_BYTES, spill_dir=None):
+    self.workload_id = workload_id
+    self.memory_limit_bytes = memory_limit_bytes
+    self.spill_dir = spill_dir
+    self.lock = threading.Lock()
+    self.blobs = {}
+    self.spilled = {}
+    self.memory_bytes = 0
+    self.peak_memory_bytes = 0
+    self.spilled_bytes = 0
+
+  # Encodes the image and returns a reference that can be stored in flow state. PNG at compress_level 1 is
+  # lossless and cheap to encode. Finished pages are encoded by shared/page_encoding.py and stored with put_bytes,
+  # so their bytes can be uploaded as-is. The image itself can be dropped by the caller afterwards
+  def put(self, name, img, format="PNG"):
+    buffer = BytesIO()
+    if format == "PNG":
+      img.save(buffer, format="PNG", compress_level=1)
+    else:
+      img.save(buffer, format=format)
+    return self.put_bytes(name, buffer.getvalue(), format)
+
+  # Stores already encoded image bytes (e.g. produced by another job) and returns their reference
+  def put_bytes(self, name, data, format="PNG"):
+    with self.lock:
+      self._discard(name)
+      if self.memory_bytes + len(data) <= self.memory_limit_bytes:
+        self.blobs[name] = data
+        self.memory_bytes += len(data)
+        self.peak_memory_bytes = max(self.peak_memory_bytes, self.memory_bytes)
+        return MEMORY_PREFIX + name
+
+    fd, path = tempfile.mkstemp(prefix=f"workload-{self.workload_id}-", suffix=f".{format.lower()}", dir=self.spill_dir)
+    with os.fdopen(fd, "wb") as f:
+      f.write(data)
+    with self.lock:
+      self.spilled[name] = path
+      self.spilled_bytes += len(data)
+    return FILE_PREFIX + name
+
+  # Returns the encoded bytes behind a reference
+  def get_bytes(self, ref):
+    if ref.startswith(MEMORY_PREFIX):
+      with self.lock:
+        return self.blobs[ref[len(MEMORY_PREFIX):]]
+    if ref.startswith(FILE_PREFIX):
+      with self.lock:
+        path = self.spilled[ref[len(FILE_PREFIX):]]
+      with open(path, "rb") as f:
+        return f.read()
+    raise KeyError(f"[Application Exception] Unknown image reference: {ref}")
+
+  # Decodes a stored image. The returned image is fully loaded and independent of the store
+  def open(self, ref):
+    if ref.startswith(MEMORY_PREFIX):
+      img = Image.open(BytesIO(self.get_bytes(ref)))
+      img.load()
+      return img
+
+    if ref.startswith(FILE_PREFIX):
+      with self.lock:
+        path = self.spilled[ref[len(FILE_PREFIX):]]
+      with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        img = Image.open(mapped)
+        img.load()
+      return img
+
+    raise KeyError(f"[Application Exception] Unknown image reference: {ref}")
+
+  # Frees the bytes (or spill file) behind a reference once nothing needs it anymore
+  def release(self, ref):
+    with self.lock:
+      self._discard(ref.split(":", 1)[1])
+
+  def _discard(self, name):
+    data = self.blobs.pop(name, None)
+    if data is not None:
+      self.memory_bytes -= len(data)
+    path = self.spilled.pop(name, None)
+    if path is not None and os.path.exists(path):
+      os.remove(path)
+
+  def close(self):
+    with self.lock:
+      for name in list(self.blobs) + list(self.spilled):
+        self._discard(name)
+
+  def stats(self):
+    return {
+      "memory_bytes": self.memory_bytes,
+      "peak_memory_bytes": self.peak_memory_bytes,
+      "spilled_bytes": self.spilled_bytes,
+    }
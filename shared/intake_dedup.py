@@ -0,0 +1,166 @@
+'''Idempotent workload intake.
+
+Double-clicks, client retries and repeated shares of a recipe would each create a workload and pay for the same
+LLM and image work. Before POST /workloads creates anything it claims up to two Redis keys with SET NX, each kept
+for INTAKE_DEDUP_WINDOW:
+  intake:key:<digest>      the client's Idempotency-Key (header, or "idempotency_key" in the body), if it sent one
+  intake:content:<digest>  the recipe text with its whitespace normalized, and the submission's options (quality
+                           tier, deadline, profiling), so a resubmission with other options gets its own workload
+A claim holds no public id while the first submission creates its workload, then that workload's public id. A
+duplicate gets the public id back without a new row or preprocess job. Once the workload has failed, the next
+duplicate takes the claim over and starts afresh. Without Redis every submission creates its own workload.
+'''
+import hashlib
+import json
+import time
+import uuid
+from redis.exceptions import WatchError
+from .redis_client import redis_conn
+from .workload_cache import get_workload_body
+from .metrics import INTAKE_SUBMISSIONS
+from .constants import INTAKE_DEDUP_WINDOW,INTAKE_PENDING_WAIT
+
+# The Idempotency-Key was used before for a different recipe
+class IdempotencyKeyConflict(Exception):
+  pass
+
+# The first submission is still creating its workload after INTAKE_PENDING_WAIT
+class IntakePending(Exception):
+  pass
+
+def _digest(value):
+  return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+# `options` holds every submitted option that changes the workload, e.g. {"quality_tier": ..., "deadline_seconds": ...}
+def content_digest(input_text, options):
+  return _digest([" ".join(input_text.split()), options])
+
+class IntakeClaim:
+  def __init__(self, idempotency_key, input_text, options):
+    self.token = uuid.uuid4().hex
+    self.content = content_digest(input_text, options)
+    self.keys = []
+    if idempotency_key:
+      self.keys.append(("key", f"intake:key:{_digest(idempotency_key)}"))
+    self.keys.append(("content", f"intake:content:{self.content}"))
+    # Keys this submission holds, pointed at its workload by complete_intake
+    self.owned = []
+    # Set when the submission is a duplicate
+    self.public_id = None
+
+  def value(self, public_id=None):
+    return json.dumps({"token": self.token, "content": self.content, "public_id": public_id})
+
+# Workloads that failed (or whose row is gone) do not take duplicates. Workers set FAILED_ERROR on unexpected
+# errors, so a crashed workload is resubmittable as well
+def _failed(public_id):
+  body = get_workload_body(public_id)
+  return body is None or json.loads(body)["status"].startswith("FAILED")
+
+# Replaces the claim of a failed workload, unless another duplicate got to it first
+def _take_over(key, raw, value):
+  try:
+    with redis_conn.pipeline() as pipe:
+      pipe.watch(key)
+      if pipe.get(key) != raw:
+        return False
+      pipe.multi()
+      pipe.set(key, value, ex=INTAKE_DEDUP_WINDOW)
+      pipe.execute()
+      return True
+  except WatchError:
+    return False
+
+# Claims one key. Returns None once it is owned, or the public id of the workload already holding it
+def _claim_key(claim, kind, key):
+  wait_until = time.monotonic() + INTAKE_PENDING_WAIT
+  poll_interval = 0.05
+  while True:
+    if redis_conn.set(key, claim.value(), nx=True, ex=INTAKE_DEDUP_WINDOW):
+      claim.owned.append(key)
+      return None
+    raw = redis_conn.get(key)
+    if raw is None:
+      # Expired in between
+      continue
+    current = json.loads(raw)
+    if kind == "key" and current["content"] != claim.content:
+      raise IdempotencyKeyConflict("Idempotency-Key was already used for a different recipe or different options")
+    if current["public_id"]:
+      if not _failed(current["public_id"]):
+        return current["public_id"]
+      if _take_over(key, raw, claim.value()):
+        claim.owned.append(key)
+        return None
+      continue
+    if time.monotonic() >= wait_until:
+      raise IntakePending("A submission of this recipe is still being created, retry shortly")
+    time.sleep(poll_interval)
+    poll_interval = min(poll_interval * 2, 0.5)
+
+# Sets (or with value None deletes) a key of the claim, unless it no longer holds the claim: it expired, or another
+# submission claimed it or took it over since
+def _replace_own_key(claim, key, value):
+  try:
+    with redis_conn.pipeline() as pipe:
+      pipe.watch(key)
+      raw = pipe.get(key)
+      if raw is None or json.loads(raw)["token"] != claim.token:
+        return
+      pipe.multi()
+      if value is None:
+        pipe.delete(key)
+      else:
+        pipe.set(key, value, ex=INTAKE_DEDUP_WINDOW)
+      pipe.execute()
+  except WatchError:
+    pass
+
+def _point_owned_keys(claim, public_id):
+  for key in claim.owned:
+    _replace_own_key(claim, key, claim.value(public_id))
+
+# Claims the submission before its workload is created. The returned claim has public_id set for a duplicate,
+# the caller then returns that workload instead of creating one. Raises IdempotencyKeyConflict or IntakePending
+def claim_intake(idempotency_key, input_text, options):
+  claim = IntakeClaim(idempotency_key, input_text, options)
+  try:
+    for kind, key in claim.keys:
+      public_id = _claim_key(claim, kind, key)
+      if public_id:
+        # A new Idempotency-Key for known content leads to the same workload next time too
+        _point_owned_keys(claim, public_id)
+        claim.public_id = public_id
+        INTAKE_SUBMISSIONS.labels(f"duplicate_{kind}").inc()
+        return claim
+  except IdempotencyKeyConflict:
+    INTAKE_SUBMISSIONS.labels("key_conflict").inc()
+    release_intake(claim)
+    raise
+  except IntakePending:
+    INTAKE_SUBMISSIONS.labels("pending").inc()
+    release_intake(claim)
+    raise
+  except Exception as e:
+    print(f"[Warning] Intake dedup unavailable, creating the workload uncoordinated: {e}")
+    INTAKE_SUBMISSIONS.labels("uncoordinated").inc()
+    release_intake(claim)
+    claim.owned = []
+  return claim
+
+# Points the claimed keys that still hold the claim at the workload the submission created
+def complete_intake(claim, public_id):
+  INTAKE_SUBMISSIONS.labels("created").inc()
+  try:
+    _point_owned_keys(claim, public_id)
+  except Exception as e:
+    print(f"[Warning] Failed to record intake claim for workload {public_id}: {e}")
+
+# Drops the keys this submission holds (its workload could not be created), so a retry is not sent to a workload
+# that does not exist
+def release_intake(claim):
+  for key in claim.owned:
+    try:
+      _replace_own_key(claim, key, None)
+    except Exception as e:
+      print(f"[Warning] Could not release intake claim {key}: {e}")
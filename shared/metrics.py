@@ -0,0 +1,235 @@
+'''Prometheus metrics and per-stage latency spans shared by the orchestrator and the workers'''
+
+import os
+import time
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from prometheus_client import (
+  CONTENT_TYPE_LATEST,
+  CollectorRegistry,
+  Counter,
+  Gauge,
+  Histogram,
+  REGISTRY,
+  generate_latest,
+  multiprocess,
+  start_http_server,
+)
+from prometheus_client.mmap_dict import MmapedDict
+
+# Service label for every metric recorded by this process (flask_orchestrator, preprocess, comicgen)
+SERVICE_NAME = os.environ.get("METRICS_SERVICE", "app")
+# Set METRICS_SPAN_LOG=0 to keep the histograms but drop the per-span log line
+SPAN_LOG = os.environ.get("METRICS_SPAN_LOG", "1") != "0"
+
+# Buckets go up to 30 minutes because a full comic can take several minutes end to end
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1200, 1800)
+
+STAGE_LATENCY = Histogram(
+  "recipe_comic_stage_seconds",
+  "Wall time spent in a flow stage",
+  ["service", "stage"],
+  buckets=LATENCY_BUCKETS,
+)
+EXTERNAL_CALL_LATENCY = Histogram(
+  "recipe_comic_external_call_seconds",
+  "Wall time spent in a call to an external service (OpenAI, Supabase, Reddit, image downloads)",
+  ["service", "call"],
+  buckets=LATENCY_BUCKETS,
+)
+QUEUE_WAIT = Histogram(
+  "recipe_comic_queue_wait_seconds",
+  "Time a job spent in its RQ queue before a worker picked it up",
+  ["queue"],
+  buckets=LATENCY_BUCKETS,
+)
+JOB_STARTUP = Histogram(
+  "recipe_comic_job_startup_seconds",
+  "Time from the worker forking a work-horse to the task function starting",
+  ["queue"],
+  buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+FAILURES = Counter(
+  "recipe_comic_failures_total",
+  "Stages and external calls that raised",
+  ["service", "kind", "name"],
+)
+SINGLEFLIGHT_CALLS = Counter(
+  "recipe_comic_singleflight_calls_total",
+  "Coalesced requests by outcome (leader, shared, cached, retry_leader, wait_timeout, uncoordinated)",
+  ["namespace", "outcome"],
+)
+DEGRADATIONS = Counter(
+  "recipe_comic_degradations_total",
+  "Workloads that received a degradation because of comicgen backlog",
+  ["degradation"],
+)
+SPECULATIONS = Counter(
+  "recipe_comic_speculations_total",
+  "Speculative prompt preparations by outcome (enqueued, skipped_budget, skipped_backlog, skipped_decided, prepared, used, stale, discarded)",
+  ["outcome"],
+)
+INTAKE_SUBMISSIONS = Counter(
+  "recipe_comic_intake_submissions_total",
+  "POST /workloads submissions by outcome (created, duplicate_key, duplicate_content, key_conflict, pending, uncoordinated)",
+  ["outcome"],
+)
+QUEUE_DEPTH = Gauge(
+  "recipe_comic_queue_depth",
+  "Number of jobs waiting in an RQ queue",
+  ["queue"],
+  multiprocess_mode="max",
+)
+IN_FLIGHT = Gauge(
+  "recipe_comic_jobs_in_flight",
+  "Jobs currently being executed",
+  ["service"],
+  multiprocess_mode="livesum",
+)
+
+# The workload a span belongs to. Set once per job, read by every span opened inside it
+current_workload = ContextVar("current_workload", default=None)
+
+# Callables notified with (kind, name, workload_id, seconds, ok) whenever a span closes. Used by benchmarks
+_span_listeners = []
+
+def add_span_listener(listener):
+  _span_listeners.append(listener)
+
+def remove_span_listener(listener):
+  if listener in _span_listeners:
+    _span_listeners.remove(listener)
+
+def _close_span(kind, name, started, ok):
+  elapsed = time.perf_counter() - started
+  workload_id = current_workload.get()
+  if kind == "stage":
+    STAGE_LATENCY.labels(SERVICE_NAME, name).observe(elapsed)
+  else:
+    EXTERNAL_CALL_LATENCY.labels(SERVICE_NAME, name).observe(elapsed)
+  if not ok:
+    FAILURES.labels(SERVICE_NAME, kind, name).inc()
+  if SPAN_LOG:
+    print(f"[span] service={SERVICE_NAME} workload={workload_id} {kind}={name} duration={elapsed:.3f}s ok={ok}")
+  for listener in _span_listeners:
+    listener(kind, name, workload_id, elapsed, ok)
+
+@contextmanager
+def _span(kind, name):
+  started = time.perf_counter()
+  try:
+    yield
+  except BaseException:
+    _close_span(kind, name, started, False)
+    raise
+  _close_span(kind, name, started, True)
+
+# Time one stage of a flow (generate_prompts, style_images, ...)
+def stage_span(stage):
+  return _span("stage", stage)
+
+# Time one call to an external service (dalle_images_generate, image_download, reddit_upload, ...)
+def external_call(call):
+  return _span("call", call)
+
+# Decorator form of stage_span for flow methods. Must sit below @start/@listen so crewAI still sees the flow attributes
+def timed_stage(stage):
+  def decorator(method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+      with stage_span(stage):
+        return method(*args, **kwargs)
+    return wrapper
+  return decorator
+
+@contextmanager
+def workload_context(workload_id):
+  token = current_workload.set(workload_id)
+  try:
+    yield
+  finally:
+    current_workload.reset(token)
+
+# Submits fn to an executor with the caller's context (its workload and deadline), which plain submit() drops
+def submit_in_context(executor, fn, *args, **kwargs):
+  return executor.submit(copy_context().run, fn, *args, **kwargs)
+
+# Wraps a whole RQ job: binds the workload to every span inside it, records queue wait time and in-flight count
+@contextmanager
+def job_span(queue_name, workload_id):
+  from rq import get_current_job
+
+  job = get_current_job()
+  if job is not None and job.enqueued_at is not None:
+    enqueued_at = job.enqueued_at.timestamp() if hasattr(job.enqueued_at, "timestamp") else job.enqueued_at
+    QUEUE_WAIT.labels(queue_name).observe(max(0.0, time.time() - enqueued_at))
+  # Set by WarmWorker right before it forks the work-horse (see shared/warm_worker.py)
+  forked_at = os.environ.get("WORK_HORSE_FORKED_AT")
+  if forked_at:
+    JOB_STARTUP.labels(queue_name).observe(max(0.0, time.time() - float(forked_at)))
+
+  IN_FLIGHT.labels(SERVICE_NAME).inc()
+  try:
+    with workload_context(workload_id), stage_span("job"):
+      yield
+  finally:
+    IN_FLIGHT.labels(SERVICE_NAME).dec()
+
+def _registry():
+  # RQ forks a work-horse per job (and gunicorn forks workers), so metrics written by children are
+  # aggregated from PROMETHEUS_MULTIPROC_DIR when it is set
+  if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+  return REGISTRY
+
+# Returns (body, content_type) for a /metrics response
+def metrics_response():
+  return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+# Files of exited processes are merged into one archive file per metric type and mode ("counter_archive.db"),
+# how the values of several processes combine
+ARCHIVED_FILES = {"counter": sum, "histogram": sum, "gauge_max": max}
+
+def _archive_process_files(multiproc_dir, pid):
+  for prefix, combine in ARCHIVED_FILES.items():
+    path = os.path.join(multiproc_dir, f"{prefix}_{pid}.db")
+    if not os.path.exists(path):
+      continue
+    dead = MmapedDict(path, read_mode=True)
+    archive = MmapedDict(os.path.join(multiproc_dir, f"{prefix}_archive.db"))
+    try:
+      for key, value, timestamp in dead.read_all_values():
+        # Keys new to the archive read as 0
+        archive.write_value(key, combine((archive.read_value(key)[0], value)), timestamp)
+    finally:
+      archive.close()
+      dead.close()
+    os.remove(path)
+
+# Called for every process that exited (work-horses, warm parents). Drops its live gauge files, so a work-horse
+# killed mid-job does not keep recipe_comic_jobs_in_flight above zero, and archives its other files, so the
+# multiprocess directory and the cost of a scrape stay flat however many jobs ran
+def mark_process_dead(pid):
+  multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+  if not pid or not multiproc_dir:
+    return
+  multiprocess.mark_process_dead(pid, multiproc_dir)
+  try:
+    _archive_process_files(multiproc_dir, pid)
+  except Exception as e:
+    print(f"[Warning] Could not archive the metrics of process {pid}: {e}")
+
+# Serves /metrics from a background thread. Used by the worker entry points
+def start_metrics_server(port):
+  multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+  if multiproc_dir:
+    os.makedirs(multiproc_dir, exist_ok=True)
+    # Files left behind by a previous container run would be summed into the new values
+    for file_name in os.listdir(multiproc_dir):
+      if file_name.endswith(".db"):
+        os.remove(os.path.join(multiproc_dir, file_name))
+  start_http_server(port, registry=_registry())
+  print(f"[Metrics] Serving /metrics on port {port} ✅")
@@ -0,0 +1,40 @@
+'''Encoding of finished comic pages.
+
+Every composed page is encoded once: a full size JPEG, which is what the page store serves and the gallery
+upload sends as-is, plus the PAGE_DERIVATIVE_WIDTHS copies (JPEG or WebP) for page lists and comic previews.
+The derivatives are made from the page that is already decoded in memory, each from the next larger one.
+'''
+from io import BytesIO
+from PIL import Image
+from .constants import PAGE_JPEG_QUALITY,PAGE_JPEG_OPTIMIZE,PAGE_DERIVATIVE_WIDTHS,PAGE_DERIVATIVE_FORMAT
+
+def _encode(img, format):
+  buffer = BytesIO()
+  if format == "WEBP":
+    # method 2 is ~2x faster than the default 4 for a few percent more bytes
+    img.save(buffer, format="WEBP", quality=80, method=2)
+  else:
+    img.save(buffer, format="JPEG", quality=PAGE_JPEG_QUALITY, optimize=PAGE_JPEG_OPTIMIZE, subsampling="4:2:0")
+  return buffer.getvalue()
+
+# Exact integer factors use Image.reduce (a box filter, ~10x faster than a Lanczos resize)
+def _downscale(img, width):
+  factor = img.width // width
+  if img.width == width * factor and img.height % factor == 0:
+    return img.reduce(factor)
+  return img.resize((width, round(img.height * width / img.width)), Image.LANCZOS, reducing_gap=2.0)
+
+def encode_derivatives(img):
+  derivatives = {}
+  source = img
+  for variant, width in sorted(PAGE_DERIVATIVE_WIDTHS.items(), key=lambda item: -item[1]):
+    source = _downscale(source, width)
+    derivatives[variant] = _encode(source, PAGE_DERIVATIVE_FORMAT)
+  return derivatives
+
+# Returns {"full": JPEG bytes, <variant>: bytes for every derivative}. The derivatives are skipped when not needed
+def encode_page(img, derivatives=True):
+  encoded = {"full": _encode(img, "JPEG")}
+  if derivatives:
+    encoded.update(encode_derivatives(img))
+  return encoded
@@ -0,0 +1,130 @@
+'''Store for finished comic pages, written by the comicgen workers and served by the orchestrator.
+
+Pages are published one by one as they are composed, so clients can show the cover and the first pages while
+the rest of the comic is still being generated. Pages are keyed by the internal workload id and page number
+(0 is the cover) and stored as the same JPEG bytes that go into the final gallery upload. Every page also has
+its smaller derivatives (see shared/page_encoding.py) under their variant names.
+
+A comic's preview (the cover's derivatives) is kept under its gallery submission id, since the comics table links
+to it. The disk backend keeps previews for good. In Redis they expire COMIC_PREVIEW_TTL after they were last
+served, so previews of comics nobody looks at do not pile up in memory.
+'''
+import json
+import os
+from .redis_client import redis_conn
+from .constants import PAGE_STORE_BACKEND, PAGE_STORE_DIR, PAGE_STORE_TTL, COMIC_PREVIEW_TTL
+
+FULL = "full"
+
+# Pages are JPEG, derivatives JPEG or WebP. The orchestrator has no Pillow, so the type is read off the header
+def image_mimetype(data):
+  if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+    return "image/webp"
+  return "image/jpeg"
+
+class RedisPageStore:
+  def _key(self, workload_id, part):
+    return f"workload:{workload_id}:pages:{part}"
+
+  def set_total_pages(self, workload_id, total_pages):
+    redis_conn.set(self._key(workload_id, "total"), total_pages, ex=PAGE_STORE_TTL)
+
+  # Full pages are stored under their page number, derivatives under "<page number>:<variant>"
+  def _field(self, page_number, variant):
+    return page_number if variant == FULL else f"{page_number}:{variant}"
+
+  # `pages` maps variant to bytes. All variants of a page are written together
+  def put_page(self, workload_id, page_number, pages):
+    pipe = redis_conn.pipeline()
+    pipe.hset(self._key(workload_id, "data"), mapping={self._field(page_number, variant): data for variant, data in pages.items()})
+    pipe.expire(self._key(workload_id, "data"), PAGE_STORE_TTL)
+    pipe.execute()
+
+  def get_page(self, workload_id, page_number, variant=FULL):
+    return redis_conn.hget(self._key(workload_id, "data"), self._field(page_number, variant))
+
+  # Returns (total_pages or None when unknown yet, sorted ready page numbers)
+  def list_pages(self, workload_id):
+    pipe = redis_conn.pipeline()
+    pipe.get(self._key(workload_id, "total"))
+    pipe.hkeys(self._key(workload_id, "data"))
+    total, ready = pipe.execute()
+    return (int(total) if total is not None else None), sorted(int(field) for field in ready if b":" not in field)
+
+  def put_preview(self, comic_key, previews):
+    pipe = redis_conn.pipeline()
+    pipe.hset(f"comic:{comic_key}:preview", mapping=previews)
+    pipe.expire(f"comic:{comic_key}:preview", COMIC_PREVIEW_TTL)
+    pipe.execute()
+
+  # Serving a preview keeps it for another COMIC_PREVIEW_TTL
+  def get_preview(self, comic_key, variant):
+    pipe = redis_conn.pipeline()
+    pipe.hget(f"comic:{comic_key}:preview", variant)
+    pipe.expire(f"comic:{comic_key}:preview", COMIC_PREVIEW_TTL)
+    preview, _ = pipe.execute()
+    return preview
+
+# Needs PAGE_STORE_DIR on a volume shared by the workers and the orchestrator. Old workload directories are not
+# cleaned up here
+class DiskPageStore:
+  def __init__(self, root=PAGE_STORE_DIR):
+    self.root = root
+
+  def _dir(self, workload_id):
+    return os.path.join(self.root, str(workload_id))
+
+  def set_total_pages(self, workload_id, total_pages):
+    os.makedirs(self._dir(workload_id), exist_ok=True)
+    self._write(os.path.join(self._dir(workload_id), "total.json"), json.dumps(total_pages).encode())
+
+  # Full pages are page-<n>.jpg, derivatives page-<n>-<variant> (JPEG or WebP, so without an extension)
+  def _page_path(self, workload_id, page_number, variant):
+    name = f"page-{int(page_number)}.jpg" if variant == FULL else f"page-{int(page_number)}-{variant}"
+    return os.path.join(self._dir(workload_id), name)
+
+  # Derivatives are written first, so a listed page always has them
+  def put_page(self, workload_id, page_number, pages):
+    os.makedirs(self._dir(workload_id), exist_ok=True)
+    for variant in sorted(pages, key=lambda variant: variant == FULL):
+      self._write(self._page_path(workload_id, page_number, variant), pages[variant])
+
+  def get_page(self, workload_id, page_number, variant=FULL):
+    return self._read(self._page_path(workload_id, page_number, variant))
+
+  def list_pages(self, workload_id):
+    directory = self._dir(workload_id)
+    if not os.path.isdir(directory):
+      return None, []
+    total = None
+    if os.path.exists(os.path.join(directory, "total.json")):
+      with open(os.path.join(directory, "total.json")) as f:
+        total = json.load(f)
+    ready = [int(name[len("page-"):-len(".jpg")]) for name in os.listdir(directory) if name.startswith("page-") and name.endswith(".jpg")]
+    return total, sorted(ready)
+
+  def _preview_path(self, comic_key, variant):
+    return os.path.join(self.root, "previews", f"{os.path.basename(str(comic_key))}-{variant}")
+
+  def put_preview(self, comic_key, previews):
+    os.makedirs(os.path.join(self.root, "previews"), exist_ok=True)
+    for variant, data in previews.items():
+      self._write(self._preview_path(comic_key, variant), data)
+
+  def get_preview(self, comic_key, variant):
+    return self._read(self._preview_path(comic_key, variant))
+
+  def _read(self, path):
+    if not os.path.exists(path):
+      return None
+    with open(path, "rb") as f:
+      return f.read()
+
+  # Readers never see a half written page: write to a temp name, then rename
+  def _write(self, path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+      f.write(data)
+    os.replace(tmp_path, path)
+
+page_store = DiskPageStore() if PAGE_STORE_BACKEND == "disk" else RedisPageStore()
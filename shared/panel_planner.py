@@ -0,0 +1,111 @@
+'''Panel planner for large recipes.
+
+Every image costs the same generation time and money, so a comic gets at most IMAGE_BUDGET of them. A recipe
+with more ingredients and instructions than that is planned into panels instead of being rejected:
+  ingredients   minor ingredients (a pinch, a teaspoon, "to taste") share combined images of up to
+                PANEL_MAX_COMBINED_INGREDIENTS, placed after the other ingredients
+  instructions  consecutive steps share a multi-step panel of up to PANEL_MAX_STEPS, the shortest neighbours first
+
+A plan is {"ingredients": [[index, ...], ...], "instructions": [[index, ...], ...]}: one list of recipe indices
+per image. Recipes within the budget get one panel per item. The plan only depends on the recipe, so every job
+of a workload computes the same one.
+'''
+import re
+from .constants import IMAGE_BUDGET,PANEL_MAX_STEPS,PANEL_MAX_COMBINED_INGREDIENTS
+
+UNICODE_FRACTIONS = "½⅓⅔¼¾⅕⅖⅗⅘⅙⅚⅛⅜⅝⅞"
+NUMBER_WORDS = ("a", "an", "half", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven", "twelve", "dozen")
+_NUMBER = rf"(?:\d+(?:[.,]\d+)?(?:\s*[{UNICODE_FRACTIONS}]|\s+\d+/\d+|/\d+)?|[{UNICODE_FRACTIONS}])"
+# A leading amount like "2", "1/2", "1 1/2", "1½", "½", "0.5", "2-3" or "two", followed by the rest of the quantity
+# as its unit ("cups", "tbsp", "large", "14-oz can", "(400g) can")
+QUANTITY_PATTERN = re.compile(
+  rf"^\s*({_NUMBER}(?:\s*-\s*{_NUMBER})?|(?:{'|'.join(NUMBER_WORDS)})\b)\s*(.*?)\s*$",
+  re.IGNORECASE,
+)
+
+# Units of ingredients that only season or garnish a dish
+MINOR_UNITS = {"pinch", "pinches", "dash", "dashes", "tsp", "teaspoon", "teaspoons", "sprig", "sprigs", "drop", "drops"}
+
+# Quantities that say they are minor without a unit
+MINOR_PHRASE_PATTERN = re.compile(r"\b(to taste|as needed|as required|for garnish|for serving|optional|pinch|dash|sprinkle)\b", re.IGNORECASE)
+
+# Returns (amount, unit) for quantities like "2 cups", "½ cup" or "3", or None when there is no leading amount
+# ("to taste", "as needed")
+def parse_quantity(quantity):
+  match = QUANTITY_PATTERN.match(quantity or "")
+  if not match:
+    return None
+  return match.group(1).strip(), match.group(2).rstrip(".")
+
+# Only quantities that are explicitly minor: in a minor unit ("1 tsp", "a pinch") or a minor phrase ("to taste").
+# Any other quantity, parsed or not ("Two large", "1 (400g) can", "some"), is a main ingredient
+def is_minor_ingredient(ing):
+  quantity = ing.quantity or ""
+  parsed = parse_quantity(quantity)
+  if parsed is not None and parsed[1]:
+    if parsed[1].split()[0].lower().rstrip(".") in MINOR_UNITS:
+      return True
+  return bool(MINOR_PHRASE_PATTERN.search(quantity))
+
+def single_panels(count):
+  return [[index] for index in range(count)]
+
+def image_count(plan):
+  return 1 + len(plan["ingredients"]) + len(plan["instructions"])
+
+# Groups the minor ingredients into combined panels. Returns the panels, the ingredients in recipe order first
+def group_minor_ingredients(ingredients):
+  minor = [index for index, ing in enumerate(ingredients) if is_minor_ingredient(ing)]
+  combined = [minor[start:start + PANEL_MAX_COMBINED_INGREDIENTS] for start in range(0, len(minor), PANEL_MAX_COMBINED_INGREDIENTS)]
+  # A lone minor ingredient saves nothing by being moved
+  combined = [group for group in combined if len(group) > 1]
+  grouped = {index for group in combined for index in group}
+  return [[index] for index in range(len(ingredients)) if index not in grouped] + combined
+
+def panel_chars(instructions, panel):
+  return sum(len(instructions[index].strip()) for index in panel)
+
+# Splits the steps into at most max_panels runs of consecutive steps, each up to PANEL_MAX_STEPS long. Of all such
+# splits it takes the one with the least sum of squared panel text lengths, which pairs short neighbouring steps
+# and leaves long ones alone. Returns None when PANEL_MAX_STEPS does not allow that few panels
+def group_instructions(instructions, max_panels):
+  count = len(instructions)
+  if count <= max_panels:
+    return single_panels(count)
+  if max_panels < 1 or count > max_panels * PANEL_MAX_STEPS:
+    return None
+
+  # best[panels][steps]: least cost of putting the first `steps` steps on `panels` panels, and the size of the last one
+  chars = [len(step.strip()) for step in instructions]
+  best = [[(float("inf"), 0)] * (count + 1) for _ in range(max_panels + 1)]
+  best[0][0] = (0, 0)
+  for panels in range(1, max_panels + 1):
+    for steps in range(panels, min(count, panels * PANEL_MAX_STEPS) + 1):
+      for size in range(1, min(PANEL_MAX_STEPS, steps) + 1):
+        cost = best[panels - 1][steps - size][0] + sum(chars[steps - size:steps]) ** 2
+        if cost < best[panels][steps][0]:
+          best[panels][steps] = (cost, size)
+
+  grouped = []
+  steps = count
+  for panels in range(max_panels, 0, -1):
+    size = best[panels][steps][1]
+    grouped.insert(0, list(range(steps - size, steps)))
+    steps -= size
+  return grouped
+
+# Returns the panel plan of recipe_data within `budget` images, or None when the recipe cannot fit
+def plan_panels(recipe_data, budget=IMAGE_BUDGET):
+  plan = {
+    "ingredients": single_panels(len(recipe_data.ingredients)),
+    "instructions": single_panels(len(recipe_data.instructions)),
+  }
+  if image_count(plan) <= budget:
+    return plan
+
+  plan["ingredients"] = group_minor_ingredients(recipe_data.ingredients)
+  instructions = group_instructions(recipe_data.instructions, budget - 1 - len(plan["ingredients"]))
+  if instructions is None:
+    return None
+  plan["instructions"] = instructions
+  return plan
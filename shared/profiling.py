@@ -0,0 +1,176 @@
+'''Opt-in per-job profiling.
+
+job_profile() wraps a worker task. When the workload is profiled (created with "profile": true, or sampled by
+PROFILE_SAMPLE_RATE) it runs a sampling profiler for the length of the job: a background thread records the
+stack of every thread each PROFILE_SAMPLE_INTERVAL, so blocked threads (HTTP calls, LLM calls, rate limit waits)
+show up as well as busy ones and the result is a wall-clock profile. Next to it the job's process CPU time is
+recorded, so wall time can be told apart from CPU time. With PROFILE_ALLOCATIONS on, tracemalloc's allocation
+hotspots are recorded too, at a cost in speed that the wall and CPU times then include.
+
+Every profiled job leaves two artifacts in Redis under its workload id, listed by the orchestrator:
+  folded stacks  one "thread;frame;frame count" line per unique stack, the input of flamegraph.pl and speedscope
+  stats          wall vs CPU seconds, the functions with the most samples and the top allocation sites (if traced)
+'''
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from .redis_client import redis_conn
+from .workload_options import get_workload_options
+from .constants import PROFILE_SAMPLE_RATE,PROFILE_SAMPLE_INTERVAL,PROFILE_ALLOCATIONS,PROFILE_MAX_STACK_DEPTH,PROFILE_TOP_N,PROFILE_TTL
+
+def _index_key(workload_id):
+  return f"workload:{workload_id}:profiles"
+
+def _folded_key(workload_id, name):
+  return f"workload:{workload_id}:profile:{name}:folded"
+
+# Sampling is by workload, so every job of a sampled workload is profiled
+def should_profile(workload_id):
+  if get_workload_options(workload_id).get("profile"):
+    return True
+  return PROFILE_SAMPLE_RATE > 0 and zlib.crc32(str(workload_id).encode()) % 10000 < PROFILE_SAMPLE_RATE * 10000
+
+def _frame_label(frame):
+  code = frame.f_code
+  return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+  def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+    self.interval = interval
+    self.stacks = Counter()
+    self.samples = 0
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+  def start(self):
+    self._thread.start()
+
+  def stop(self):
+    self._stop.set()
+    self._thread.join()
+
+  def _run(self):
+    own_id = threading.get_ident()
+    while not self._stop.wait(self.interval):
+      thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+      for thread_id, frame in sys._current_frames().items():
+        if thread_id == own_id:
+          continue
+        labels = []
+        while frame is not None and len(labels) < PROFILE_MAX_STACK_DEPTH:
+          labels.append(_frame_label(frame))
+          frame = frame.f_back
+        labels.append(thread_names.get(thread_id, f"thread-{thread_id}"))
+        self.stacks[";".join(reversed(labels))] += 1
+      self.samples += 1
+
+  def folded(self):
+    return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+  # Functions by samples on top of the stack (self) and anywhere in it (total), in seconds
+  def top_functions(self):
+    self_counts = Counter()
+    total_counts = Counter()
+    for stack, count in self.stacks.items():
+      frames = stack.split(";")[1:]
+      if not frames:
+        continue
+      self_counts[frames[-1]] += count
+      for label in set(frames):
+        total_counts[label] += count
+    return {
+      "self": [{"function": label, "seconds": round(count * self.interval, 3)} for label, count in self_counts.most_common(PROFILE_TOP_N)],
+      "total": [{"function": label, "seconds": round(count * self.interval, 3)} for label, count in total_counts.most_common(PROFILE_TOP_N)],
+    }
+
+def _allocation_hotspots(snapshot):
+  return [
+    {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+    for stat in snapshot.statistics("lineno")[:PROFILE_TOP_N]
+  ]
+
+# Wraps a worker task. A no-op unless the workload is profiled. The profile is saved even if the task raises
+@contextmanager
+def job_profile(service, workload_id):
+  if not should_profile(workload_id):
+    yield
+    return
+
+  from rq import get_current_job
+  job = get_current_job()
+  name = f"{service}-{job.id if job is not None else int(time.time() * 1000)}"
+  started_at = time.time()
+  wall_started = time.perf_counter()
+  cpu_started = time.process_time()
+  # tracemalloc may already be running (python -X tracemalloc), then it is left running
+  trace_allocations = PROFILE_ALLOCATIONS or tracemalloc.is_tracing()
+  started_tracing = trace_allocations and not tracemalloc.is_tracing()
+  if started_tracing:
+    tracemalloc.start()
+  if trace_allocations:
+    tracemalloc.reset_peak()
+  profiler = SamplingProfiler()
+  profiler.start()
+
+  ok = False
+  try:
+    yield
+    ok = True
+  finally:
+    profiler.stop()
+    wall_seconds = time.perf_counter() - wall_started
+    cpu_seconds = time.process_time() - cpu_started
+    allocation_peak_mb = None
+    allocation_hotspots = None
+    if trace_allocations:
+      allocation_hotspots = _allocation_hotspots(tracemalloc.take_snapshot())
+      allocation_peak_mb = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+    if started_tracing:
+      tracemalloc.stop()
+
+    stats = {
+      "name": name,
+      "service": service,
+      "ok": ok,
+      "started_at": started_at,
+      "wall_seconds": round(wall_seconds, 3),
+      "cpu_seconds": round(cpu_seconds, 3),
+      # Below 1 the job mostly waited (I/O, rate limits), above 1 several threads were busy at once
+      "cpu_ratio": round(cpu_seconds / wall_seconds, 3) if wall_seconds else 0.0,
+      "samples": profiler.samples,
+      "sample_interval": profiler.interval,
+      "top_functions": profiler.top_functions(),
+      "allocation_peak_mb": allocation_peak_mb,
+      "allocation_hotspots": allocation_hotspots,
+    }
+    save_profile(workload_id, name, stats, profiler.folded())
+    print(f"[Profiling] Saved profile {name} for workload {workload_id}: wall {stats['wall_seconds']}s, cpu {stats['cpu_seconds']}s")
+
+# Profiling must never fail the job it observed
+def save_profile(workload_id, name, stats, folded):
+  try:
+    pipe = redis_conn.pipeline()
+    pipe.hset(_index_key(workload_id), name, json.dumps(stats))
+    pipe.expire(_index_key(workload_id), PROFILE_TTL)
+    pipe.set(_folded_key(workload_id, name), folded, ex=PROFILE_TTL)
+    pipe.execute()
+  except Exception as e:
+    print(f"[Warning] Failed to save profile {name} for workload {workload_id}: {e}")
+
+# Stats of every profile of the workload, oldest first
+def list_profiles(workload_id):
+  profiles = [json.loads(raw) for raw in redis_conn.hgetall(_index_key(workload_id)).values()]
+  return sorted(profiles, key=lambda stats: stats["started_at"])
+
+def get_profile_stats(workload_id, name):
+  raw = redis_conn.hget(_index_key(workload_id), name)
+  return json.loads(raw) if raw else None
+
+def get_profile_folded(workload_id, name):
+  return redis_conn.get(_folded_key(workload_id, name))
@@ -13,7 +13,11 @@ class ImageObject(BaseModel):
   type: Literal["ING","INS","POSTER"]
   prompt: str
   url: str
-  styled_image: str
+  styled_image: str # Reference into the workload's ImageStore, not the image itself
+  generation_model: str = ""
+  generation_size: str = ""
+  download_bytes: int = 0
+  download_seconds: float = 0.0
 
 # 2) Main state models - These models will be used by the internal state of the flow
 
@@ -0,0 +1,60 @@
+'''Fleet-wide rate limiting through Redis.
+
+In single mode one job owns a workload's image calls and paces them in batches. Once a workload's images are
+spread over many workers, the budget has to be shared, so every caller takes a slot from a fixed window
+counter in Redis and waits for the next window when the current one is used up. Single-mode calls are counted in
+the same window without waiting, so the usage read by shared/degradation.py covers both modes.
+'''
+import time
+from .redis_client import redis_conn
+
+def _window_key(name, window):
+  return f"ratelimit:{name}:{window}"
+
+# Blocks until the caller may make one call under `limit` calls per `window_seconds` for `name`
+def acquire_rate_limit(name, limit, window_seconds):
+  if window_seconds <= 0:
+    return
+  while True:
+    window = int(time.time() // window_seconds)
+    key = _window_key(name, window)
+    try:
+      pipe = redis_conn.pipeline()
+      pipe.incr(key)
+      pipe.expire(key, window_seconds * 2)
+      count, _ = pipe.execute()
+    except Exception as e:
+      print(f"[Warning] Rate limiter unavailable for {name}, not limiting: {e}")
+      return
+
+    if count <= limit:
+      return
+    sleep_time = (window + 1) * window_seconds - time.time()
+    print(f"[Rate Limiter] {name} budget used up, waiting {sleep_time:.2f} seconds for the next window")
+    time.sleep(max(0.0, sleep_time))
+
+# Counts a call made without waiting for a slot (single mode paces its own batches), so the window counter and
+# rate_limit_usage() reflect every image call of the fleet, not just the fleet-limited ones
+def record_rate_limit_usage(name, window_seconds):
+  if window_seconds <= 0:
+    return
+  key = _window_key(name, int(time.time() // window_seconds))
+  try:
+    pipe = redis_conn.pipeline()
+    pipe.incr(key)
+    pipe.expire(key, window_seconds * 2)
+    pipe.execute()
+  except Exception as e:
+    print(f"[Warning] Rate limiter unavailable for {name}, call not counted: {e}")
+
+# Fraction of the current window's budget for `name` that is already taken. 0 when it cannot be read
+def rate_limit_usage(name, limit, window_seconds):
+  if window_seconds <= 0:
+    return 0.0
+  window = int(time.time() // window_seconds)
+  try:
+    count = int(redis_conn.get(_window_key(name, window)) or 0)
+  except Exception as e:
+    print(f"[Warning] Rate limiter unavailable for {name}, assuming an unused budget: {e}")
+    return 0.0
+  return min(1.0, count / limit)
@@ -8,4 +8,6 @@ REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
 
 redis_conn = Redis(host=REDIS_HOST, port=REDIS_PORT,password=REDIS_PASSWORD)
 preprocess_queue = Queue("preprocess", connection=redis_conn)
-comicgen_queue = Queue("comicgen", connection=redis_conn)
\ No newline at end of file
+comicgen_queue = Queue("comicgen", connection=redis_conn)
+comicgen_images_queue = Queue("comicgen_images", connection=redis_conn)
+speculative_queue = Queue("speculative", connection=redis_conn)
\ No newline at end of file
@@ -0,0 +1,88 @@
+'''Cross-workload in-flight coalescing ("singleflight") for expensive, deterministic requests, coordinated through Redis.
+
+The first caller for a key takes a lock and does the work; concurrent callers with the same key wait for its
+result instead of repeating the LLM or image call. Results are cached for a short TTL so callers arriving just
+after also share them. If the leader fails it drops the lock, and exactly one waiter takes it over and retries.
+Without Redis every caller simply does its own work.
+'''
+import hashlib
+import json
+import time
+import uuid
+from redis.exceptions import WatchError
+from .redis_client import redis_conn
+from .constants import SINGLEFLIGHT_LOCK_TTL, SINGLEFLIGHT_WAIT_TIMEOUT
+from .metrics import SINGLEFLIGHT_CALLS
+from .deadline import check_deadline
+
+def singleflight_key(namespace, key_parts):
+  digest = hashlib.sha256(json.dumps(key_parts, sort_keys=True).encode()).hexdigest()
+  return f"singleflight:{namespace}:{digest}"
+
+# Deletes the lock only if this caller still owns it (it may have expired and been taken over)
+def _release_lock(lock_key, token):
+  try:
+    with redis_conn.pipeline() as pipe:
+      pipe.watch(lock_key)
+      if pipe.get(lock_key) == token.encode():
+        pipe.multi()
+        pipe.delete(lock_key)
+        pipe.execute()
+  except WatchError:
+    pass
+  except Exception as e:
+    print(f"[Warning] Could not release singleflight lock {lock_key}: {e}")
+
+def _lead(base_key, token, fn, result_ttl):
+  try:
+    result = fn()
+  except Exception:
+    _release_lock(f"{base_key}:lock", token)
+    raise
+  try:
+    redis_conn.set(f"{base_key}:result", json.dumps(result), ex=result_ttl)
+  except Exception as e:
+    print(f"[Warning] Could not publish singleflight result for {base_key}: {e}")
+  _release_lock(f"{base_key}:lock", token)
+  return result
+
+# Runs fn() at most once across all concurrent callers with the same (namespace, key_parts). fn must return a
+# JSON-serializable value
+def singleflight(namespace, key_parts, fn, result_ttl, lock_ttl=SINGLEFLIGHT_LOCK_TTL, wait_timeout=SINGLEFLIGHT_WAIT_TIMEOUT):
+  base_key = singleflight_key(namespace, key_parts)
+  token = uuid.uuid4().hex
+
+  try:
+    cached = redis_conn.get(f"{base_key}:result")
+    if cached is not None:
+      SINGLEFLIGHT_CALLS.labels(namespace, "cached").inc()
+      return json.loads(cached)
+    acquired = redis_conn.set(f"{base_key}:lock", token, nx=True, ex=lock_ttl)
+  except Exception as e:
+    print(f"[Warning] Singleflight unavailable for {namespace}, running uncoordinated: {e}")
+    SINGLEFLIGHT_CALLS.labels(namespace, "uncoordinated").inc()
+    return fn()
+
+  if acquired:
+    SINGLEFLIGHT_CALLS.labels(namespace, "leader").inc()
+    return _lead(base_key, token, fn, result_ttl)
+
+  # Someone else is doing the work. Poll for the result; if the lock disappears without a result the leader
+  # failed (or its lock expired) and whoever re-acquires it first retries
+  wait_until = time.monotonic() + wait_timeout
+  poll_interval = 0.1
+  while time.monotonic() < wait_until:
+    check_deadline(f"singleflight wait on {namespace}")
+    time.sleep(poll_interval)
+    poll_interval = min(poll_interval * 2, 1.0)
+    cached = redis_conn.get(f"{base_key}:result")
+    if cached is not None:
+      SINGLEFLIGHT_CALLS.labels(namespace, "shared").inc()
+      return json.loads(cached)
+    if redis_conn.set(f"{base_key}:lock", token, nx=True, ex=lock_ttl):
+      SINGLEFLIGHT_CALLS.labels(namespace, "retry_leader").inc()
+      return _lead(base_key, token, fn, result_ttl)
+
+  # The leader is still running past our patience. Do the work ourselves rather than stall the workload
+  SINGLEFLIGHT_CALLS.labels(namespace, "wait_timeout").inc()
+  return fn()
@@ -0,0 +1,103 @@
+'''Generation-size planner.
+
+Derives the resolution each image type actually occupies on a page from the layout constants and picks the
+cheapest supported model/size that covers it for the workload's quality tier. Also reports how many pixels,
+bytes, download time and dollars that saved compared to the fixed standard sizes.
+'''
+from .constants import (
+  IMAGE_GENERATION_OPTIONS,
+  QUALITY_TIERS,
+  DEFAULT_QUALITY_TIER,
+  ING_PANEL_SIZE,
+  INS_PANEL_SIZE,
+  FINAL_PAGE_WIDTH,
+  FINAL_PAGE_HEIGHT,
+  ING_IMAGE_SIZE,
+  INS_IMAGE_SIZE,
+  POSTER_IMAGE_SIZE,
+)
+
+# Pixels each image type ends up using on a page
+REQUIRED_RESOLUTION = {
+  "ING": ING_PANEL_SIZE,
+  "INS": INS_PANEL_SIZE,
+  "POSTER": (FINAL_PAGE_WIDTH, FINAL_PAGE_HEIGHT),
+}
+BASELINE_SIZE = {"ING": ING_IMAGE_SIZE, "INS": INS_IMAGE_SIZE, "POSTER": POSTER_IMAGE_SIZE}
+
+def parse_size(size):
+  width, height = size.split("x")
+  return int(width), int(height)
+
+def _pixels(size):
+  width, height = parse_size(size)
+  return width * height
+
+# Largest region with the required aspect ratio that fits inside (width, height)
+def _usable_region(width, height, required_w, required_h, crop):
+  if abs(width / height - required_w / required_h) < 0.02:
+    return width, height
+  if not crop:
+    return None
+  scale = min(width / required_w, height / required_h)
+  return int(required_w * scale), int(required_h * scale)
+
+def resolve_quality_tier(tier):
+  return tier if tier in QUALITY_TIERS else DEFAULT_QUALITY_TIER
+
+# Returns {"model", "size", "cost_usd"} for an image type (ING/INS/POSTER) under a quality tier
+def plan_generation(image_type, tier=DEFAULT_QUALITY_TIER):
+  tier_config = QUALITY_TIERS[resolve_quality_tier(tier)]
+  required_w, required_h = REQUIRED_RESOLUTION[image_type]
+  min_w, min_h = required_w * tier_config["min_scale"], required_h * tier_config["min_scale"]
+
+  candidates = []
+  for option in IMAGE_GENERATION_OPTIONS:
+    if option["model"] not in tier_config["models"]:
+      continue
+    width, height = parse_size(option["size"])
+    region = _usable_region(width, height, required_w, required_h, tier_config["crop"])
+    if region and region[0] >= min_w and region[1] >= min_h:
+      candidates.append(option)
+
+  if not candidates:
+    raise ValueError(f"[Application Exception] No generation option covers {image_type} at {required_w}x{required_h} for tier {tier}")
+  # Cheapest first, then fewest pixels (faster to generate, download and decode)
+  return dict(min(candidates, key=lambda option: (option["cost_usd"], _pixels(option["size"]))))
+
+def _baseline_cost(image_type):
+  for option in IMAGE_GENERATION_OPTIONS:
+    if option["model"] == "dall-e-3" and option["size"] == BASELINE_SIZE[image_type]:
+      return option["cost_usd"]
+  return 0.0
+
+# Compares the generated images against what the fixed standard sizes would have cost. Bytes and download
+# time for the baseline are extrapolated from the measured ones by pixel count
+def generation_savings_report(image_objects):
+  report = {
+    "images": len(image_objects),
+    "pixels": 0, "baseline_pixels": 0,
+    "bytes": 0, "baseline_bytes": 0,
+    "download_seconds": 0.0, "baseline_download_seconds": 0.0,
+    "cost_usd": 0.0, "baseline_cost_usd": 0.0,
+  }
+  for img_obj in image_objects:
+    if not img_obj.generation_size:
+      continue
+    pixels = _pixels(img_obj.generation_size)
+    baseline_pixels = _pixels(BASELINE_SIZE[img_obj.type])
+    ratio = baseline_pixels / pixels
+    report["pixels"] += pixels
+    report["baseline_pixels"] += baseline_pixels
+    report["bytes"] += img_obj.download_bytes
+    report["baseline_bytes"] += int(img_obj.download_bytes * ratio)
+    report["download_seconds"] += img_obj.download_seconds
+    report["baseline_download_seconds"] += img_obj.download_seconds * ratio
+    report["cost_usd"] += next((option["cost_usd"] for option in IMAGE_GENERATION_OPTIONS
+                                if option["model"] == img_obj.generation_model and option["size"] == img_obj.generation_size), 0.0)
+    report["baseline_cost_usd"] += _baseline_cost(img_obj.type)
+
+  report["bytes_saved"] = report["baseline_bytes"] - report["bytes"]
+  report["download_seconds_saved"] = round(report["baseline_download_seconds"] - report["download_seconds"], 3)
+  report["cost_usd_saved"] = round(report["baseline_cost_usd"] - report["cost_usd"], 4)
+  return report
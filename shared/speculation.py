@@ -0,0 +1,133 @@
+'''Speculative prompt preparation while a workload waits in AWAITING_USER_CHOICE.
+
+Writing the image prompts is cheap next to generating the images and does not depend on the user's choice, so
+with SPECULATIVE_PROMPTS on, the preprocess worker enqueues a job on SPECULATIVE_QUEUE that writes them ahead of
+time. The comicgen workers drain that queue last, the job gives up (before it starts and between its LLM
+batches) when confirmed comicgen work is waiting, and at most SPECULATIVE_MAX_PENDING such jobs exist at once,
+so speculation never delays a confirmed comic.
+
+The prepared prompts are kept for SPECULATIVE_RESULT_TTL. Choosing NEW takes them if they still match the recipe
+(ComicGenFlow may have merged more instructions into panels since), choosing EXISTING drops them. Either choice
+marks the workload decided, so a job that is already running when the user decides stops at its next LLM batch
+and stores nothing.
+'''
+import json
+from redis.exceptions import WatchError
+from rq.job import Job, JobStatus
+from rq.exceptions import NoSuchJobError
+from .redis_client import redis_conn,speculative_queue
+from .degradation import backlog_pressure
+from .metrics import SPECULATIONS
+from .constants import SPECULATIVE_PROMPTS,SPECULATIVE_MAX_PENDING,SPECULATIVE_JOB_TIMEOUT,SPECULATIVE_RESULT_TTL
+
+def speculation_job_id(workload_id):
+  return f"speculative-{workload_id}"
+
+def _result_key(workload_id):
+  return f"workload:{workload_id}:speculative_prompts"
+
+def _decided_key(workload_id):
+  return f"workload:{workload_id}:speculation_decided"
+
+# Never fails the caller: a speculation that cannot be enqueued just means NEW writes the prompts itself
+def enqueue_speculation(workload_id, recipe_data):
+  if not SPECULATIVE_PROMPTS:
+    return
+  try:
+    if Job.exists(speculation_job_id(workload_id), connection=redis_conn):
+      return
+    pending = speculative_queue.count + speculative_queue.started_job_registry.count
+    if pending >= SPECULATIVE_MAX_PENDING:
+      SPECULATIONS.labels("skipped_budget").inc()
+      print(f"[Speculation] {pending} speculative jobs pending, not preparing prompts for workload {workload_id}")
+      return
+    speculative_queue.enqueue(
+      "comicgen_worker.speculative_prompts_task",
+      workload_id,
+      recipe_data["name"],
+      recipe_data["ingredients"],
+      recipe_data["instructions"],
+      job_id=speculation_job_id(workload_id),
+      job_timeout=SPECULATIVE_JOB_TIMEOUT,
+      result_ttl=0,
+    )
+    SPECULATIONS.labels("enqueued").inc()
+  except Exception as e:
+    print(f"[Warning] Failed to enqueue speculative prompts for workload {workload_id}: {e}")
+
+# Raised by check_speculation. outcome is the SPECULATIONS label the job counts
+class SpeculationStopped(Exception):
+  def __init__(self, outcome, message):
+    super().__init__(message)
+    self.outcome = outcome
+
+# Confirmed comics waiting in the queues come first
+def confirmed_backlog():
+  return backlog_pressure()["queue_depth"] > 0
+
+# Set by cancel_speculation once the user has chosen. From then on prepared prompts would not be read
+def speculation_decided(workload_id):
+  return bool(redis_conn.exists(_decided_key(workload_id)))
+
+# Checked by the speculative job before it starts and before each LLM batch of write_prompts, so a job stops
+# spending tokens as soon as confirmed work arrives or the user decides
+def check_speculation(workload_id):
+  if confirmed_backlog():
+    raise SpeculationStopped("skipped_backlog", "Confirmed comics are waiting")
+  if speculation_decided(workload_id):
+    raise SpeculationStopped("skipped_decided", "The user already chose")
+
+# Stores the prepared prompts, unless the user decided in the meantime: NEW has its comicgen job write its own
+# prompts by then, EXISTING never needs them
+def save_speculative_prompts(workload_id, plan):
+  try:
+    with redis_conn.pipeline() as pipe:
+      pipe.watch(_decided_key(workload_id))
+      if not pipe.exists(_decided_key(workload_id)):
+        pipe.multi()
+        pipe.set(_result_key(workload_id), json.dumps(plan), ex=SPECULATIVE_RESULT_TTL)
+        pipe.execute()
+        SPECULATIONS.labels("prepared").inc()
+        return True
+  except WatchError:
+    pass
+  SPECULATIONS.labels("skipped_decided").inc()
+  return False
+
+# Returns the prepared images_data for this recipe and its panels and removes it, or None when there is none or it
+# was prepared for a different recipe or panel plan
+def take_speculative_prompts(workload_id, recipe_data, panels):
+  try:
+    pipe = redis_conn.pipeline()
+    pipe.get(_result_key(workload_id))
+    pipe.delete(_result_key(workload_id))
+    raw, _ = pipe.execute()
+  except Exception as e:
+    print(f"[Warning] Failed to read speculative prompts for workload {workload_id}: {e}")
+    return None
+  if raw is None:
+    return None
+
+  plan = json.loads(raw)
+  if plan["recipe_data"] != recipe_data or plan.get("panels") != panels:
+    SPECULATIONS.labels("stale").inc()
+    return None
+  SPECULATIONS.labels("used").inc()
+  return plan["images_data"]
+
+# A job still queued when the user decides would only run after the confirmed one, so it is cancelled, and a
+# running one is told not to store its result. Unless the prompts are still wanted (NEW), anything already
+# prepared is dropped too
+def cancel_speculation(workload_id, drop_results=True):
+  try:
+    redis_conn.set(_decided_key(workload_id), 1, ex=SPECULATIVE_RESULT_TTL)
+    try:
+      job = Job.fetch(speculation_job_id(workload_id), connection=redis_conn)
+      if job.get_status() in (JobStatus.QUEUED, JobStatus.DEFERRED, JobStatus.SCHEDULED):
+        job.cancel()
+    except NoSuchJobError:
+      pass
+    if drop_results and redis_conn.delete(_result_key(workload_id)):
+      SPECULATIONS.labels("discarded").inc()
+  except Exception as e:
+    print(f"[Warning] Failed to cancel speculative prompts for workload {workload_id}: {e}")
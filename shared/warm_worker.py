@@ -0,0 +1,70 @@
+'''Warm RQ worker processes.
+
+RQ forks a work-horse per job and imports the task by dotted path inside it. When the parent has not imported
+the task module, every job pays for importing crewAI, openai, PIL and praw and for rebuilding the Supabase and
+OpenAI clients. Here the parent preloads all of that once, so each forked work-horse starts warm. Jobs keep
+their fork isolation, and the warm parent is replaced after WORKER_MAX_JOBS jobs so leaks cannot accumulate.
+'''
+import importlib
+import multiprocessing
+import os
+import time
+from rq import Worker
+from .metrics import start_metrics_server,mark_process_dead
+
+WORKER_MAX_JOBS = int(os.environ.get("WORKER_MAX_JOBS", 50))
+
+# (file name, size) pairs used by the page styling helpers
+PRELOADED_FONTS = [("PatrickHand.ttf", 25), ("Pattaya.ttf", 46), ("Pattaya.ttf", 48), ("Pattaya.ttf", 68)]
+
+class WarmWorker(Worker):
+  # Records the fork time in the environment the work-horse inherits, so the job can report its startup time
+  def fork_work_horse(self, job, queue):
+    os.environ["WORK_HORSE_FORKED_AT"] = str(time.time())
+    return super().fork_work_horse(job, queue)
+
+  # The work-horse has exited once monitoring returns, also when it was killed mid-job
+  def monitor_work_horse(self, job, queue):
+    horse_pid = self.horse_pid
+    try:
+      return super().monitor_work_horse(job, queue)
+    finally:
+      mark_process_dead(horse_pid)
+
+# Imports the task modules and builds the shared clients so forked work-horses inherit them
+def preload(task_modules, warm_fonts=False):
+  started = time.perf_counter()
+  for module_name in task_modules:
+    importlib.import_module(module_name)
+
+  from .helpers import get_openai_client, load_font
+  from .supabase_client import supabase  # created at import time
+  get_openai_client()
+  if warm_fonts:
+    for file_name, size in PRELOADED_FONTS:
+      load_font(file_name, size)
+
+  print(f"[Warm Worker] Preloaded {', '.join(task_modules)} in {time.perf_counter() - started:.2f}s ✅")
+
+def _serve(queue_names, task_modules, warm_fonts, max_jobs):
+  from .redis_client import redis_conn
+
+  preload(task_modules, warm_fonts)
+  worker = WarmWorker(queue_names, connection=redis_conn)
+  # The scheduler re-enqueues jobs whose Retry has an interval (fan-out image jobs)
+  worker.work(logging_level="DEBUG", max_jobs=max_jobs, with_scheduler=True)
+
+# Supervises warm parents: each one preloads, serves max_jobs jobs and exits, then a fresh one takes over.
+# The supervisor itself stays light and owns the /metrics server
+def run_warm_worker(queue_names, task_modules, warm_fonts=False, max_jobs=WORKER_MAX_JOBS):
+  start_metrics_server(int(os.environ.get("METRICS_PORT", 9100)))
+  context = multiprocessing.get_context("fork")
+  while True:
+    warm_parent = context.Process(target=_serve, args=(queue_names, task_modules, warm_fonts, max_jobs))
+    warm_parent.start()
+    warm_parent.join()
+    mark_process_dead(warm_parent.pid)
+    print(f"[Warm Worker] Warm parent exited with code {warm_parent.exitcode}, starting a fresh one")
+    if warm_parent.exitcode not in (0, None):
+      # Avoid a hot restart loop when the parent cannot start (e.g. Redis is down)
+      time.sleep(5)
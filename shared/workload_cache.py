@@ -0,0 +1,97 @@
+'''Redis read-through cache for the public workload status payload served by GET /workloads/<public_id>.
+
+The orchestrator reads through it; the workers and the orchestrator write through it every time they change a
+workload row, so polling clients see new statuses without hitting Supabase. Entries expire after a short TTL as
+a safety net for any write that does not go through here.
+'''
+import hashlib
+import json
+from .redis_client import redis_conn
+from .supabase_client import supabase
+from .constants import WORKLOAD_CACHE_TTL
+from .metrics import external_call
+
+def _cache_key(public_id):
+  return f"workload:{public_id}"
+
+# Comic ids of a cached payload, as (comic id, similar comic ids)
+def _payload_comic_ids(payload):
+  return (payload["comic"] or {}).get("id"), [comic["id"] for comic in payload["similar_comics"]]
+
+# Builds the public payload from a workloads row. Internal ids are left out on purpose. cached is the payload
+# cached for the row before this write: most writes only move the status, so its comics are reused unless the
+# row now points at other comics (the similar comics found by preprocessing, the finished or chosen comic)
+def build_workload_payload(row, cached=None):
+  recipe_data = None
+  if row.get("recipe_name"):
+    recipe_data = {
+      "name": row["recipe_name"],
+      "ingredients": row.get("ingredients") or [],
+      "instructions": row.get("instructions") or [],
+    }
+
+  comic = None
+  similar_comics = []
+  comic_id = row.get("comic_id")
+  similar_ids = [similar_id for similar_id in row.get("similar_comics") or [] if similar_id]
+  if cached is not None and _payload_comic_ids(cached) == (comic_id, similar_ids):
+    comic = cached["comic"]
+    similar_comics = cached["similar_comics"]
+  elif comic_id or similar_ids:
+    with external_call("supabase_comics_lookup"):
+      comics = supabase.table("comics").select("id,name,preview_img_url,reddit_url").in_("id", ([comic_id] if comic_id else []) + similar_ids).execute().data
+    comics_by_id = {comic_row["id"]: comic_row for comic_row in comics}
+    comic = comics_by_id.get(comic_id)
+    similar_comics = [comics_by_id[similar_id] for similar_id in similar_ids if similar_id in comics_by_id]
+
+  return {
+    "workload_id": row["public_id"],
+    "status": row["status"],
+    "recipe_data": recipe_data,
+    "similar_comics": similar_comics,
+    "comic_url": comic["reddit_url"] if comic else None,
+    "comic": comic,
+  }
+
+# Serializes and stores the payload for a row. Returns the JSON body that was cached
+def cache_workload(row, cached=None):
+  body = json.dumps(build_workload_payload(row, cached), sort_keys=True)
+  redis_conn.set(_cache_key(row["public_id"]), body, ex=WORKLOAD_CACHE_TTL)
+  return body
+
+# Write-through hook for the rows returned by a Supabase update/insert. A cache failure must never fail the
+# workload itself, so errors only drop the entry (readers then fall back to the DB)
+def refresh_workload_cache(rows):
+  for row in rows or []:
+    try:
+      cached = redis_conn.get(_cache_key(row["public_id"]))
+      cache_workload(row, json.loads(cached) if cached is not None else None)
+    except Exception as e:
+      print(f"[Warning] Failed to refresh workload cache: {e}")
+      try:
+        redis_conn.delete(_cache_key(row["public_id"]))
+      except Exception:
+        pass
+
+# Returns the cached JSON body for a workload, loading it from Supabase on a miss. None if it does not exist
+def get_workload_body(public_id):
+  try:
+    body = redis_conn.get(_cache_key(public_id))
+    if body is not None:
+      return body.decode() if isinstance(body, bytes) else body
+  except Exception as e:
+    print(f"[Warning] Workload cache read failed, falling back to DB: {e}")
+
+  with external_call("supabase_workload_lookup"):
+    rows = supabase.table("workloads").select("*").eq("public_id", public_id).limit(1).execute().data
+  if not rows:
+    return None
+  try:
+    return cache_workload(rows[0])
+  except Exception as e:
+    print(f"[Warning] Failed to fill workload cache: {e}")
+    return json.dumps(build_workload_payload(rows[0]), sort_keys=True)
+
+# Strong ETag for a cached body (unquoted, Flask's set_etag adds the quotes)
+def body_etag(body):
+  return hashlib.sha1(body.encode()).hexdigest()
@@ -0,0 +1,29 @@
+'''Per-workload options chosen at intake (e.g. the image quality tier), kept in Redis under the internal workload id.
+
+Options are read by whichever worker ends up running the workload, so they survive the detour through
+AWAITING_USER_CHOICE without being threaded through every job argument.
+'''
+import json
+from .redis_client import redis_conn
+from .constants import WORKLOAD_OPTIONS_TTL
+
+def _options_key(workload_id):
+  return f"workload:{workload_id}:options"
+
+def save_workload_options(workload_id, options):
+  if options:
+    redis_conn.set(_options_key(workload_id), json.dumps(options), ex=WORKLOAD_OPTIONS_TTL)
+
+def update_workload_options(workload_id, **options):
+  current = get_workload_options(workload_id)
+  current.update(options)
+  save_workload_options(workload_id, current)
+
+# Missing options (or an unreachable Redis) just mean defaults
+def get_workload_options(workload_id):
+  try:
+    raw = redis_conn.get(_options_key(workload_id))
+  except Exception as e:
+    print(f"[Warning] Failed to read workload options, using defaults: {e}")
+    return {}
+  return json.loads(raw) if raw else {}
@@ -0,0 +1,29 @@
+'''Shared fixtures. Tests run from the repo root against the in-memory fakes in benchmarks/fakes, so they need
+neither Redis nor Supabase (fakeredis is required for the Redis-backed modules).
+'''
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# The fakes have to be installed before any shared module imports shared.supabase_client or shared.redis_client
+from benchmarks.fakes.supabase_fake import install_fake_supabase
+from benchmarks.fakes.redis_fake import install_fake_redis
+
+fake_db = install_fake_supabase()
+fake_redis = install_fake_redis()
+
+@pytest.fixture
+def db():
+  fake_db.tables.clear()
+  return fake_db
+
+@pytest.fixture
+def redis():
+  if fake_redis is None:
+    pytest.skip("fakeredis is not installed")
+  fake_redis.flushall()
+  return fake_redis
@@ -0,0 +1,133 @@
+import json
+
+import pytest
+
+import shared.intake_dedup as intake_dedup
+from shared.intake_dedup import claim_intake, complete_intake, release_intake, IdempotencyKeyConflict, IntakePending
+from shared.workload_cache import refresh_workload_cache
+from shared.helpers import workload_failed
+from shared.constants import WORKLOAD_STATUSES
+
+RECIPE = "Pancakes\n2 cups flour\n1 egg\nMix and fry."
+OPTIONS = {"quality_tier": "standard", "deadline_seconds": None, "profile": False}
+
+def create_workload(db, status=WORKLOAD_STATUSES['starting_workload']):
+  rows = db.table("workloads").insert({"prompt": RECIPE, "status": status}).execute().data
+  refresh_workload_cache(rows)
+  return rows[0]
+
+def submit(db, idempotency_key=None, input_text=RECIPE, options=OPTIONS):
+  claim = claim_intake(idempotency_key, input_text, options)
+  if claim.public_id:
+    return claim, claim.public_id
+  workload = create_workload(db)
+  complete_intake(claim, workload["public_id"])
+  return claim, workload["public_id"]
+
+# Makes the next GET of `key` inside a WATCHed pipeline race with another client that writes `value`
+def race_on(monkeypatch, redis, key, value):
+  pipeline = redis.pipeline
+  raced = []
+  def racing_pipeline(*args, **kwargs):
+    pipe = pipeline(*args, **kwargs)
+    get = pipe.get
+    def racing_get(name):
+      result = get(name)
+      if name == key and not raced:
+        raced.append(name)
+        redis.set(key, value)
+      return result
+    pipe.get = racing_get
+    return pipe
+  monkeypatch.setattr(redis, "pipeline", racing_pipeline)
+  return raced
+
+def content_key(options=OPTIONS):
+  return f"intake:content:{intake_dedup.content_digest(RECIPE, options)}"
+
+def test_duplicates_get_the_first_workload(db, redis):
+  _, public_id = submit(db)
+  claim, duplicate_id = submit(db, input_text="  Pancakes 2 cups flour\n\n1 egg   Mix and fry. ")
+  assert duplicate_id == public_id
+  assert claim.owned == []
+  assert len(db.tables["workloads"]) == 1
+
+def test_other_options_get_their_own_workload(db, redis):
+  _, public_id = submit(db)
+  _, other_id = submit(db, options={**OPTIONS, "quality_tier": "draft"})
+  assert other_id != public_id
+
+def test_idempotency_key_reused_for_other_content_conflicts(db, redis):
+  submit(db, idempotency_key="retry-1")
+  with pytest.raises(IdempotencyKeyConflict):
+    claim_intake("retry-1", "Something else entirely", OPTIONS)
+  # The conflicting submission holds nothing afterwards
+  assert not redis.exists(f"intake:content:{intake_dedup.content_digest('Something else entirely', OPTIONS)}")
+
+def test_duplicate_of_a_pending_submission_gives_up_after_the_wait(db, redis, monkeypatch):
+  monkeypatch.setattr(intake_dedup, "INTAKE_PENDING_WAIT", 0.1)
+  first = claim_intake(None, RECIPE, OPTIONS)
+  with pytest.raises(IntakePending):
+    claim_intake(None, RECIPE, OPTIONS)
+  assert json.loads(redis.get(content_key()))["token"] == first.token
+
+def test_release_drops_only_keys_the_submission_still_holds(db, redis):
+  first = claim_intake(None, RECIPE, OPTIONS)
+  second = claim_intake(None, RECIPE, {**OPTIONS, "profile": True})
+  redis.set(content_key(), json.dumps({"token": "someone-else", "content": first.content, "public_id": None}))
+  release_intake(first)
+  release_intake(second)
+  assert json.loads(redis.get(content_key()))["token"] == "someone-else"
+  assert not redis.exists(content_key({**OPTIONS, "profile": True}))
+
+def test_release_loses_a_race_to_a_concurrent_writer(db, redis, monkeypatch):
+  claim = claim_intake(None, RECIPE, OPTIONS)
+  takeover = json.dumps({"token": "someone-else", "content": claim.content, "public_id": None})
+  raced = race_on(monkeypatch, redis, content_key(), takeover)
+  release_intake(claim)
+  assert raced
+  assert json.loads(redis.get(content_key()))["token"] == "someone-else"
+
+def test_complete_does_not_overwrite_a_claim_taken_over_in_between(db, redis, monkeypatch):
+  claim = claim_intake(None, RECIPE, OPTIONS)
+  takeover = json.dumps({"token": "someone-else", "content": claim.content, "public_id": "other-workload"})
+  raced = race_on(monkeypatch, redis, content_key(), takeover)
+  complete_intake(claim, "my-workload")
+  assert raced
+  assert json.loads(redis.get(content_key()))["public_id"] == "other-workload"
+
+def test_complete_does_not_point_an_expired_key_claimed_by_another_submission(db, redis):
+  claim = claim_intake(None, RECIPE, OPTIONS)
+  redis.delete(content_key())
+  other = claim_intake(None, RECIPE, OPTIONS)
+  complete_intake(claim, "my-workload")
+  assert json.loads(redis.get(content_key()))["token"] == other.token
+
+@pytest.mark.parametrize("status", [WORKLOAD_STATUSES['failed_error'], WORKLOAD_STATUSES['failed_timeout']])
+def test_failed_workload_claims_are_taken_over(db, redis, status):
+  _, public_id = submit(db)
+  row = db.table("workloads").update({"status": status}).eq("public_id", public_id).execute().data
+  refresh_workload_cache(row)
+  _, retry_id = submit(db)
+  assert retry_id != public_id
+
+def test_crashed_workload_claims_are_taken_over(db, redis):
+  _, public_id = submit(db)
+  workload = db.table("workloads").select("*").eq("public_id", public_id).execute().data[0]
+  # What the workers' generic error handlers do
+  workload_failed(workload["id"])
+  _, retry_id = submit(db)
+  assert retry_id != public_id
+  # The next duplicate joins the retry
+  _, duplicate_id = submit(db)
+  assert duplicate_id == retry_id
+
+def test_take_over_loses_a_race_to_another_duplicate(db, redis, monkeypatch):
+  _, public_id = submit(db)
+  workload_failed(db.table("workloads").select("*").eq("public_id", public_id).execute().data[0]["id"])
+  raw = redis.get(content_key())
+  other = json.dumps({"token": "someone-else", "content": json.loads(raw)["content"], "public_id": None})
+  race_on(monkeypatch, redis, content_key(), other)
+  claim = intake_dedup.IntakeClaim(None, RECIPE, OPTIONS)
+  assert intake_dedup._take_over(content_key(), raw, claim.value()) is False
+  assert json.loads(redis.get(content_key()))["token"] == "someone-else"
@@ -0,0 +1,99 @@
+import itertools
+
+import pytest
+
+from shared.panel_planner import group_instructions, group_minor_ingredients, is_minor_ingredient, plan_panels, image_count, parse_quantity
+from shared.pydantic_models import IngredientData, RecipeData
+from shared.constants import PANEL_MAX_STEPS, PANEL_MAX_COMBINED_INGREDIENTS
+
+def cost(instructions, panels):
+  return sum(sum(len(instructions[index]) for index in panel) ** 2 for panel in panels)
+
+# Every split of the steps into at most max_panels consecutive runs of up to PANEL_MAX_STEPS steps
+def all_splits(count, max_panels):
+  for cuts_count in range(0, max_panels):
+    for cuts in itertools.combinations(range(1, count), cuts_count):
+      bounds = [0, *cuts, count]
+      panels = [list(range(start, end)) for start, end in zip(bounds, bounds[1:])]
+      if all(len(panel) <= PANEL_MAX_STEPS for panel in panels):
+        yield panels
+
+# Step lengths and panel budgets that force grouping
+SPLIT_CASES = [
+  ((10, 200, 10, 10, 180, 15, 20), 4),
+  ((50, 50, 50, 50, 50, 50, 50, 50), 2),
+  ((5, 300, 5, 5, 5, 5, 250, 5, 5), 5),
+  ((120, 3, 4, 90, 2, 60, 60, 1, 1, 1), 3),
+]
+
+def steps(*lengths):
+  return ["x" * length for length in lengths]
+
+def test_group_instructions_keeps_single_panels_within_the_budget():
+  assert group_instructions(steps(5, 6, 7), 3) == [[0], [1], [2]]
+
+def test_group_instructions_is_none_when_the_steps_cannot_fit():
+  assert group_instructions(steps(*[10] * (2 * PANEL_MAX_STEPS + 1)), 2) is None
+  assert group_instructions(steps(10, 10), 0) is None
+
+@pytest.mark.parametrize("lengths,max_panels", SPLIT_CASES)
+def test_group_instructions_covers_the_steps_in_order_within_the_bounds(lengths, max_panels):
+  instructions = steps(*lengths)
+  panels = group_instructions(instructions, max_panels)
+  assert len(panels) <= max_panels
+  assert all(1 <= len(panel) <= PANEL_MAX_STEPS for panel in panels)
+  assert [index for panel in panels for index in panel] == list(range(len(instructions)))
+
+@pytest.mark.parametrize("lengths,max_panels", SPLIT_CASES)
+def test_group_instructions_finds_the_cheapest_split(lengths, max_panels):
+  instructions = steps(*lengths)
+  best = min(cost(instructions, panels) for panels in all_splits(len(instructions), max_panels))
+  assert cost(instructions, group_instructions(instructions, max_panels)) == best
+
+def test_group_instructions_pairs_short_neighbours_and_leaves_long_steps_alone():
+  assert group_instructions(steps(10, 10, 300, 10, 10), 3) == [[0, 1], [2], [3, 4]]
+
+@pytest.mark.parametrize("quantity", ["1 tsp", "½ teaspoon", "a pinch", "A pinch", "2 dashes", "to taste", "salt as needed", "for garnish"])
+def test_explicitly_minor_quantities(quantity):
+  assert is_minor_ingredient(IngredientData(name="salt", quantity=quantity))
+
+@pytest.mark.parametrize("quantity", ["Two large", "1 (400g) can", "some", "2 cups", "1 tbsp", "500 g", ""])
+def test_other_quantities_are_main_ingredients(quantity):
+  assert not is_minor_ingredient(IngredientData(name="tomatoes", quantity=quantity))
+
+def test_parse_quantity():
+  assert parse_quantity("1 1/2 cups") == ("1 1/2", "cups")
+  assert parse_quantity("2-3 large") == ("2-3", "large")
+  assert parse_quantity("to taste") is None
+
+def test_group_minor_ingredients_only_combines_minor_ones():
+  ingredients = [
+    IngredientData(name="flour", quantity="2 cups"),
+    IngredientData(name="salt", quantity="1 tsp"),
+    IngredientData(name="eggs", quantity="Two large"),
+    IngredientData(name="pepper", quantity="to taste"),
+    IngredientData(name="tomatoes", quantity="1 (400g) can"),
+    IngredientData(name="parsley", quantity="for garnish"),
+  ]
+  assert group_minor_ingredients(ingredients) == [[0], [2], [4], [1, 3, 5]]
+
+def test_group_minor_ingredients_caps_combined_panels_and_keeps_a_lone_minor_ingredient():
+  ingredients = [IngredientData(name=f"spice {index}", quantity="a pinch") for index in range(PANEL_MAX_COMBINED_INGREDIENTS + 1)]
+  assert group_minor_ingredients(ingredients) == [[PANEL_MAX_COMBINED_INGREDIENTS], list(range(PANEL_MAX_COMBINED_INGREDIENTS))]
+
+def recipe(ingredients, instructions):
+  return RecipeData(name="Test", ingredients=[IngredientData(name=name, quantity=quantity) for name, quantity in ingredients], instructions=instructions)
+
+def test_plan_panels_keeps_recipes_within_the_budget_as_they_are():
+  plan = plan_panels(recipe([("flour", "2 cups"), ("salt", "1 tsp")], ["Mix", "Bake"]), budget=20)
+  assert plan == {"ingredients": [[0], [1]], "instructions": [[0], [1]]}
+
+def test_plan_panels_fits_large_recipes_into_the_budget():
+  ingredients = [(f"main {index}", "2 cups") for index in range(8)] + [(f"spice {index}", "a pinch") for index in range(6)]
+  plan = plan_panels(recipe(ingredients, steps(*[40] * 14)), budget=20)
+  assert image_count(plan) <= 20
+  assert sorted(index for panel in plan["ingredients"] for index in panel) == list(range(14))
+
+def test_plan_panels_rejects_what_cannot_fit():
+  ingredients = [(f"main {index}", "2 cups") for index in range(18)]
+  assert plan_panels(recipe(ingredients, steps(*[40] * 10)), budget=20) is None
@@ -1,24 +1,33 @@
 from crewai.flow.flow import Flow, listen, start
 from crewai import Crew,Task,Agent,Process
 import json
-from openai import OpenAI
-from PIL import Image,ImageDraw,ImageFont
-from io import BytesIO
-import requests
 import time
 from pydantic import ValidationError
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED, ALL_COMPLETED, TimeoutError as FutureTimeoutError
 from postgrest import APIError
-import os
-from shared.helpers import print_state,dalle_api_call,style_ing_image,style_ins_image,draw_page_title,get_reddit_preview_image,upload_comic_to_reddit,workload_status_update
-from shared.pydantic_models import RecipeData,ImagesData,ImageObject,ImagePrompt
-from shared.constants import RL_DALEE_WAIT_TIME,RL_DALLEE_BATCH_SIZE,FINAL_PAGE_WIDTH,FINAL_PAGE_HEIGHT,PS_TITLE_HEIGHT,WORKLOAD_STATUSES
+from shared.helpers import print_state,dalle_api_call,style_ing_image,style_ins_image,style_multi_step_image,ins_panel_height,compose_cover_page,compose_ingredient_page,compose_instruction_page,download_image,get_reddit_preview_image,upload_comic_to_reddit,workload_status_update,get_openai_client,deadline_llm
+from shared.pydantic_models import RecipeData,IngredientData,ImagesData,ImageObject,ImagePrompt
+from shared.constants import RL_DALEE_WAIT_TIME,RL_DALLEE_BATCH_SIZE,ING_PER_PAGE,INS_PER_PAGE,FINAL_PAGE_HEIGHT,PS_TITLE_HEIGHT,IMAGE_BUDGET,WORKLOAD_STATUSES,SINGLEFLIGHT_PROMPT_TTL,PROGRESSIVE_PAGES,PAGE_ENCODE_WORKERS,PAGE_DERIVATIVE_FORMAT,PUBLIC_BASE_URL
 from shared.supabase_client import supabase
+from shared.image_store import ImageStore
+from shared.workload_cache import refresh_workload_cache
+from shared.workload_options import get_workload_options
+from shared.size_planner import resolve_quality_tier,generation_savings_report
+from shared.metrics import timed_stage,external_call,submit_in_context
+from shared.singleflight import singleflight
+from shared.page_store import page_store
+from shared.page_encoding import encode_page,encode_derivatives
+from shared.deadline import DeadlineExceeded,call_timeout,call_with_deadline,sleep_within_deadline
+from shared.degradation import backlog_pressure,choose_degradations,record_degradations,merge_short_instructions,remember_ingredient_art,cached_ingredient_art
+from shared.speculation import take_speculative_prompts
+from shared.panel_planner import plan_panels,image_count
 
 class ComicGenFlow(Flow):
-	def __init__(self, recipe_data,workload_id):
+	# fleet_rate_limited is set by runners that run many flows in one process (batch/run_batch.py): image calls then
+	# share the fleet-wide rate limiter instead of every flow pacing its own batches
+	def __init__(self, recipe_data,workload_id,fleet_rate_limited=False):
 		super().__init__()
+		self.fleet_rate_limited = fleet_rate_limited
 
     # Save recipe_data in state variable after validaton
 		try:
@@ -27,6 +36,17 @@ class ComicGenFlow(Flow):
 		except ValidationError as e:
 			raise ValueError(f"[Application Exception] Invalid input recieved by ComicGenFlow. Invalid recipe_data: {e}")
 
+		# Recipe indices on each ingredient and instruction image (see shared/panel_planner.py). Large recipes share
+		# panels to stay within IMAGE_BUDGET images
+		self.state['panels'] = plan_panels(self.state['recipe_data'])
+		if self.state['panels'] is None:
+			raise ValueError(f"[Application Exception] The recipe does not fit into {IMAGE_BUDGET} images even with shared panels")
+
+		# Quality tier picked at intake decides which generation sizes the planner may use
+		self.state['quality_tier'] = resolve_quality_tier(get_workload_options(workload_id).get("quality_tier"))
+		# Fidelity traded for throughput under backlog, decided when generate_prompts starts
+		self.state['degradations'] = []
+
     # Create empty images_data state variable
 		self.state['images_data'] = ImagesData(
       cover_page=ImageObject(type="POSTER",prompt="", url="", styled_image=""),
@@ -34,20 +54,48 @@ class ComicGenFlow(Flow):
       instruction_images=[]
     )
 
+		# Styled images and composed pages live here as encoded bytes, state only keeps their references
+		self.image_store = ImageStore(workload_id)
+		# Composed pages by page number
+		self.state['pages'] = {}
+		# Derivatives of the cover page by variant, they become the comic's preview
+		self.state['cover_previews'] = {}
+
 		print("ComicGenFlow constructor sucess ✅")
 		print_state(self.state)
 
 	# (1) Generate image prompts for (i)List of ingredients (ii)List of instructions and (iii)Poster/Cover page,
 	@start()
+	@timed_stage("generate_prompts")
 	def generate_prompts(self):
 		workload_status_update(self.state['workload_id'],WORKLOAD_STATUSES['generating_prompts'])
+		self.apply_degradations()
+
+		# Prompts prepared while the workload waited in AWAITING_USER_CHOICE (see shared/speculation.py)
+		speculative_images = take_speculative_prompts(self.state['workload_id'], self.state['recipe_data'].model_dump(), self.state['panels'])
+		if speculative_images is None:
+			self.write_prompts()
+			return
+		images_data = ImagesData(**speculative_images)
+		for index, art in self.reused_ingredient_art().items():
+			images_data.ingredient_images[index] = ImageObject(type="ING", styled_image="", **art)
+		self.state['images_data'] = images_data
+		print(f"[Comicgen Worker] Using speculatively prepared prompts for- {self.state['workload_id']}")
+
+	# Writes the prompts into images_data. Updates no status, so a speculative job can run it for a workload that
+	# is still waiting for the user's choice. check, if given, runs before every LLM batch and raises to stop early
+	# (see check_speculation in shared/speculation.py)
+	def write_prompts(self, check=None):
+		check = check or (lambda: None)
 		recipe_data = self.state['recipe_data']
+		panels = self.state['panels']
 
 		prompt_generation_agent = Agent(
 			role="Image Prompt Creator",
 			goal="Create image generation prompts in the with comic art style.",
 			backstory='''You are an AI-powered creator with deep knowledge of recipes and ingredients. You are a part of a crew which makes comic style recipe books. 
 			You are responsible for creating image generation prompt for the ingredients, instructions and cover page of the recipe book.''',
+			llm=deadline_llm(),
 			verbose=True
     )
 
@@ -70,9 +118,33 @@ class ComicGenFlow(Flow):
     )
 		ingredient_inputs= [
 			{"name": ing.name, "quantity": ing.quantity}
-			for ing in recipe_data.ingredients
+			for ing in (self.panel_ingredient(index) for index in range(len(panels['ingredients'])))
     ]
-		ing_results = ingredient_crew.kickoff_for_each(inputs=ingredient_inputs)
+		# Each ingredient is coalesced on its normalized name and quantity, so concurrent workloads needing the same
+		# ingredient (and repeated ingredients within a recipe) share one LLM call. Same per-input crew copy as kickoff_for_each
+		def ingredient_prompt(ing_input):
+			with external_call("llm_ingredient_prompt"):
+				return json.loads(call_with_deadline("llm_ingredient_prompt", ingredient_crew.copy().kickoff, inputs=ing_input).raw)['prompt']
+		# Combined panels of minor ingredients get a fixed prompt, the LLM task is written for a single ingredient
+		ing_prompts = [None] * len(ingredient_inputs)
+		for index, panel in enumerate(panels['ingredients']):
+			if len(panel) > 1:
+				ing_prompts[index] = self.combined_panel_prompt(index)
+		# Ingredients with reused art need neither a prompt nor an image
+		reused_art = self.reused_ingredient_art()
+		for index, art in reused_art.items():
+			ing_prompts[index] = art["prompt"]
+		llm_indices = [index for index, prompt in enumerate(ing_prompts) if prompt is None]
+		if llm_indices:
+			with external_call("llm_ingredient_prompts"):
+				for index in llm_indices:
+					check()
+					ing_prompts[index] = singleflight(
+						"ingredient_prompt",
+						{key: value.strip().lower() for key, value in ingredient_inputs[index].items()},
+						lambda ing_input=ingredient_inputs[index]: ingredient_prompt(ing_input),
+						result_ttl=SINGLEFLIGHT_PROMPT_TTL,
+					)
 
 		#ii)Instructions
 		instruction_task = Task(
@@ -88,8 +160,11 @@ class ComicGenFlow(Flow):
 			verbose=True,
 			process=Process.sequential
     )
-		instuction_inputs = [{"step": step} for step in recipe_data.instructions]
-		ins_results = instruction_crew.kickoff_for_each(inputs=instuction_inputs)
+		# A multi-step panel gets one prompt for all of its steps
+		instuction_inputs = [{"step": self.panel_instruction_text(index)} for index in range(len(panels['instructions']))]
+		check()
+		with external_call("llm_instruction_prompts"):
+			ins_results = call_with_deadline("llm_instruction_prompts", instruction_crew.kickoff_for_each, inputs=instuction_inputs)
 
 		#iii)Poster
 		poster_task = Task(
@@ -105,21 +180,26 @@ class ComicGenFlow(Flow):
 			tasks=[poster_task],
 			verbose=True
     )
-		poster_prompt = poster_crew.kickoff()
+		check()
+		with external_call("llm_poster_prompt"):
+			poster_prompt = call_with_deadline("llm_poster_prompt", poster_crew.kickoff)
 
 		# Check assertion
-		if not len(ing_results) == len(recipe_data.ingredients):
-			raise AssertionError(f"[Application Exception] Length of Ingredients from recipe_data and prompt results is not the same")
-		if not len(ins_results) == len(recipe_data.instructions):
-			raise AssertionError(f"[Application Exception] Length of Instructions from recipe_data and prompt results is not the same")
+		if not len(ing_prompts) == len(panels['ingredients']):
+			raise AssertionError(f"[Application Exception] Length of Ingredient panels and prompt results is not the same")
+		if not len(ins_results) == len(panels['instructions']):
+			raise AssertionError(f"[Application Exception] Length of Instruction panels and prompt results is not the same")
 
 		# Parsing the output & updating state
 		ingredient_images = []
-		for m in range(len(ing_results)):
+		for m in range(len(ing_prompts)):
+			if m in reused_art:
+				ingredient_images.append(ImageObject(type="ING", styled_image="", **reused_art[m]))
+				continue
 			ingredient_images.append(
 				ImageObject(
 				type = "ING",
-				prompt = json.loads(ing_results[m].raw)['prompt'],
+				prompt = ing_prompts[m],
 				url = "",
 				styled_image = "")
 			)
@@ -139,207 +219,302 @@ class ComicGenFlow(Flow):
 
 		# print_state(self.state)
 
+	# Trades fidelity for throughput when the comicgen backlog is deep (see shared/degradation.py). Runs before any
+	# prompt or image is paid for. Reused ingredient art is picked up while the prompts are written
+	def apply_degradations(self):
+		pressure = backlog_pressure()
+		degradations = choose_degradations(pressure)
+		self.state['degradations'] = degradations
+		if not degradations:
+			return
+
+		if "draft_tier" in degradations:
+			self.state['quality_tier'] = "draft"
+		if "merge_instructions" in degradations:
+			panels = self.state['panels']
+			instruction_panels = merge_short_instructions(self.state['recipe_data'].instructions, panels['instructions'])
+			print(f"[Comicgen Worker] Merged {len(panels['instructions'])} instruction panels into {len(instruction_panels)}")
+			panels['instructions'] = instruction_panels
+		record_degradations(self.state['workload_id'], degradations, pressure)
+		print(f"[Comicgen Worker] Degraded workload {self.state['workload_id']} under {pressure}: {degradations}")
+
+	# Recently generated art for this recipe's ingredients by ingredient panel index. Empty unless the workload got
+	# the reuse_ingredient_art degradation. Combined panels are never reused
+	def reused_ingredient_art(self):
+		if "reuse_ingredient_art" not in self.state['degradations']:
+			return {}
+		ingredient_panels = self.state['panels']['ingredients']
+		reused_art = {}
+		for index, panel in enumerate(ingredient_panels):
+			if len(panel) > 1:
+				continue
+			art = cached_ingredient_art(self.state['recipe_data'].ingredients[panel[0]].name)
+			if art:
+				reused_art[index] = art
+		print(f"[Comicgen Worker] Reusing ingredient art for {len(reused_art)} of {len(ingredient_panels)} ingredient panels")
+		return reused_art
+
+	# The ingredient shown on an ingredient panel. A combined panel lists the names and quantities of its ingredients
+	def panel_ingredient(self, index):
+		ingredients = [self.state['recipe_data'].ingredients[ing_index] for ing_index in self.state['panels']['ingredients'][index]]
+		if len(ingredients) == 1:
+			return ingredients[0]
+		return IngredientData(name=", ".join(ing.name for ing in ingredients), quantity=", ".join(ing.quantity for ing in ingredients))
+
+	# Prompt of a combined ingredient panel, written without the LLM
+	def combined_panel_prompt(self, index):
+		names = [" ".join(self.state['recipe_data'].ingredients[ing_index].name.split()).lower() for ing_index in self.state['panels']['ingredients'][index]]
+		return (f"A small group of ingredients side by side, {', '.join(names[:-1])} and {names[-1]}, each in its own small bowl or pile, "
+			"comic art style illustration, bold black outlines, vibrant flat colors, centered on a plain white background, no text")
+
+	def panel_steps(self, index):
+		return [self.state['recipe_data'].instructions[step_index] for step_index in self.state['panels']['instructions'][index]]
+
+	def panel_instruction_text(self, index):
+		return " ".join(step.strip() for step in self.panel_steps(index))
+
 	# (2) Generate DallE images using prompts
 	@listen(generate_prompts)
+	@timed_stage("generate_images")
 	def generate_images(self):
 		workload_status_update(self.state['workload_id'],WORKLOAD_STATUSES['generating_images'])
-		client = OpenAI()
+		client = get_openai_client()
+
+		# All images including poster,ingredients & instructions, except reused art. For each of them dall api will be called.
+		# The poster goes first so the cover is the first page that can be published
+		pending_images = [name for name in self.image_names() if not self.image_object(name).url]
+		if PROGRESSIVE_PAGES:
+			page_store.set_total_pages(self.state['workload_id'], len(self.page_layout()))
 
-		# A list of all image objects including ingredients,instructions & poster. For each object dall api will be called
-		image_objects_list = self.state['images_data'].ingredient_images + self.state['images_data'].instruction_images + [self.state['images_data'].cover_page]
+		# With the fleet rate limiter every call waits for its own slot, so all images go out as one batch
+		batch_size = max(1, len(pending_images)) if self.fleet_rate_limited else RL_DALLEE_BATCH_SIZE
 
-		# This loop will make parallel calls using the dalle_api_call function and other constant parameters
-		for i in range(0,len(image_objects_list),RL_DALLEE_BATCH_SIZE):
+		# This loop will make parallel calls using the generate_image method and other constant parameters
+		for i in range(0,len(pending_images),batch_size):
 			
-			# Create a batch of image objects
-			batch = image_objects_list[i:i+RL_DALLEE_BATCH_SIZE]
+			# Create a batch of image names
+			batch = pending_images[i:i+batch_size]
 
-			print(f"Processing batch {i//RL_DALLEE_BATCH_SIZE + 1}")
+			print(f"Processing batch {i//batch_size + 1}")
 			start_time = time.time()
 
-			with ThreadPoolExecutor(max_workers=RL_DALLEE_BATCH_SIZE) as executor:
-				future_to_prompt = {executor.submit(dalle_api_call, imageObj, client): imageObj for imageObj in batch}
-				for future in as_completed(future_to_prompt):
+			# Not a `with` block: on timeout the executor is shut down without waiting for calls that are still running
+			executor = ThreadPoolExecutor(max_workers=RL_DALLEE_BATCH_SIZE)
+			try:
+				future_to_name = {submit_in_context(executor, self.generate_image, name, client, self.fleet_rate_limited): name for name in batch}
+				for future in as_completed(future_to_name, timeout=call_timeout("generate_images batch", cap=None)):
 					future.result()
+			except FutureTimeoutError:
+				raise DeadlineExceeded(f"[Application Exception] Image batch {i//batch_size + 1} did not finish before the workload deadline")
+			finally:
+				executor.shutdown(wait=False, cancel_futures=True)
+
+			# Progressive mode styles and publishes whatever pages this batch completed, inside the rate limit wait below
+			if PROGRESSIVE_PAGES:
+				self.style_generated_images()
+				self.compose_ready_pages()
 
 			# if more image objects are left then this block will handle sleep to avoid hitting the RL_DALEE_WAIT_TIME limit
-			if i + RL_DALLEE_BATCH_SIZE < len(image_objects_list):
+			if i + batch_size < len(pending_images):
 				elapsed = time.time() - start_time
 				sleep_time = max(0, RL_DALEE_WAIT_TIME - elapsed)
 				print(f"Waiting for {sleep_time:.2f} seconds before next batch...")
-				time.sleep(sleep_time)
+				sleep_within_deadline(sleep_time, f"image batch {i//batch_size + 2}")
 				
 		# print_state(self.state)
 
 	# (3) Style the generated images with cropping and adding text
 	@listen(generate_images)
+	@timed_stage("style_images")
 	def style_images(self):
 		workload_status_update(self.state['workload_id'],WORKLOAD_STATUSES['styling_images'])
 		images_data = self.state['images_data']
-		recipe_data = self.state['recipe_data']
+		panels = self.state['panels']
 
 		# Check assertion
-		if not len(images_data.ingredient_images) == len(recipe_data.ingredients):
-			raise AssertionError(f"[Application Exception] Length of Ingredients from image_data and recipe_data is not the same")
-		if not len(images_data.instruction_images) == len(recipe_data.instructions):
-			raise AssertionError(f"[Application Exception] Length of Instructions from image_data and recipe_data is not the same")
+		if not len(images_data.ingredient_images) == len(panels['ingredients']):
+			raise AssertionError(f"[Application Exception] Length of Ingredients from image_data and panels is not the same")
+		if not len(images_data.instruction_images) == len(panels['instructions']):
+			raise AssertionError(f"[Application Exception] Length of Instructions from image_data and panels is not the same")
 		
-		for index in range(0,len(images_data.ingredient_images)):
-			style_ing_image(images_data.ingredient_images[index],recipe_data.ingredients[index])
-		for index in range(0,len(images_data.instruction_images)):
-			style_ins_image(images_data.instruction_images[index],recipe_data.instructions[index],index+1)
+		self.style_generated_images()
 
 		print('\n\nState updated- ',self.state['images_data'])
 
 	# (4) Merge the styled images and generate book pages.
 	@listen(style_images)
+	@timed_stage("merge_images")
 	def merge_images(self):
 		workload_status_update(self.state['workload_id'],WORKLOAD_STATUSES['merging_comic_pages'])
 		images_data = self.state['images_data']
-		pages = []
-
-		# # (4a) First page: Poster image with its header
-		# poster_img_obj = images_data.cover_page.styled_image
-
-		response = requests.get(images_data.cover_page.url, stream=True)
-		raw_img = Image.open(BytesIO(response.content))
-
-		# Create a copy to draw on
-		poster_with_overlay = raw_img.copy()
-		draw = ImageDraw.Draw(poster_with_overlay)
-
-		# Overlay rectangle settings
-		OVERLAY_WIDTH = int(FINAL_PAGE_WIDTH * 0.7)
-		OVERLAY_HEIGHT = 240
-		OVERLAY_MARGIN_BOTTOM = 300
-		OVERLAY_COLOR = (135, 206, 250)
-		OVERLAY_TEXT = self.state['recipe_data'].name
-		BORDER_THICKNESS = 4
-		BORDER_COLOR = (0, 0, 0)
-
-		# Calculate position
-		rect_x0 = (FINAL_PAGE_WIDTH - OVERLAY_WIDTH) // 2
-		rect_y1 = FINAL_PAGE_HEIGHT - OVERLAY_MARGIN_BOTTOM
-		rect_y0 = rect_y1 - OVERLAY_HEIGHT
-		rect_x1 = rect_x0 + OVERLAY_WIDTH
-
-		# Draw overlay background
-		draw.rectangle([rect_x0, rect_y0, rect_x1, rect_y1], fill=OVERLAY_COLOR)
-
-		# Draw solid black border (4 sides manually to match "solid border")
-		for i in range(BORDER_THICKNESS):
-			draw.rectangle(
-				[rect_x0 - i, rect_y0 - i, rect_x1 + i, rect_y1 + i],
-				outline=BORDER_COLOR
-			)
-
-		# Load and draw text
-		pattaya_font_path = "/app/fonts/Pattaya.ttf"
-		if not os.path.exists(pattaya_font_path):
-			raise FileNotFoundError(f"Font file not found at {pattaya_font_path}.")
-		pattaya_font = Path(pattaya_font_path)
-		try:
-			font = ImageFont.truetype(str(pattaya_font), 68)
-		except:
-			font = ImageFont.load_default()
-
-		# First line: main title
-		bbox1 = font.getbbox(OVERLAY_TEXT)
-		text1_w, text1_h = bbox1[2] - bbox1[0], bbox1[3] - bbox1[1]
-		text1_x = rect_x0 + (OVERLAY_WIDTH - text1_w) // 2
-		text1_y = rect_y0 + 20  # Top margin from inside the rectangle
-
-		draw.text((text1_x, text1_y), OVERLAY_TEXT, fill=(0, 0, 0), font=font)
-
-		subtitle_font = ImageFont.truetype(str(pattaya_font), 48)
-		bbox2 = subtitle_font.getbbox("(Recipe Book)")
-		text2_w, text2_h = bbox2[2] - bbox2[0], bbox2[3] - bbox2[1]
-		text2_x = rect_x0 + (OVERLAY_WIDTH - text2_w) // 2
-		text2_y = text1_y + text1_h + 10
-
-		draw.text((text2_x, text2_y), "(Recipe Book)", fill=(0, 0, 0), font=subtitle_font)
-
-		# (4a) First page completed
-		pages.append(poster_with_overlay)
-
-		# (4b) Ingredients pages (3x4 grid = 12 per page)
-		ing_image_objects = images_data.ingredient_images
-		ING_ROWS = 4
-		ING_COLS = 3
-		ING_PER_PAGE = ING_ROWS * ING_COLS
-
-		# All styled ingredient images are the same size, use any random one to get the dimensions
-		sample_image = ing_image_objects[0].styled_image
-		ing_width, ing_height = sample_image.width, sample_image.height
-
-		# Calculate how much empty space will be left and divide it evenly (space-evenly logic)
-		total_img_width = ING_COLS * ing_width
-		total_img_height = ING_ROWS * ing_height
-		total_h_space = FINAL_PAGE_WIDTH - total_img_width
-		h_gap = total_h_space / (ING_COLS + 1)
-		total_v_space = (FINAL_PAGE_HEIGHT - PS_TITLE_HEIGHT) - total_img_height
-		v_gap = total_v_space / (ING_ROWS + 1)
-
-		for page_start in range(0, len(ing_image_objects), ING_PER_PAGE):
-			# Get the current set of 1 to 12 images
-			page_images = ing_image_objects[page_start:page_start + ING_PER_PAGE]
-
-			# Create a new blank white page
-			page = Image.new("RGB", (FINAL_PAGE_WIDTH, FINAL_PAGE_HEIGHT), color="white")
-			draw = ImageDraw.Draw(page)
-			draw_page_title(draw, "Ingredients")
-
-			for idx, img_obj in enumerate(page_images):
-				row = idx // ING_COLS
-				col = idx % ING_COLS
 
-				x = int(h_gap + col * (ing_width + h_gap))
-				y = int(PS_TITLE_HEIGHT + v_gap + row * (ing_height + v_gap))
+		# Progressive mode has composed most pages already, this composes the rest
+		self.compose_ready_pages()
+		layout = self.page_layout()
+		if not len(self.state['pages']) == len(layout):
+			raise AssertionError(f"[Application Exception] Only {len(self.state['pages'])} of {len(layout)} pages could be composed")
+		pages = [self.state['pages'][page_number] for page_number, _ in layout]
 
-				page.paste(img_obj.styled_image, (x, y))
-
-			pages.append(page)
-
-		# (4c) Instruction pages (3 per page)
-		ins_image_objects = images_data.instruction_images
-		INS_PER_PAGE = 3 
-
-		for i in range(0, len(ins_image_objects), INS_PER_PAGE):
-			page_imgs = ins_image_objects[i:i+INS_PER_PAGE]
-
-			# Create blank page
-			page = Image.new("RGB", (FINAL_PAGE_WIDTH, FINAL_PAGE_HEIGHT), color=(255, 255, 255))
-			draw = ImageDraw.Draw(page)
-			draw_page_title(draw, "Instructions")
-
-			# Calculate layout
-			available_height = FINAL_PAGE_HEIGHT - PS_TITLE_HEIGHT
-			total_imgs_height = sum(img.styled_image.height for img in page_imgs)
-			num_gaps = len(page_imgs) + 1  # space above, between, and below
-			gap_height = (available_height - total_imgs_height) // num_gaps
-
-			# Start placing images
-			current_y = PS_TITLE_HEIGHT + gap_height
-			for obj in page_imgs:
-				img = obj.styled_image
-				x = (FINAL_PAGE_WIDTH - img.width) // 2  # center horizontally
-				page.paste(img, (x, current_y))
-				current_y += img.height + gap_height
-
-			pages.append(page)
+		# Every image has been downloaded at this point
+		self.state['generation_report'] = generation_savings_report(images_data.ingredient_images + images_data.instruction_images + [images_data.cover_page])
+		self.state['generation_report']['degradations'] = self.state['degradations']
+		self.state['generation_report']['images'] = image_count(self.state['panels'])
+		print(f"[Comicgen Worker] Generation sizes for tier {self.state['quality_tier']}: {self.state['generation_report']}")
 
 		# for page in pages:
 		# 	page.show()
 
+		print(f"[Comicgen Worker] Composed {len(pages)} pages, image store {self.image_store.stats()}")
 		return pages
+
+	# Generates one image (named as in image_names). Fresh art of a single ingredient is offered to later workloads
+	def generate_image(self, name, client, fleet_rate_limited=False):
+		img_obj = self.image_object(name)
+		dalle_api_call(img_obj, client, self.state['quality_tier'], fleet_rate_limited=fleet_rate_limited)
+		if img_obj.type == "ING":
+			panel = self.state['panels']['ingredients'][int(name.split("-")[1])]
+			if len(panel) == 1:
+				remember_ingredient_art(self.state['recipe_data'].ingredients[panel[0]].name, img_obj)
+
+	# Pages of the comic as (page number, image objects on the page). Page 0 is the cover, then the ingredient
+	# pages (3x4 grid = 12 per page), then the instruction pages (up to 3 per page, fewer when multi-step panels
+	# with their taller labels would not fit)
+	def page_layout(self):
+		images_data = self.state['images_data']
+		layout = [(0, [images_data.cover_page])]
+		ing_image_objects = images_data.ingredient_images
+		for page_start in range(0, len(ing_image_objects), ING_PER_PAGE):
+			layout.append((len(layout), ing_image_objects[page_start:page_start + ING_PER_PAGE]))
+
+		available_height = FINAL_PAGE_HEIGHT - PS_TITLE_HEIGHT
+		page_images, page_height = [], 0
+		for img_obj, panel in zip(images_data.instruction_images, self.state['panels']['instructions']):
+			panel_height = ins_panel_height(len(panel))
+			if page_images and (len(page_images) == INS_PER_PAGE or page_height + panel_height > available_height):
+				layout.append((len(layout), page_images))
+				page_images, page_height = [], 0
+			page_images.append(img_obj)
+			page_height += panel_height
+		if page_images:
+			layout.append((len(layout), page_images))
+		return layout
+
+	# Styles every generated image that has not been styled yet
+	def style_generated_images(self):
+		images_data = self.state['images_data']
+		for index in range(0,len(images_data.ingredient_images)):
+			img_obj = images_data.ingredient_images[index]
+			if img_obj.url and not img_obj.styled_image:
+				img_obj.styled_image = self.image_store.put(f"ing-{index}", self.style_image(f"ing-{index}"))
+		for index in range(0,len(images_data.instruction_images)):
+			img_obj = images_data.instruction_images[index]
+			if img_obj.url and not img_obj.styled_image:
+				img_obj.styled_image = self.image_store.put(f"ins-{index}", self.style_image(f"ins-{index}"))
+
+	# Styles one ingredient or instruction image (named as in image_names) with the label of its panel
+	def style_image(self, name):
+		img_obj = self.image_object(name)
+		kind, index = name.split("-")
+		if kind == "ing":
+			return style_ing_image(img_obj, self.panel_ingredient(int(index)))
+		steps = self.panel_steps(int(index))
+		first_step_num = self.state['panels']['instructions'][int(index)][0] + 1
+		if len(steps) == 1:
+			return style_ins_image(img_obj, steps[0], first_step_num)
+		return style_multi_step_image(img_obj, steps, first_step_num)
+
+	# Composes every page whose images are all ready and that is not composed yet. Each page is encoded (see
+	# shared/page_encoding.py) on a thread pool while the next one is composed, then stored for the upload and, in
+	# progressive mode, published to the page store right away. At most PAGE_ENCODE_WORKERS composed pages wait for
+	# their encoding at once, and each is saved as soon as it is encoded, so the raw pages never pile up in memory
+	def compose_ready_pages(self):
+		with ThreadPoolExecutor(max_workers=PAGE_ENCODE_WORKERS) as executor:
+			encoding = {}
+			def save_encoded(return_when):
+				done, _ = wait(encoding, return_when=return_when)
+				for future in done:
+					self.save_encoded_page(encoding.pop(future), future.result())
+
+			for page_number, page_images in self.page_layout():
+				if page_number in self.state['pages']:
+					continue
+
+				if page_number == 0:
+					# First page: Poster image with its header
+					if not page_images[0].url:
+						continue
+					with download_image(page_images[0]) as raw_img:
+						page = compose_cover_page(raw_img, self.state['recipe_data'].name)
+				else:
+					if not all(img_obj.styled_image for img_obj in page_images):
+						continue
+					styled_images = [self.image_store.open(img_obj.styled_image) for img_obj in page_images]
+					if page_images[0].type == "ING":
+						page = compose_ingredient_page(styled_images)
+					else:
+						page = compose_instruction_page(styled_images)
+					# Styled images are baked into the page now
+					for img_obj in page_images:
+						self.image_store.release(img_obj.styled_image)
+
+				if len(encoding) >= PAGE_ENCODE_WORKERS:
+					save_encoded(FIRST_COMPLETED)
+				# Derivatives are only needed by the page store, and for the cover
+				encoding[executor.submit(encode_page, page, PROGRESSIVE_PAGES or page_number == 0)] = page_number
+				# The encoding job holds the only reference now, so the page is freed once it is encoded
+				del page
+
+			save_encoded(ALL_COMPLETED)
+
+	def save_encoded_page(self, page_number, encoded):
+		self.state['pages'][page_number] = self.image_store.put_bytes(f"page-{page_number}", encoded["full"], format="JPEG")
+		if page_number == 0:
+			self.state['cover_previews'] = {
+				variant: self.image_store.put_bytes(f"page-0-{variant}", data, format=PAGE_DERIVATIVE_FORMAT)
+				for variant, data in encoded.items() if variant != "full"
+			}
+		self.publish_page(page_number, encoded)
+
+	def publish_page(self, page_number, encoded):
+		if not PROGRESSIVE_PAGES:
+			return
+		with external_call("page_store_publish"):
+			page_store.put_page(self.state['workload_id'], page_number, encoded)
+		print(f"[Comicgen Worker] Published page {page_number} for- {self.state['workload_id']}")
+
+	# Stores the cover's derivatives as the comic's preview, served by the orchestrator. Returns the preview URL, or
+	# None when PUBLIC_BASE_URL is not set or the preview could not be stored
+	def publish_preview(self, comic_key, cover_ref):
+		if not PUBLIC_BASE_URL:
+			return None
+		try:
+			previews = {variant: self.image_store.get_bytes(ref) for variant, ref in self.state['cover_previews'].items()}
+			# The fan-in job only has the encoded cover
+			if not previews:
+				previews = encode_derivatives(self.image_store.open(cover_ref))
+			with external_call("page_store_preview"):
+				page_store.put_preview(comic_key, previews)
+		except Exception as e:
+			print(f"[Warning] Failed to store the preview of comic {comic_key}: {e}")
+			return None
+		return f"{PUBLIC_BASE_URL}/comics/{comic_key}/preview"
 	
+
 	# (5) Save the comic book on third party cloud platform
 	@listen(merge_images)
+	@timed_stage("cloud_upload")
 	def cloud_upload(self,pages):
-		comic_url = upload_comic_to_reddit(pages,self.state['recipe_data'].name)
+		# Pages are already JPEG encoded, the upload writes their bytes out one at a time
+		try:
+			comic_url = upload_comic_to_reddit((self.image_store.get_bytes(ref) for ref in pages),self.state['recipe_data'].name)
+			submission_id = comic_url.split('/')[-1]  
+			# A preview served by the orchestrator saves asking Reddit for one
+			preview_image_url = self.publish_preview(submission_id, pages[0])
+		finally:
+			self.image_store.close()
 
-		submission_id = comic_url.split('/')[-1]  
-		preview_image_url = get_reddit_preview_image(submission_id)
+		if preview_image_url is None:
+			preview_image_url = get_reddit_preview_image(submission_id)
 
 		# Adding comic url into DB
 		try:
@@ -354,6 +529,75 @@ class ComicGenFlow(Flow):
 					"status":WORKLOAD_STATUSES['completed_w_new'],
       }).eq("id", self.state['workload_id']).execute()
 			print("Updated DB with comic url ✅")
+			refresh_workload_cache(db_response.data)
 		except (APIError) as e:
 			raise Exception(f"[DB Exception] msg {e}")
 		
+
+	# Fan-out execution (COMICGEN_EXECUTION_MODE=fanout). The planner job runs generate_prompts, every image is
+	# generated and styled by its own sub-job, and the fan-in job runs merge_images and cloud_upload.
+	# Images are named like their ImageStore entries: ing-<n>, ins-<n> and poster
+
+	# Everything a sub-job or the fan-in job needs to rebuild this flow's state
+	def fanout_plan(self):
+		return {
+			"recipe_data": self.state['recipe_data'].model_dump(),
+			"images_data": self.state['images_data'].model_dump(),
+			"quality_tier": self.state['quality_tier'],
+			"degradations": self.state['degradations'],
+			"panels": self.state['panels'],
+		}
+
+	@classmethod
+	def from_fanout_plan(cls, workload_id, plan):
+		flow = cls(recipe_data=plan['recipe_data'], workload_id=workload_id)
+		flow.state['images_data'] = ImagesData(**plan['images_data'])
+		flow.state['quality_tier'] = plan['quality_tier']
+		flow.state['degradations'] = plan.get('degradations', [])
+		# Degradations may have merged more instructions than the planner, so the panels come from the plan too
+		flow.state['panels'] = plan.get('panels', flow.state['panels'])
+		return flow
+
+	# Same order as generate_images, the poster first so the cover page is published first
+	def image_names(self):
+		images_data = self.state['images_data']
+		return (["poster"]
+			+ [f"ing-{index}" for index in range(len(images_data.ingredient_images))]
+			+ [f"ins-{index}" for index in range(len(images_data.instruction_images))])
+
+	def image_object(self, name):
+		images_data = self.state['images_data']
+		if name == "poster":
+			return images_data.cover_page
+		kind, index = name.split("-")
+		return (images_data.ingredient_images if kind == "ing" else images_data.instruction_images)[int(index)]
+
+	# Unit of work of an image sub-job. Returns the ImageStore reference of the styled image (the composed cover page for the poster)
+	@timed_stage("generate_style_image")
+	def generate_and_style_image(self, name):
+		img_obj = self.image_object(name)
+		recipe_data = self.state['recipe_data']
+		# Reused ingredient art is already generated
+		if not img_obj.url:
+			self.generate_image(name, get_openai_client(), fleet_rate_limited=True)
+
+		if name == "poster":
+			with download_image(img_obj) as raw_img:
+				cover_page = compose_cover_page(raw_img, recipe_data.name)
+			self.save_encoded_page(0, encode_page(cover_page, PROGRESSIVE_PAGES))
+			return self.state['pages'][0]
+
+		return self.image_store.put(name, self.style_image(name))
+
+	# Loads every sub-job's result into the image objects and the image store, so merge_images can run as in single mode
+	def restore_fanout_results(self, image_meta, read_image_bytes):
+		for name in self.image_names():
+			if name not in image_meta:
+				raise KeyError(f"[Application Exception] Fan-out result missing for image {name}")
+			img_obj = self.image_object(name)
+			for field, value in image_meta[name].items():
+				setattr(img_obj, field, value)
+			if name == "poster":
+				self.state['pages'][0] = self.image_store.put_bytes("page-0", read_image_bytes(name), format="JPEG")
+			else:
+				img_obj.styled_image = self.image_store.put_bytes(name, read_image_bytes(name))
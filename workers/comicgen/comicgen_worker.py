@@ -1,13 +1,209 @@
+from rq import Retry, Callback
+from rq.timeouts import JobTimeoutException
+from rq.job import Job,JobStatus
+from rq.exceptions import NoSuchJobError
 from ComicGenFlow import ComicGenFlow
+from shared.metrics import job_span
+from shared.profiling import job_profile
+from shared.deadline import deadline_context,job_timeout_for,check_deadline,DeadlineExceeded
+from shared.workload_options import get_workload_options
+from shared.helpers import workload_status_update,workload_failed
+from shared.redis_client import comicgen_queue,comicgen_images_queue
+from shared.page_store import page_store
+from shared.constants import COMICGEN_EXECUTION_MODE,FANOUT_IMAGE_QUEUE,FANOUT_IMAGE_RETRIES,FANOUT_RETRY_INTERVALS,WORKLOAD_STATUSES,PROGRESSIVE_PAGES,SPECULATIVE_QUEUE
+from shared.speculation import check_speculation,SpeculationStopped,save_speculative_prompts
+from shared.metrics import SPECULATIONS
+from shared.fanout_state import save_fanout_plan,get_fanout_plan,save_image_result,has_image_result,get_image_meta,get_image_bytes,clear_fanout_state
+
+# Fields an image sub-job hands over to the fan-in job, besides the styled image bytes
+IMAGE_RESULT_FIELDS = ("url", "generation_model", "generation_size", "download_bytes", "download_seconds")
 
 def comicgen_task(workload_id, recipe_name,ingredients,instructions):
+  if COMICGEN_EXECUTION_MODE == "fanout":
+    return comicgen_plan_task(workload_id, recipe_name, ingredients, instructions)
+
   print(f"[Comicgen Worker] Starting ComicGenFlow for workload- {workload_id}")
 
   try:
-    comic_gen_flow = ComicGenFlow(recipe_data={'name':recipe_name,'ingredients':ingredients,'instructions':instructions},workload_id=workload_id)
-    comic_gen_flow.kickoff()
+    with job_span("comicgen", workload_id), deadline_context(workload_id), job_profile("comicgen", workload_id):
+      comic_gen_flow = ComicGenFlow(recipe_data={'name':recipe_name,'ingredients':ingredients,'instructions':instructions},workload_id=workload_id)
+      try:
+        comic_gen_flow.kickoff()
+      finally:
+        # Drops any spilled images if the flow failed before cloud_upload. Pages already published in
+        # progressive mode stay in the page store
+        comic_gen_flow.image_store.close()
 
+  except (DeadlineExceeded, JobTimeoutException) as e:
+    workload_status_update(workload_id, WORKLOAD_STATUSES['failed_timeout'])
+    raise Exception(f"\n[Comicgen Worker] ComicGenFlow ran out of time: {e}")
   except Exception as e:
+    workload_failed(workload_id)
     raise Exception(f"\n[Comicgen Worker] An error occurred while running ComicGenFlow: {e}")
 
-  print(f"[Comicgen Worker] Finished ComicGenFlow for- {workload_id} ✅")
\ No newline at end of file
+  print(f"[Comicgen Worker] Finished ComicGenFlow for- {workload_id} ✅")
+
+def _fanout_job_id(workload_id, name):
+  return f"comicgen-{workload_id}-{name}"
+
+# Fan-out planner: writes the prompts, then enqueues one generate+style sub-job per image and a fan-in job
+# that RQ only starts once every sub-job has finished
+def comicgen_plan_task(workload_id, recipe_name,ingredients,instructions):
+  print(f"[Comicgen Worker] Planning fan-out ComicGenFlow for workload- {workload_id}")
+
+  try:
+    with job_span("comicgen", workload_id), deadline_context(workload_id), job_profile("comicgen", workload_id):
+      comic_gen_flow = ComicGenFlow(recipe_data={'name':recipe_name,'ingredients':ingredients,'instructions':instructions},workload_id=workload_id)
+      comic_gen_flow.generate_prompts()
+      job_timeout = job_timeout_for(get_workload_options(workload_id).get("deadline_at"))
+      save_fanout_plan(workload_id, comic_gen_flow.fanout_plan())
+      if PROGRESSIVE_PAGES:
+        page_store.set_total_pages(workload_id, len(comic_gen_flow.page_layout()))
+      workload_status_update(workload_id, WORKLOAD_STATUSES['generating_images'])
+
+      image_jobs = [
+        comicgen_images_queue.enqueue(
+          "comicgen_worker.comicgen_image_task",
+          workload_id,
+          name,
+          job_id=_fanout_job_id(workload_id, name),
+          retry=Retry(max=FANOUT_IMAGE_RETRIES, interval=FANOUT_RETRY_INTERVALS),
+          on_failure=Callback(comicgen_image_failed),
+          job_timeout=job_timeout,
+        )
+        for name in comic_gen_flow.image_names()
+      ]
+      comicgen_queue.enqueue(
+        "comicgen_worker.comicgen_fan_in_task",
+        workload_id,
+        job_id=_fanout_job_id(workload_id, "fan-in"),
+        depends_on=image_jobs,
+        job_timeout=job_timeout,
+      )
+
+  except (DeadlineExceeded, JobTimeoutException) as e:
+    workload_status_update(workload_id, WORKLOAD_STATUSES['failed_timeout'])
+    raise Exception(f"\n[Comicgen Worker] ComicGenFlow ran out of time while planning: {e}")
+  except Exception as e:
+    workload_failed(workload_id)
+    raise Exception(f"\n[Comicgen Worker] An error occurred while planning ComicGenFlow: {e}")
+
+  print(f"[Comicgen Worker] Enqueued {len(image_jobs)} image jobs for- {workload_id} ✅")
+
+# Fan-out sub-job: generates and styles a single image and hands the result to the fan-in job through Redis
+def comicgen_image_task(workload_id, name):
+  try:
+    with job_span(FANOUT_IMAGE_QUEUE, workload_id), deadline_context(workload_id), job_profile(FANOUT_IMAGE_QUEUE, workload_id):
+      check_deadline(f"image {name}")
+      # A re-delivered job must not pay for the image twice
+      if has_image_result(workload_id, name):
+        print(f"[Comicgen Worker] Image {name} of {workload_id} is already done, skipping")
+        return
+
+      try:
+        plan = get_fanout_plan(workload_id)
+      except KeyError:
+        # The comic was cancelled (cancel_fanout) while this job was queued or retrying
+        print(f"[Comicgen Worker] The comic of {workload_id} was cancelled, skipping image {name}")
+        return
+      comic_gen_flow = ComicGenFlow.from_fanout_plan(workload_id, plan)
+      try:
+        ref = comic_gen_flow.generate_and_style_image(name)
+        img_obj = comic_gen_flow.image_object(name)
+        meta = {field: getattr(img_obj, field) for field in IMAGE_RESULT_FIELDS}
+        save_image_result(workload_id, name, comic_gen_flow.image_store.get_bytes(ref), meta)
+      finally:
+        comic_gen_flow.image_store.close()
+
+  except (DeadlineExceeded, JobTimeoutException) as e:
+    # Retrying cannot help, so the job ends here and takes the rest of the comic down with it. Sibling jobs
+    # still queued hit the passed deadline as soon as they start
+    print(f"[Comicgen Worker] Image {name} of {workload_id} ran out of time: {e}")
+    cancel_fanout(workload_id, WORKLOAD_STATUSES['failed_timeout'])
+    return
+  except Exception as e:
+    raise Exception(f"\n[Comicgen Worker] An error occurred while generating image {name}: {e}")
+
+  print(f"[Comicgen Worker] Finished image {name} for- {workload_id} ✅")
+
+# RQ failure callback of the image sub-jobs. Runs after every failed attempt, only the last one gives up on the
+# workload: the fan-in job would otherwise wait on its dependencies forever
+def comicgen_image_failed(job, connection, exc_type, exc_value, exc_traceback):
+  if job.retries_left:
+    print(f"[Comicgen Worker] Image job {job.id} failed, {job.retries_left} retries left")
+    return
+
+  workload_id = job.args[0]
+  print(f"[Comicgen Worker] Image job {job.id} failed for good, cancelling the comic for- {workload_id}")
+  cancel_fanout(workload_id, WORKLOAD_STATUSES['failed_error'])
+
+# Cancels the fan-in job (it would otherwise wait on its dependencies forever) and the sibling image jobs that
+# have not started yet, drops the fan-out state and sets the workload's final status. Image jobs already running
+# find the plan gone at their next attempt and stop there
+def cancel_fanout(workload_id, status):
+  connection = comicgen_queue.connection
+  try:
+    fan_in = Job.fetch(_fanout_job_id(workload_id, "fan-in"), connection=connection)
+  except NoSuchJobError:
+    fan_in = None
+  if fan_in is not None and not fan_in.is_canceled:
+    sibling_ids = fan_in.dependency_ids
+    fan_in.cancel()
+    for sibling in Job.fetch_many(sibling_ids, connection=connection):
+      if sibling is not None and sibling.get_status() in (JobStatus.QUEUED, JobStatus.SCHEDULED, JobStatus.DEFERRED):
+        sibling.cancel()
+  clear_fanout_state(workload_id)
+  workload_status_update(workload_id, status)
+
+# Fan-in: merges the styled images into pages and publishes the comic, same as the tail of single mode
+def comicgen_fan_in_task(workload_id):
+  print(f"[Comicgen Worker] Merging fan-out ComicGenFlow for workload- {workload_id}")
+
+  try:
+    with job_span("comicgen", workload_id), deadline_context(workload_id), job_profile("comicgen", workload_id):
+      comic_gen_flow = ComicGenFlow.from_fanout_plan(workload_id, get_fanout_plan(workload_id))
+      try:
+        comic_gen_flow.restore_fanout_results(get_image_meta(workload_id), lambda name: get_image_bytes(workload_id, name))
+        pages = comic_gen_flow.merge_images()
+        comic_gen_flow.cloud_upload(pages)
+      finally:
+        comic_gen_flow.image_store.close()
+      clear_fanout_state(workload_id)
+
+  except (DeadlineExceeded, JobTimeoutException) as e:
+    clear_fanout_state(workload_id)
+    workload_status_update(workload_id, WORKLOAD_STATUSES['failed_timeout'])
+    raise Exception(f"\n[Comicgen Worker] ComicGenFlow ran out of time while merging: {e}")
+  except Exception as e:
+    clear_fanout_state(workload_id)
+    workload_failed(workload_id)
+    raise Exception(f"\n[Comicgen Worker] An error occurred while merging ComicGenFlow: {e}")
+
+  print(f"[Comicgen Worker] Finished ComicGenFlow for- {workload_id} ✅")
+  # Kept as the job result
+  return comic_gen_flow.state['generation_report']
+
+# Speculative job for a workload waiting in AWAITING_USER_CHOICE (see shared/speculation.py). Only writes the
+# prompts, updates no status and runs without the workload deadline, whose clock is stopped while it waits
+def speculative_prompts_task(workload_id, recipe_name,ingredients,instructions):
+  with job_span(SPECULATIVE_QUEUE, workload_id), job_profile(SPECULATIVE_QUEUE, workload_id):
+    try:
+      check_speculation(workload_id)
+      comic_gen_flow = ComicGenFlow(recipe_data={'name':recipe_name,'ingredients':ingredients,'instructions':instructions},workload_id=workload_id)
+      try:
+        comic_gen_flow.write_prompts(check=lambda: check_speculation(workload_id))
+      finally:
+        comic_gen_flow.image_store.close()
+      saved = save_speculative_prompts(workload_id, comic_gen_flow.fanout_plan())
+
+    except SpeculationStopped as e:
+      SPECULATIONS.labels(e.outcome).inc()
+      print(f"[Comicgen Worker] {e}, stopped preparing prompts for- {workload_id}")
+      return
+    except Exception as e:
+      raise Exception(f"\n[Comicgen Worker] An error occurred while preparing speculative prompts: {e}")
+
+  if not saved:
+    print(f"[Comicgen Worker] The user chose while the prompts were prepared, dropped them for- {workload_id}")
+    return
+  print(f"[Comicgen Worker] Prepared speculative prompts for- {workload_id} ✅")
@@ -0,0 +1,9 @@
+'''Entry point for the comicgen worker container. Serves /metrics and runs warm, preloaded RQ workers on the comicgen queues.
+
+Fan-out image jobs are listed first, so a worker helps finish comics already in progress before planning new ones.
+Speculative jobs come last and only run when there is no confirmed work'''
+from shared.warm_worker import run_warm_worker
+from shared.constants import FANOUT_IMAGE_QUEUE,SPECULATIVE_QUEUE
+
+if __name__ == "__main__":
+  run_warm_worker([FANOUT_IMAGE_QUEUE, "comicgen", SPECULATIVE_QUEUE], ["comicgen_worker"], warm_fonts=True)
@@ -1,25 +1,36 @@
 from crewai.flow.flow import Flow, listen, start
 from crewai import Crew,Task,Agent,Process
 import json
+import time
 from difflib import SequenceMatcher
 import requests
-from shared.helpers import print_state,workload_status_update
+from shared.helpers import print_state,workload_status_update,deadline_llm
+from shared.workload_cache import refresh_workload_cache
 from shared.pydantic_models import RecipeData
 from shared.supabase_client import supabase
-from shared.constants import WORKLOAD_STATUSES,IMG_GEN_LIMIT
+from shared.constants import WORKLOAD_STATUSES,IMAGE_BUDGET,ORCHESTRATOR_URL
+from shared.metrics import timed_stage,external_call
+from shared.workload_options import update_workload_options
+from shared.deadline import call_timeout,call_with_deadline
+from shared.speculation import enqueue_speculation
+from shared.panel_planner import plan_panels,image_count
 
 class PreProcessingFlow(Flow):
-	def __init__(self, task_input,workload_id):
+	# continue_flow=False leaves the recipe with the caller instead of handing it to the orchestrator, for runners
+	# that run ComicGenFlow themselves (batch/run_batch.py)
+	def __init__(self, task_input,workload_id,continue_flow=True):
 		super().__init__()
 		# Save to state
 		self.state['task_input'] = task_input
 		self.state['workload_id'] = workload_id
+		self.continue_flow = continue_flow
 
 		print("PreProcessingFlow constructor sucess ✅")
 		print_state(self.state)
 
 	# (1) Check if the input resembles a recipe
 	@start()
+	@timed_stage("validate_recipe")
 	def validate_recipe(self):
 		workload_status_update(self.state['workload_id'],WORKLOAD_STATUSES['validating_recipe'])
 
@@ -27,6 +38,7 @@ class PreProcessingFlow(Flow):
 			role="Recipe Validator",
 			goal="Decide if the given input text is a valid recipe",
 			backstory="You're a culinary AI with expertise in identifying recipes from natural language text.",
+			llm=deadline_llm(),
 			verbose=True
 		)
 
@@ -44,7 +56,8 @@ class PreProcessingFlow(Flow):
 		)
 
 		crew = Crew(agents=[validator_agent], tasks=[validation_task], process=Process.sequential)
-		result = crew.kickoff()
+		with external_call("llm_validate_recipe"):
+			result = call_with_deadline("llm_validate_recipe", crew.kickoff)
 
 		if result.raw.startswith("ERROR"):
 			workload_status_update(self.state['workload_id'],WORKLOAD_STATUSES['failed_not_recipe'])
@@ -52,6 +65,7 @@ class PreProcessingFlow(Flow):
 		
 	# (2) Extract recipe data 
 	@listen(validate_recipe)
+	@timed_stage("extract_full_recipe")
 	def extract_full_recipe(self):
 		workload_status_update(self.state['workload_id'],WORKLOAD_STATUSES['extracting_recipe'])
 
@@ -66,6 +80,7 @@ class PreProcessingFlow(Flow):
 					You specialize in converting messy or informal recipe text into a clean JSON structure.
 					If the recipe name is not clearly mentioned, infer a short descriptive title from the ingredients and instructions.
 			""",
+			llm=deadline_llm(),
 			verbose=True
 		)
 
@@ -95,33 +110,43 @@ class PreProcessingFlow(Flow):
 
 		# Run the task via Crew
 		crew = Crew(agents=[recipe_extraction_agent], tasks=[recipe_extraction_task], process=Process.sequential)
-		result = crew.kickoff()
+		with external_call("llm_extract_recipe"):
+			result = call_with_deadline("llm_extract_recipe", crew.kickoff)
 		parsed_result = json.loads(result.raw)
 
-		# validation image gen limit
-		if (len(parsed_result["ingredients"]) + len(parsed_result["instructions"]) + 1) > IMG_GEN_LIMIT:
+		recipe_data = RecipeData(**parsed_result)
+
+		# validation image gen limit. Recipes over the image budget share panels (see shared/panel_planner.py), only
+		# those that still do not fit are rejected
+		panels = plan_panels(recipe_data)
+		if panels is None:
 			workload_status_update(self.state['workload_id'],WORKLOAD_STATUSES['failed_overlimit'])
-			raise Exception(f"[Preprocess Worker] The input exceeds image generation limit. Current limit is {IMG_GEN_LIMIT}")
+			raise Exception(f"[Preprocess Worker] The input exceeds image generation limit. Current limit is {IMAGE_BUDGET} images, even with shared panels")
+		if image_count(panels) < len(recipe_data.ingredients) + len(recipe_data.instructions) + 1:
+			print(f"[Preprocess Worker] Large recipe planned into {image_count(panels)} images")
 		
-		self.state['recipe_data'] = RecipeData(**parsed_result)
+		self.state['recipe_data'] = recipe_data
 		print_state(self.state)
 	
 	# (3) Search for existing similar comics 
 	@listen(extract_full_recipe)
+	@timed_stage("search_existing_comics")
 	def search_existing_comics(self):
 		workload_status_update(self.state['workload_id'],WORKLOAD_STATUSES['searching_comics'])
 
 		recipe_data = self.state['recipe_data']
-		previous_workloads = (
-			supabase.table("workloads") 
-			.select("*") 
-			.eq("status", "COMPLETED_W_NEW") 
-			.order("created_at", desc=True) 
-			.limit(100) 
-			.execute() 
-			.data
-    )
+		with external_call("supabase_previous_workloads"):
+			previous_workloads = (
+				supabase.table("workloads") 
+				.select("*") 
+				.eq("status", "COMPLETED_W_NEW") 
+				.order("created_at", desc=True) 
+				.limit(100) 
+				.execute() 
+				.data
+			)
 		similar = []
+		scores = []
 
 		for workload in previous_workloads:
 			current_name = recipe_data.name.lower()
@@ -143,27 +168,46 @@ class PreProcessingFlow(Flow):
 
 			if score > 0.80:  
 				similar.append(workload["comic_id"])
+				scores.append(score)
 
+		# Every match with its score, best first, for callers that pick a comic themselves (batch/run_batch.py)
+		self.state['similar_comics'] = sorted(
+			({"comic_id": comic_id, "score": score} for comic_id, score in zip(similar, scores)),
+			key=lambda match: match["score"], reverse=True,
+		)
 		if len(similar) != 0:
 			# Update the DB record for the current workload
-			supabase.table("workloads").update({
+			db_response = supabase.table("workloads").update({
 				"recipe_name": recipe_data.name,
 				"ingredients": [{"name": ing.name,"quantity":ing.quantity} for ing in recipe_data.ingredients],
 				"instructions": recipe_data.instructions,
 				"similar_comics": similar[-3:],
 				"status": WORKLOAD_STATUSES['awaiting_user_choice']
 			}).eq("id", self.state["workload_id"]).execute()
+			refresh_workload_cache(db_response.data)
+			# The deadline clock stops while the user chooses, the orchestrator moves it on by the time spent waiting
+			update_workload_options(self.state["workload_id"], awaiting_since=time.time())
 			print("[Preprocess Worker] Updated DB with similar comics ✅")
+			# Prompts can be written while the user chooses, they are only used if the choice is NEW
+			if self.continue_flow:
+				enqueue_speculation(self.state["workload_id"], {
+					"name": recipe_data.name,
+					"ingredients": [{"name": ing.name, "quantity": ing.quantity} for ing in recipe_data.ingredients],
+					"instructions": recipe_data.instructions
+				})
 		else: 
 			# Update DB with recipe details
-			supabase.table("workloads").update({
+			db_response = supabase.table("workloads").update({
 				"recipe_name": recipe_data.name,
 				"ingredients": [{"name": ing.name,"quantity":ing.quantity} for ing in recipe_data.ingredients],
 				"instructions": recipe_data.instructions
 			}).eq("id", self.state["workload_id"]).execute()
+			refresh_workload_cache(db_response.data)
 			print("[Preprocess Worker] Updated DB with current recipe data ✅")
+			if not self.continue_flow:
+				return
 
-			orchestrator_url = f"http://flask_orchestrator:5000/workloads/{self.state['workload_id']}/continue-flow"
+			orchestrator_url = f"{ORCHESTRATOR_URL}/workloads/{self.state['workload_id']}/continue-flow"
 			# Prepare payload
 			payload = {
 				"recipe_data": {
@@ -173,8 +217,10 @@ class PreProcessingFlow(Flow):
 				}
 			}
 
+			timeout = call_timeout("orchestrator_continue_flow", 10)
 			try:
-				response = requests.put(orchestrator_url, json=payload, timeout=10)
+				with external_call("orchestrator_continue_flow"):
+					response = requests.put(orchestrator_url, json=payload, timeout=timeout)
 				response.raise_for_status()
 				print("[Preprocess Worker] Sent a PUT:continue-flow request to orchestrator ✅")
 			except Exception as e:
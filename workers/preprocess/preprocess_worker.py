@@ -1,13 +1,24 @@
+from rq.timeouts import JobTimeoutException
 from PreProcessingFlow import PreProcessingFlow
+from shared.metrics import job_span
+from shared.deadline import deadline_context,DeadlineExceeded
+from shared.profiling import job_profile
+from shared.helpers import workload_status_update,workload_failed
+from shared.constants import WORKLOAD_STATUSES
 
 def preprocess_task(workload_id, input_text):
   print(f"[Preprocess Worker] Starting PreprocessingFlow for workload- {workload_id}")
 
   try:
-    pre_process_flow = PreProcessingFlow(task_input=input_text,workload_id=workload_id)
-    pre_process_flow.kickoff()
+    with job_span("preprocess", workload_id), deadline_context(workload_id), job_profile("preprocess", workload_id):
+      pre_process_flow = PreProcessingFlow(task_input=input_text,workload_id=workload_id)
+      pre_process_flow.kickoff()
 
+  except (DeadlineExceeded, JobTimeoutException) as e:
+    workload_status_update(workload_id, WORKLOAD_STATUSES['failed_timeout'])
+    raise Exception(f"\n[Preprocess Worker] PreprocessingFlow ran out of time: {e}")
   except Exception as e:
+    workload_failed(workload_id)
     raise Exception(f"\n[Preprocess Worker] An error occurred while running PreProcessingFlow: {e}")
 
-  print(f"[Preprocess Worker] Finished PreprocessingFlow for- {workload_id} ✅")
\ No newline at end of file
+  print(f"[Preprocess Worker] Finished PreprocessingFlow for- {workload_id} ✅")
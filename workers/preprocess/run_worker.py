@@ -0,0 +1,5 @@
+'''Entry point for the preprocess worker container. Serves /metrics and runs warm, preloaded RQ workers on the preprocess queue'''
+from shared.warm_worker import run_warm_worker
+
+if __name__ == "__main__":
+  run_warm_worker(["preprocess"], ["preprocess_worker"])